@@ -1,20 +1,90 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 from dotenv import load_dotenv
+from functools import wraps
+import inspect
 import os
+import time
 
 load_dotenv()
 
+
+class AsyncFlask(Flask):
+    """
+    Flask app that runs `async def` views on the shared event loop
+    (app.services.async_runtime) instead of a throwaway loop per request,
+    so pooled async LLM/DB clients are reused and in-flight calls are multiplexed.
+
+    The request thread still blocks until its view finishes, so under
+    gunicorn's gthread worker concurrency per process is capped at
+    GUNICORN_THREADS (see the Procfile and USER_SETUP_GUIDE.md).
+    """
+
+    def ensure_sync(self, func):
+        if inspect.iscoroutinefunction(func):
+            from app.services.async_runtime import run_sync
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                return run_sync(func(*args, **kwargs))
+            return wrapper
+        return func
+
+
 def create_app():
-    app = Flask(__name__)
+    app = AsyncFlask(__name__)
     CORS(app)
     
     # Import and register blueprints
     from app.routes.generate import generate_bp
     from app.routes.improve import improve_bp
+    from app.routes.stats import stats_bp
+    from app.routes.conversations import conversations_bp
     
     app.register_blueprint(generate_bp)
     app.register_blueprint(improve_bp)
+    app.register_blueprint(stats_bp)
+    app.register_blueprint(conversations_bp)
+    
+    # Resume draining /improve-ai jobs accepted before a restart
+    from app.services.improvement_queue import get_improvement_queue, improvement_queue_path
+    if os.path.exists(improvement_queue_path()):
+        get_improvement_queue()
+    
+    from app.services.metrics import REGISTRY, HTTP_REQUEST_SECONDS
+    from app.services.tracing import TRACE_HEADER, get_slow_request_log
+    from app.services.usage import reset_usage_tags, set_usage_tags
+    
+    @app.before_request
+    def start_request():
+        g.request_started = time.perf_counter()
+        # Route templates, not raw paths, so label cardinality stays bounded
+        g.route = request.url_rule.rule if request.url_rule else "unmatched"
+        # Root span for this request; a caller-supplied X-Trace-Id is kept so logs can be joined
+        g.trace = get_slow_request_log().start(f"{request.method} {g.route}", request.headers.get(TRACE_HEADER))
+        # LLM tokens and cost spent while serving this request are billed to its endpoint
+        g.usage_tags = set_usage_tags(endpoint=g.route.strip("/") or "root")
+    
+    @app.after_request
+    def observe_request(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route=g.route,
+                                         method=request.method, status=response.status_code)
+        trace = g.get("trace")
+        if trace:
+            response.headers[TRACE_HEADER] = trace[0].trace_id
+            g.trace_status = response.status_code
+        return response
+    
+    @app.teardown_request
+    def finish_request(error=None):
+        usage_token = g.pop("usage_tags", None)
+        if usage_token is not None:
+            reset_usage_tags(usage_token)
+        trace = g.pop("trace", None)
+        if trace:
+            get_slow_request_log().finish(*trace, status=g.pop("trace_status", 500))
     
     @app.route('/')
     def hello():
@@ -23,8 +93,18 @@ def create_app():
             "version": "1.0.0",
             "endpoints": [
                 "POST /generate-reply",
+                "POST /generate-reply/stream",
+                "POST /generate-replies",
                 "POST /improve-ai",
-                "POST /improve-ai-manually"
+                "GET /improve-ai/jobs/<jobId>",
+                "POST /improve-ai-manually",
+                "GET /prompt-versions",
+                "GET /stats",
+                "GET /circuit-breakers",
+                "GET /metrics",
+                "GET /usage",
+                "GET /conversations/<conversationId>",
+                "DELETE /conversations/<conversationId>"
             ]
         })
     
@@ -32,6 +112,11 @@ def create_app():
     def health():
         return jsonify({"status": "healthy"})
     
+    @app.route('/metrics')
+    def metrics():
+        """Per-stage latency histograms and counters in Prometheus text format (per worker process)."""
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+    
     return app
 
 app = create_app()
@@ -1,2 +1,11 @@
 # Prompts package
-from app.prompts.base_prompts import CHATBOT_PROMPT, EDITOR_PROMPT, MANUAL_EDITOR_PROMPT
+from app.prompts.base_prompts import (
+    CHATBOT_PROMPT,
+    EDITOR_PROMPT,
+    MANUAL_EDITOR_PROMPT,
+    BATCH_EDITOR_PROMPT,
+    BATCH_EXAMPLE_TEMPLATE,
+    RETRIEVED_EXAMPLES_TEMPLATE,
+    RETRIEVED_EXAMPLE_TEMPLATE,
+    SUMMARY_PROMPT
+)
@@ -241,3 +241,82 @@ Return ONLY a JSON object in this exact format (no markdown, no code blocks):
 {{"prompt": "the complete updated prompt text here"}}
 
 The prompt value should be the full updated prompt with the user's changes applied. Escape any quotes inside the prompt with backslash."""
+
+
+BATCH_EDITOR_PROMPT = """You are an expert prompt engineer analyzing an AI chatbot's performance for a visa consulting service.
+
+Your task is to improve the chatbot prompt based on SEVERAL examples, each comparing the chatbot's predicted response with what a real human consultant actually said.
+
+CURRENT CHATBOT PROMPT:
+---
+{current_prompt}
+---
+
+EXAMPLES ({example_count} total):
+{examples}
+
+---
+
+ANALYSIS TASK:
+1. For each example, compare the real consultant's reply with the AI's prediction
+2. Look for differences that REPEAT across examples in:
+   - Tone and communication style
+   - Information accuracy and completeness
+   - Response structure and formatting
+   - Helpfulness and proactivity
+   - Human-like qualities vs robotic patterns
+
+3. Prefer changes that fix patterns seen in several examples over one-off details from a single conversation
+
+4. Make SURGICAL, PRECISE edits to the prompt - don't rewrite everything, just adjust the specific areas that need improvement
+
+Return your response as JSON:
+{{"prompt": "the complete updated prompt text", "changes_made": "brief 1-2 sentence description of what you changed and why"}}
+
+IMPORTANT: Return ONLY the JSON object, no other text."""
+
+
+BATCH_EXAMPLE_TEMPLATE = """=== EXAMPLE {number} ===
+Chat History:
+{chat_history}
+
+Client Message:
+{client_message}
+
+REAL CONSULTANT REPLY:
+{consultant_reply}
+
+AI PREDICTED REPLY:
+{predicted_reply}
+"""
+
+
+RETRIEVED_EXAMPLES_TEMPLATE = """SIMILAR PAST CONVERSATIONS:
+These are real replies our consultants sent to similar messages. Match their tone, length and style, but only state facts from the KNOWLEDGE BASE above.
+
+{examples}
+
+---
+
+"""
+
+
+RETRIEVED_EXAMPLE_TEMPLATE = """Client: {client}
+Consultant: {reply}"""
+
+
+SUMMARY_PROMPT = """You maintain a running summary of a WhatsApp conversation between a client and a Thailand DTV visa consultant. The summary replaces older messages in the chatbot's prompt, so it must keep everything the consultant needs to continue without asking again.
+
+EXISTING SUMMARY (may be empty):
+{existing_summary}
+
+NEW MESSAGES TO ADD:
+{new_messages}
+
+Write the updated summary. Keep:
+- Facts the client shared (nationality, current location, occupation/employer, savings and currency, visa category, target embassy, dates)
+- Documents discussed and their status, and any decisions or next steps agreed
+- Key information the consultant already gave (fees, timelines, requirements) so it is not repeated
+- Open questions or concerns the client still has
+
+Use short factual bullet points, at most {max_words} words. Return ONLY the summary, nothing else."""
@@ -1,3 +1,5 @@
 # Routes package
 from app.routes.generate import generate_bp
 from app.routes.improve import improve_bp
+from app.routes.stats import stats_bp
+from app.routes.conversations import conversations_bp
@@ -0,0 +1,39 @@
+from flask import Blueprint, jsonify
+from app.services.session_store import get_session_store
+
+conversations_bp = Blueprint('conversations', __name__)
+
+
+@conversations_bp.route('/conversations/<conversation_id>', methods=['GET'])
+def get_conversation(conversation_id):
+    """
+    Get the server-side history of a conversationId session.
+    
+    Response:
+    {
+        "conversationId": "abc-123",
+        "messages": [{"role": "client", "message": "..."}, {"role": "consultant", "message": "..."}]
+    }
+    """
+    try:
+        session = get_session_store().get(conversation_id)
+        return jsonify({
+            "conversationId": conversation_id,
+            "messages": list(session.messages)
+        })
+    
+    except Exception as e:
+        print(f"❌ Error in /conversations: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@conversations_bp.route('/conversations/<conversation_id>', methods=['DELETE'])
+def delete_conversation(conversation_id):
+    """Forget a conversationId session (memory and persistent backend)."""
+    try:
+        get_session_store().delete(conversation_id)
+        return jsonify({"conversationId": conversation_id, "deleted": True})
+    
+    except Exception as e:
+        print(f"❌ Error in /conversations: {e}")
+        return jsonify({"error": str(e)}), 500
@@ -1,26 +1,17 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from app.services.prompt_editor import get_prompt_editor
+from app.services.history_compactor import get_history_compactor
+from app.routes.history import resolve_history, aresolve_history, record_exchange, arecord_exchange
+from app.services.usage import current_tags, usage_tags
+import asyncio
+import json
+import os
 
 generate_bp = Blueprint('generate', __name__)
 
 
-def format_history_from_request(chat_history: list) -> str:
-    """Convert API chat history format to string format for prompts."""
-    if not chat_history:
-        return "No previous messages."
-    
-    formatted = []
-    for msg in chat_history:
-        role = msg.get('role', 'unknown').upper()
-        # Accept both {message: "..."} and {content: "..."}
-        message = msg.get('message') if msg.get('message') is not None else msg.get('content', '')
-        formatted.append(f"[{role}]: {message}")
-    
-    return "\n".join(formatted)
-
-
 @generate_bp.route('/generate-reply', methods=['POST'])
-def generate_reply():
+async def generate_reply():
     """
     Generate an AI response based on conversation context.
     
@@ -30,12 +21,20 @@ def generate_reply():
         "chatHistory": [
             {"role": "consultant", "message": "Hi there! Thank you for reaching out..."},
             {"role": "client", "message": "Hello, I'm interested in the DTV visa..."}
-        ]
+        ],
+        "contactId": "optional - lets long histories reuse a cached summary"
     }
     
+    Session mode: send "conversationId" instead of "chatHistory". The server
+    keeps the history; only the new client message is sent (plus optional
+    "newMessages" for anything said outside this API, e.g. a consultant's
+    manual reply). The client message and aiReply are appended afterwards.
+    An unknown conversationId is seeded from "chatHistory" if one is sent.
+    
     Response:
     {
-        "aiReply": "Great news! As a US citizen, you can apply..."
+        "aiReply": "Great news! As a US citizen, you can apply...",
+        "conversationId": "only in session mode"
     }
     """
     try:
@@ -46,23 +45,182 @@ def generate_reply():
         
         # Accept both 'message' and 'clientSequence' for flexibility
         client_sequence = data.get('message') or data.get('clientSequence', '')
-        chat_history = data.get('chatHistory', [])
         
         if not client_sequence:
             return jsonify({"error": "message is required"}), 400
         
-        # Format chat history
-        history_text = format_history_from_request(chat_history)
+        # Format chat history (older turns summarized if over the token budget)
+        history_text, conversation_id = await aresolve_history(data)
         
         # Generate reply using prompt editor service
         editor = get_prompt_editor()
-        ai_reply = editor.generate_reply(
+        ai_reply = await editor.agenerate_reply(
             client_message=client_sequence,
             chat_history=history_text
         )
         
+        if conversation_id:
+            await arecord_exchange(conversation_id, client_sequence, ai_reply)
+            return jsonify({"aiReply": ai_reply, "conversationId": conversation_id})
         return jsonify({"aiReply": ai_reply})
     
     except Exception as e:
         print(f"❌ Error in /generate-reply: {e}")
         return jsonify({"error": str(e)}), 500
+
+
+@generate_bp.route('/generate-replies', methods=['POST'])
+async def generate_replies():
+    """
+    Generate AI responses for many conversations in one call (e.g. inbox backfills).
+    
+    Request Body:
+    {
+        "items": [
+            {"message": "Can I apply from Indonesia?", "chatHistory": [...]},
+            {"message": "Do stocks count?", "chatHistory": []}
+        ],
+        "concurrency": 8
+    }
+    
+    Response (results are in request order):
+    {
+        "results": [
+            {"aiReply": "Yes, Jakarta works..."},
+            {"error": "message is required"}
+        ],
+        "succeeded": 1,
+        "failed": 1
+    }
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({"error": "Request body is required"}), 400
+        
+        items = data.get('items')
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "items must be a non-empty array"}), 400
+        
+        max_items = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+        if len(items) > max_items:
+            return jsonify({"error": f"At most {max_items} items per request"}), 400
+        
+        max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+        concurrency = data.get('concurrency')
+        if concurrency is None:
+            concurrency = int(os.getenv("BATCH_CONCURRENCY", "8"))
+        elif isinstance(concurrency, bool) or not isinstance(concurrency, int) or concurrency < 1:
+            return jsonify({"error": "concurrency must be a positive integer"}), 400
+        concurrency = min(concurrency, max_concurrency)
+        
+        # Validate items up front; only valid ones are sent to the LLM
+        results = [None] * len(items)
+        valid_indexes = []
+        valid_items = []
+        for index, item in enumerate(items):
+            item = item if isinstance(item, dict) else {}
+            client_sequence = item.get('message') or item.get('clientSequence', '')
+            if not client_sequence:
+                results[index] = {"error": "message is required"}
+                continue
+            valid_indexes.append(index)
+            valid_items.append((client_sequence, item))
+        
+        if valid_items:
+            # Batch work: paced by the providers' bulk rate limiters, not just their 429s
+            with usage_tags(bulk=True):
+                compactor = get_history_compactor()
+                semaphore = asyncio.Semaphore(concurrency)
+            
+                async def compact(item: dict) -> str:
+                    # Long histories may need a summary LLM call; bound those like replies
+                    async with semaphore:
+                        return await compactor.acompact(item.get('chatHistory', []), item.get('contactId') or item.get('contact_id'))
+            
+                histories = await asyncio.gather(*(compact(item) for _, item in valid_items))
+                valid_items = [(client_sequence, history) for (client_sequence, _), history in zip(valid_items, histories)]
+                editor = get_prompt_editor()
+                replies = await editor.agenerate_replies(valid_items, concurrency=concurrency)
+                for index, reply in zip(valid_indexes, replies):
+                    results[index] = reply
+        
+        failed = sum(1 for result in results if "error" in result)
+        return jsonify({
+            "results": results,
+            "succeeded": len(results) - failed,
+            "failed": failed
+        })
+    
+    except Exception as e:
+        print(f"❌ Error in /generate-replies: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+def _sse(payload: dict, event: str = None) -> str:
+    """Encode one server-sent event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+
+@generate_bp.route('/generate-reply/stream', methods=['POST'])
+def generate_reply_stream():
+    """
+    Stream an AI response as server-sent events while the LLM is generating.
+    
+    Request Body: same as /generate-reply (including conversationId session mode)
+    
+    Response (text/event-stream):
+    data: {"delta": "Great news!"}
+    
+    data: {"delta": " As a US citizen, you can apply..."}
+    
+    event: done
+    data: {"aiReply": "Great news! As a US citizen, you can apply..."}
+    
+    On failure after the stream has started, an `event: error` with
+    {"error": "..."} is sent instead of `done`.
+    """
+    data = request.get_json(silent=True)
+    
+    if not data:
+        return jsonify({"error": "Request body is required"}), 400
+    
+    client_sequence = data.get('message') or data.get('clientSequence', '')
+    
+    if not client_sequence:
+        return jsonify({"error": "message is required"}), 400
+    
+    try:
+        history_text, conversation_id = resolve_history(data)
+    except Exception as e:
+        # Nothing has been streamed yet, so fail like /generate-reply does
+        print(f"❌ Error in /generate-reply/stream: {e}")
+        return jsonify({"error": str(e)}), 500
+    # The body is streamed after the request hooks ran, so bill it to this endpoint explicitly
+    tags = current_tags()
+    
+    def events():
+        sentences = []
+        try:
+            editor = get_prompt_editor()
+            for sentence in editor.stream_reply(
+                client_message=client_sequence,
+                chat_history=history_text,
+                tags=tags
+            ):
+                yield _sse({"delta": f" {sentence}" if sentences else sentence})
+                sentences.append(sentence)
+            ai_reply = " ".join(sentences).strip()
+            record_exchange(conversation_id, client_sequence, ai_reply)
+            yield _sse({"aiReply": ai_reply}, event="done")
+        except Exception as e:
+            print(f"❌ Error in /generate-reply/stream: {e}")
+            yield _sse({"error": str(e)}, event="error")
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,90 @@
+import asyncio
+from typing import List, Optional, Tuple
+
+from app.services.history_compactor import get_history_compactor
+from app.services.session_store import get_session_store
+from app.services.metrics import time_stage, timed_stage
+from app.services.tracing import traced
+
+
+def _normalize(messages: list) -> List[dict]:
+    """API chat messages -> {"role", "message"} (accepts {content: ...} too)."""
+    normalized = []
+    for msg in messages or []:
+        if not isinstance(msg, dict):
+            continue
+        message = msg.get('message') if msg.get('message') is not None else msg.get('content', '')
+        normalized.append({"role": msg.get('role', 'unknown'), "message": message})
+    return normalized
+
+
+def _load_session(data: dict, conversation_id: str):
+    """
+    Get the stored session, seeding an empty one from chatHistory and
+    appending any newMessages (e.g. replies a consultant sent by hand).
+    """
+    store = get_session_store()
+    session = store.get(conversation_id)
+    seed = data.get('chatHistory') or data.get('chat_history')
+    if seed and not session.messages:
+        # Checked again atomically: concurrent first requests must not both seed
+        store.seed(conversation_id, _normalize(seed))
+    if data.get('newMessages'):
+        store.append(conversation_id, _normalize(data['newMessages']))
+    return session
+
+
+@traced("resolve_history")
+@timed_stage("history_format")
+def resolve_history(data: dict) -> Tuple[str, Optional[str]]:
+    """
+    Formatted (and, if over budget, compacted) history for a request.
+
+    With `conversationId` the history comes from the server-side session and
+    the request only carries new messages; otherwise it is the request's
+    `chatHistory`.
+
+    Returns:
+        (history text, conversation id or None)
+    """
+    compactor = get_history_compactor()
+    conversation_id = data.get('conversationId') or data.get('conversation_id')
+    contact_id = data.get('contactId') or data.get('contact_id') or conversation_id
+    if not conversation_id:
+        chat_history = data.get('chatHistory') or data.get('chat_history', [])
+        return compactor.compact(chat_history, contact_id), None
+
+    lines, text = _load_session(data, conversation_id).snapshot()
+    return compactor.compact_lines(lines, contact_id, text or None), conversation_id
+
+
+@traced("resolve_history")
+@timed_stage("history_format")
+async def aresolve_history(data: dict) -> Tuple[str, Optional[str]]:
+    """Async counterpart of resolve_history(); session I/O runs off the event loop."""
+    compactor = get_history_compactor()
+    conversation_id = data.get('conversationId') or data.get('conversation_id')
+    contact_id = data.get('contactId') or data.get('contact_id') or conversation_id
+    if not conversation_id:
+        chat_history = data.get('chatHistory') or data.get('chat_history', [])
+        return await compactor.acompact(chat_history, contact_id), None
+
+    session = await asyncio.to_thread(_load_session, data, conversation_id)
+    lines, text = session.snapshot()
+    return await compactor.acompact_lines(lines, contact_id, text or None), conversation_id
+
+
+def record_exchange(conversation_id: Optional[str], client_message: str, reply: str):
+    """Append a client message and the reply that answered it to the session."""
+    if conversation_id:
+        with time_stage("session_write"):
+            get_session_store().append(conversation_id, [
+                {"role": "client", "message": client_message},
+                {"role": "consultant", "message": reply}
+            ])
+
+
+async def arecord_exchange(conversation_id: Optional[str], client_message: str, reply: str):
+    """Async counterpart of record_exchange()."""
+    if conversation_id:
+        await asyncio.to_thread(record_exchange, conversation_id, client_message, reply)
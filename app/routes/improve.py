@@ -1,26 +1,22 @@
 from flask import Blueprint, request, jsonify
+import asyncio
+import os
 from app.services.prompt_editor import get_prompt_editor
+from app.services.improvement_queue import get_improvement_queue
+from app.routes.history import aresolve_history, arecord_exchange
 
 improve_bp = Blueprint('improve', __name__)
 
 
-def format_history_from_request(chat_history: list) -> str:
-    """Convert API chat history format to string format for prompts."""
-    if not chat_history:
-        return "No previous messages."
-    
-    formatted = []
-    for msg in chat_history:
-        role = msg.get('role', 'unknown').upper()
-        # Accept both {message: "..."} and {content: "..."}
-        message = msg.get('message') if msg.get('message') is not None else msg.get('content', '')
-        formatted.append(f"[{role}]: {message}")
-    
-    return "\n".join(formatted)
+def _is_true(value) -> bool:
+    """Read a flag given as a JSON boolean or as a string like the env flags ("true", "1", "yes")."""
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes")
+    return bool(value)
 
 
 @improve_bp.route('/improve-ai', methods=['POST'])
-def improve_ai():
+async def improve_ai():
     """
     Auto-improve the AI prompt by comparing predicted vs actual consultant reply.
     
@@ -31,14 +27,35 @@ def improve_ai():
             {"role": "consultant", "message": "Hi there!..."},
             {"role": "client", "message": "Hello, I'm interested..."}
         ],
+        "contactId": "optional - lets long histories reuse a cached summary",
         "consultantReply": "Yes, absolutely! You can apply at the Thai Embassy in Jakarta..."
     }
     
+    Session mode: send "conversationId" instead of "chatHistory" (see
+    /generate-reply). The client message and consultantReply are appended
+    to the stored conversation.
+    
+    Queued mode: send "async": true (or set IMPROVE_ASYNC=true to make it the
+    default) to get 202 with a job id right away. Background workers predict
+    and coalesce every example waiting at that moment into one editor call;
+    poll GET /improve-ai/jobs/<jobId> for the result.
+    
     Response:
     {
         "predictedReply": "Great news! As a US citizen...",
         "updatedPrompt": "You are a visa consultant specializing in Thai DTV visas...",
-        "changesMade": "Adjusted tone to be more casual..."
+        "changesMade": "Adjusted tone to be more casual...",
+        "evaluation": {"outcome": "promoted", "delta": 0.012, "baseline": {"score": 0.61, ...}, "candidate": {...}}
+    }
+    
+    evaluation is present when PROMPT_EVAL_ENABLED: the candidate prompt was
+    scored against the current one on held-out conversations first. A
+    candidate that scores worse is not applied (422 with the same evaluation).
+    
+    Response (queued mode, 202):
+    {
+        "jobId": "3f2a9c...",
+        "status": "pending"
     }
     """
     try:
@@ -49,7 +66,6 @@ def improve_ai():
         
         # Accept both camelCase and snake_case keys
         client_sequence = data.get('clientSequence') or data.get('client_message') or data.get('message', '')
-        chat_history = data.get('chatHistory') or data.get('chat_history', [])
         consultant_reply = data.get('consultantReply') or data.get('consultant_reply', '')
         
         if not client_sequence:
@@ -57,20 +73,35 @@ def improve_ai():
         if not consultant_reply:
             return jsonify({"error": "consultantReply is required"}), 400
         
-        # Format chat history
-        history_text = format_history_from_request(chat_history)
+        # Format chat history (older turns summarized if over the token budget)
+        history_text, conversation_id = await aresolve_history(data)
         
         # Get prompt editor service
         editor = get_prompt_editor()
         
+        queued = data.get('async')
+        if queued is None:
+            queued = os.getenv("IMPROVE_ASYNC", "false")
+        if _is_true(queued):
+            editor.retrieval.add(client_sequence, consultant_reply)
+            await arecord_exchange(conversation_id, client_sequence, consultant_reply)
+            job_id = await asyncio.to_thread(
+                get_improvement_queue().enqueue, client_sequence, history_text, consultant_reply
+            )
+            return jsonify({"jobId": job_id, "status": "pending"}), 202
+        
         # First, generate a prediction with current prompt
-        predicted_reply = editor.generate_reply(
+        predicted_reply = await editor.agenerate_reply(
             client_message=client_sequence,
             chat_history=history_text
         )
         
+        # Make this real exchange available as a few-shot example for future replies
+        editor.retrieval.add(client_sequence, consultant_reply)
+        await arecord_exchange(conversation_id, client_sequence, consultant_reply)
+        
         # Now improve the prompt based on the comparison
-        result = editor.improve_from_example(
+        result = await editor.aimprove_from_example(
             client_message=client_sequence,
             chat_history=history_text,
             consultant_reply=consultant_reply,
@@ -78,11 +109,22 @@ def improve_ai():
         )
         
         if result.get("success"):
-            return jsonify({
+            response = {
                 "predictedReply": predicted_reply,
                 "updatedPrompt": result.get("updated_prompt", ""),
                 "changesMade": result.get("changes_made", "")
-            })
+            }
+            if "evaluation" in result:
+                response["evaluation"] = result["evaluation"]
+            return jsonify(response)
+        elif "evaluation" in result:
+            # The editor worked, but its prompt scored worse on the held-out set
+            return jsonify({
+                "predictedReply": predicted_reply,
+                "error": result["error"],
+                "changesMade": result.get("changes_made", ""),
+                "evaluation": result["evaluation"]
+            }), 422
         else:
             return jsonify({
                 "predictedReply": predicted_reply,
@@ -95,6 +137,37 @@ def improve_ai():
         return jsonify({"error": str(e)}), 500
 
 
+@improve_bp.route('/improve-ai/jobs/<job_id>', methods=['GET'])
+def get_improvement_job(job_id):
+    """
+    Report the status of a queued /improve-ai example.
+    
+    Response:
+    {
+        "jobId": "3f2a9c...",
+        "status": "done",
+        "batchId": "a1b2c3d4e5f6",
+        "batchSize": 4,
+        "result": {
+            "predictedReply": "Great news! As a US citizen...",
+            "updatedPrompt": "You are a visa consultant specializing in Thai DTV visas...",
+            "changesMade": "Adjusted tone to be more casual..."
+        }
+    }
+    
+    status is one of pending, running, done, failed (failed jobs carry "error").
+    """
+    try:
+        job = get_improvement_queue().get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job)
+    
+    except Exception as e:
+        print(f"❌ Error in /improve-ai/jobs: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @improve_bp.route('/improve-ai-manually', methods=['POST'])
 def improve_ai_manually():
     """
@@ -151,19 +224,49 @@ def get_current_prompt():
     
     Response:
     {
-        "prompt": "You are a friendly immigration consultant..."
+        "prompt": "You are a friendly immigration consultant...",
+        "version": "v42"
     }
     """
     try:
         editor = get_prompt_editor()
-        prompt = editor.get_current_prompt()
-        return jsonify({"prompt": prompt})
+        prompt, version = editor.get_prompt_with_version()
+        return jsonify({"prompt": prompt, "version": version})
     
     except Exception as e:
         print(f"❌ Error in /get-prompt: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@improve_bp.route('/prompt-versions', methods=['GET'])
+def get_prompt_versions():
+    """
+    List recent versions of the chatbot prompt, newest first.
+    
+    Query: ?limit=20 (1-200)
+    
+    Response:
+    {
+        "versions": [
+            {"id": 42, "parent_id": 41, "change_note": "Shorter replies...", "created_at": "..."}
+        ]
+    }
+    """
+    try:
+        try:
+            limit = int(request.args.get('limit', 20))
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return jsonify({"error": "limit must be a positive integer"}), 400
+        limit = min(limit, 200)
+        return jsonify({"versions": get_prompt_editor().db.list_prompt_versions("chatbot_prompt", limit)})
+    
+    except Exception as e:
+        print(f"❌ Error in /prompt-versions: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @improve_bp.route('/reset-prompt', methods=['POST'])
 def reset_prompt():
     """
@@ -181,7 +284,8 @@ def reset_prompt():
         from app.services.db_service import get_db_service
         
         db = get_db_service()
-        success = db.update_prompt("chatbot_prompt", CHATBOT_PROMPT)
+        success = db.update_prompt("chatbot_prompt", CHATBOT_PROMPT, "reset to base prompt")
+        get_prompt_editor().invalidate_prompt_cache()
         
         if success:
             return jsonify({
@@ -0,0 +1,105 @@
+from flask import Blueprint, jsonify
+from app.services.prompt_editor import get_prompt_editor
+from app.services.http_transport import get_http_transport
+from app.services.history_compactor import get_history_compactor
+from app.services.session_store import get_session_store
+from app.services.improvement_queue import get_improvement_queue
+from app.services.rate_limiter import rate_limiter_stats
+from app.services.circuit_breaker import circuit_breaker_stats
+from app.services.tracing import get_slow_request_log
+from app.services.usage import get_usage_tracker
+
+stats_bp = Blueprint('stats', __name__)
+
+
+@stats_bp.route('/stats', methods=['GET'])
+def get_stats():
+    """
+    Report in-process cache and connection counters (per worker process).
+    
+    Response:
+    {
+        "llm": {"providers": ["groq", "google"], "hedges": 12, "hedgeWins": 7, "failovers": 1, "latency": {...}, ...},
+        "rateLimits": {"groq": {"requestsPerMinute": 42.0, "scale": 1.4, "throttles": 3, "waits": 120, ...}},
+        "circuitBreakers": {"groq": {"state": "closed", "consecutiveFailures": 0, "opens": 1, ...}},
+        "promptCache": {"hits": 120, "misses": 1, "staleHits": 3, ...},
+        "replyCache": {"entries": 40, "hits": 12, "misses": 40, "hitRatio": 0.2308, ...},
+        "nearDuplicateCache": {"enabled": true, "entries": 35, "hits": 9, "avgLookupMs": 0.21, ...},
+        "retrieval": {"enabled": true, "documents": 5120, "topK": 3, "avgSearchMs": 0.4, ...},
+        "historyCompactor": {"tokenBudget": 2000, "compactions": 14, "summariesExtended": 3, ...},
+        "sessions": {"backend": "sqlite", "sessions": 210, "bytes": 1843200, "evictions": 0, ...},
+        "improvementQueue": {"workers": 2, "maxBatch": 10, "pending": 3, "running": 4, "done": 51, "failed": 0},
+        "promptEvaluation": {"enabled": true, "heldOutPairs": 32, "promoted": 9, "rejected": 4, "cacheHits": 410, ...},
+        "tracing": {"thresholdMs": 10000, "path": "slow_requests.jsonl", "traces": 530, "slow": 2, "writeErrors": 0},
+        "httpTransport": {"hosts": {"https://xyz.supabase.co": {"requests": 124, "connectionsOpened": 2, ...}}}
+    }
+    """
+    try:
+        editor = get_prompt_editor()
+        return jsonify({
+            "llm": editor.llm.stats(),
+            "rateLimits": rate_limiter_stats(),
+            "circuitBreakers": circuit_breaker_stats(),
+            "promptCache": editor.prompt_cache.stats(),
+            "replyCache": editor.reply_cache.stats(),
+            "nearDuplicateCache": editor.near_duplicate_cache.stats(),
+            "retrieval": editor.retrieval.stats(),
+            "historyCompactor": get_history_compactor().stats(),
+            "sessions": get_session_store().stats(),
+            "improvementQueue": get_improvement_queue().stats(),
+            "promptEvaluation": editor.evaluator.stats(),
+            "tracing": get_slow_request_log().stats(),
+            "httpTransport": get_http_transport().stats()
+        })
+    
+    except Exception as e:
+        print(f"❌ Error in /stats: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@stats_bp.route('/usage', methods=['GET'])
+def get_usage():
+    """
+    Report LLM token usage and estimated cost (per worker process).
+    
+    Response:
+    {
+        "totals": {"calls": 812, "inputTokens": 1630000, "outputTokens": 98000, "costUsd": 0.2414, "estimatedCalls": 40},
+        "byEndpoint": {"generate-reply": {...}, "improve-ai": {...}, "improve-ai-manually": {...}},
+        "byProvider": {"groq/llama-3.3-70b-versatile": {...}, "google/gemini-2.0-flash": {...}},
+        "byOperation": {"reply": {...}, "editor": {...}, "summary": {...}},
+        "byEndpointOperation": {"improve-ai:reply": {...}, "improve-ai:editor": {...}, ...},
+        "byPromptVersion": {"v41": {...}, "v42": {...}},
+        "unpricedModels": []
+    }
+    
+    Costs come from the pricing table (LLM_PRICING overrides it); estimatedCalls
+    counts calls (e.g. streams) whose tokens were estimated from the text.
+    """
+    try:
+        return jsonify(get_usage_tracker().stats())
+    
+    except Exception as e:
+        print(f"❌ Error in /usage: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@stats_bp.route('/circuit-breakers', methods=['GET'])
+def get_circuit_breakers():
+    """
+    Report each LLM provider's circuit breaker (per worker process).
+    
+    Response:
+    {
+        "groq": {"state": "open", "consecutiveFailures": 5, "retryIn": 12.4, "opens": 1, "rejected": 37},
+        "google": {"state": "closed", "consecutiveFailures": 0, "retryIn": 0.0, "opens": 0, "rejected": 0}
+    }
+    
+    state is closed (healthy), open (failing fast) or half_open (next call probes).
+    """
+    try:
+        return jsonify(circuit_breaker_stats())
+    
+    except Exception as e:
+        print(f"❌ Error in /circuit-breakers: {e}")
+        return jsonify({"error": str(e)}), 500
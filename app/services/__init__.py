@@ -1,4 +1,15 @@
 # Services package
 from app.services.llm_service import LLMService, get_llm_service
-from app.services.db_service import DatabaseService, get_db_service
+from app.services.llm_hedging import HedgedLLMService, LatencyHistogram
+from app.services.db_service import DatabaseService, PromptVersionConflict, get_db_service
 from app.services.prompt_editor import PromptEditorService, get_prompt_editor
+from app.services.prompt_cache import PromptCache
+from app.services.reply_cache import ReplyCache
+from app.services.near_duplicate_cache import NearDuplicateCache
+from app.services.retrieval import BM25Index, RetrievalService, get_retrieval_service
+from app.services.history_compactor import HistoryCompactor, get_history_compactor
+from app.services.session_store import SessionStore, SQLiteSessionBackend, get_session_store
+from app.services.improvement_queue import ImprovementQueue, get_improvement_queue
+from app.services.metrics import Counter, Histogram, MetricsRegistry, REGISTRY
+from app.services.usage import UsageTracker, get_usage_tracker
+from app.services.prompt_evaluator import PromptEvaluator
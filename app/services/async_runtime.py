@@ -0,0 +1,61 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+from typing import Any, Awaitable, Optional
+
+# One long-lived event loop per process, running in a daemon thread.
+# Async HTTP clients (httpx, provider SDKs) bind their connection pools to the
+# loop they first run on, so every coroutine in the app is scheduled here.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Get (or start) the shared background event loop."""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="async-runtime", daemon=True)
+            thread.start()
+            _loop, _loop_thread = loop, thread
+    return _loop
+
+
+def run_sync(coro: Awaitable, timeout: float = None) -> Any:
+    """
+    Run a coroutine on the shared loop and block the calling thread for its result.
+
+    The caller's contextvars (e.g. Flask's request context) are copied into the
+    task so `request` and friends keep working inside async views.
+    """
+    loop = get_event_loop()
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError("run_sync() called from the event loop thread; await the coroutine instead")
+
+    ctx = contextvars.copy_context()
+    future: concurrent.futures.Future = concurrent.futures.Future()
+    tasks = []
+
+    def _on_done(task: asyncio.Task):
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def _start():
+        task = loop.create_task(coro, context=ctx)
+        task.add_done_callback(_on_done)
+        tasks.append(task)
+
+    loop.call_soon_threadsafe(_start)
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        # Don't leave the abandoned coroutine running on the loop
+        loop.call_soon_threadsafe(lambda: tasks and tasks[0].cancel())
+        raise
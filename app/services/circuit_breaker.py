@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open."""
+
+    def __init__(self, provider: str, retry_in: float):
+        super().__init__(f"{provider} circuit is open; retry in {retry_in:.1f}s")
+        self.provider = provider
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker.
+
+    After `failure_threshold` consecutive infrastructure failures (timeouts,
+    connection errors, 5xx) the circuit opens and calls fail fast with
+    CircuitOpenError for `cooldown` seconds. Then one probe call is let
+    through (half-open): success closes the circuit, failure re-opens it.
+    Safe to share between the event loop and worker threads.
+    """
+
+    def __init__(self, provider: str, failure_threshold: int = None, cooldown: float = None):
+        self.provider = provider
+        self.failure_threshold = failure_threshold or int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+        self.cooldown = cooldown or float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+        self.opens = 0
+        self.rejected = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go to the provider now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            retry_in = self._opened_at + self.cooldown - time.monotonic()
+            if self.state == OPEN and retry_in <= 0:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+            raise CircuitOpenError(self.provider, max(0.0, retry_in))
+
+    def record_success(self):
+        """The provider answered (any non-infrastructure outcome counts)."""
+        with self._lock:
+            if self.state != CLOSED:
+                print(f"✅ {self.provider} circuit closed")
+            self.state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self._failures >= self.failure_threshold):
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+                self.opens += 1
+                print(f"🚫 {self.provider} circuit opened after {self._failures} consecutive failures")
+
+    def release_probe(self):
+        """A half-open probe was abandoned (e.g. cancelled); let another call probe."""
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            state = self.state
+            retry_in = self._opened_at + self.cooldown - time.monotonic()
+            if state == OPEN and retry_in <= 0:
+                state = HALF_OPEN
+            return {
+                "state": state,
+                "consecutiveFailures": self._failures,
+                "retryIn": round(max(0.0, retry_in), 1) if state == OPEN else 0.0,
+                "opens": self.opens,
+                "rejected": self.rejected
+            }
+
+
+# One breaker per provider, shared by every LLMService in the process
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    """Get or create the circuit breaker for a provider."""
+    with _breakers_lock:
+        breaker: Optional[CircuitBreaker] = _breakers.get(provider)
+        if breaker is None:
+            breaker = _breakers[provider] = CircuitBreaker(provider)
+        return breaker
+
+
+def circuit_breaker_stats() -> Dict[str, dict]:
+    """Breaker state for every provider seen so far."""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {provider: breaker.stats() for provider, breaker in breakers.items()}
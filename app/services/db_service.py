@@ -1,14 +1,43 @@
+import asyncio
 import os
-from typing import Optional
+import time
+from typing import Optional, Tuple
 
-# Use requests directly to avoid Supabase SDK version issues
-import requests
+# Use the REST API directly (over a pooled session) to avoid Supabase SDK version issues
+from app.services.http_transport import get_http_transport
+from app.services.metrics import PROMPT_CONFLICTS, timed_stage
+from app.services.tracing import traced
+
+
+class PromptVersionConflict(Exception):
+    """The prompt's head version moved since it was read (compare-and-swap lost)."""
+
+
+# PostgREST error codes for a table/column that does not exist (older servers report Postgres' own codes)
+SCHEMA_MISSING_CODES = frozenset({"42P01", "42703", "PGRST204", "PGRST205"})
+
+
+def _schema_missing(response) -> bool:
+    """Whether an error response says the probed table or column does not exist."""
+    if response.status_code not in (400, 404):
+        return False
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    return isinstance(body, dict) and body.get("code") in SCHEMA_MISSING_CODES
 
 
 class DatabaseService:
     """
     Database service for managing prompts in Supabase.
     Uses REST API directly for maximum compatibility.
+    
+    Prompts are versioned when the schema has a `prompt_versions` table and a
+    `prompts.version_id` head pointer (see USER_SETUP_GUIDE.md): every write
+    inserts an immutable version recording its parent, then moves the head
+    with a conditional PATCH that only matches the expected version. Older
+    schemas without those fall back to plain in-place updates.
     """
     
     def __init__(self):
@@ -25,13 +54,133 @@ class DatabaseService:
             "Prefer": "return=representation"
         }
         self.rest_url = f"{self.url}/rest/v1"
+        self.http = get_http_transport()
+        self.cas_retries = int(os.getenv("PROMPT_CAS_RETRIES", "3"))
+        self.probe_attempts = 3
+        self._versioned: Optional[bool] = None
         print("✅ Database service initialized")
     
+    @property
+    def versioned(self) -> bool:
+        """
+        Whether the schema supports prompt versions (probed once).
+
+        Only PostgREST's "table/column does not exist" answer means an
+        unversioned schema. Any other failure is retried briefly and then
+        raised, so callers fail the operation instead of falling back to
+        unversioned writes that would skip the compare-and-swap.
+        """
+        if self._versioned is None:
+            for attempt in range(self.probe_attempts):
+                try:
+                    self._versioned = self._probe_schema()
+                    break
+                except Exception as e:
+                    print(f"⚠️ Could not check prompt versioning schema (attempt {attempt + 1}): {e}")
+                    if attempt + 1 == self.probe_attempts:
+                        raise
+                    time.sleep(0.2 * 2 ** attempt)
+        return self._versioned
+    
+    def _probe_schema(self) -> bool:
+        for url in (f"{self.rest_url}/prompt_versions?select=id&limit=1",
+                    f"{self.rest_url}/prompts?select=version_id&limit=1"):
+            response = self.http.get(url, headers=self.headers)
+            if _schema_missing(response):
+                print("⚠️ prompt_versions schema not found; prompt updates are not versioned")
+                return False
+            response.raise_for_status()
+        return True
+    
+    def _head_url(self, name: str, expected_version_id: Optional[int]) -> str:
+        """PATCH target that only matches the prompt row while its head is the expected version."""
+        condition = "is.null" if expected_version_id is None else f"eq.{expected_version_id}"
+        return f"{self.rest_url}/prompts?name=eq.{name}&version_id={condition}"
+    
+    def get_prompt_head(self, name: str = "chatbot_prompt") -> Optional[Tuple[str, Optional[int]]]:
+        """
+        Retrieve a prompt and its current version id.
+        
+        Returns:
+            (content, version_id) - version_id is None on unversioned schemas -
+            or None if the prompt doesn't exist or can't be read
+        """
+        try:
+            return self.load_prompt_head(name)
+        except Exception as e:
+            print(f"❌ DB Error getting prompt '{name}': {e}")
+            return None
+    
+    @traced("DatabaseService.get_prompt_head")
+    def load_prompt_head(self, name: str = "chatbot_prompt") -> Optional[Tuple[str, Optional[int]]]:
+        """
+        Like get_prompt_head(), but read errors raise, so None positively
+        means the prompt doesn't exist.
+        """
+        select = "content,version_id" if self.versioned else "content"
+        response = self.http.get(f"{self.rest_url}/prompts?name=eq.{name}&select={select}", headers=self.headers)
+        response.raise_for_status()
+        
+        data = response.json()
+        if data and data[0].get("content"):
+            return data[0]["content"], data[0].get("version_id")
+        return None
+    
+    @traced("DatabaseService.commit_prompt_version")
+    @timed_stage("db_write")
+    def commit_prompt_version(
+        self,
+        name: str,
+        content: str,
+        expected_version_id: Optional[int],
+        change_note: str = ""
+    ) -> bool:
+        """
+        Write `content` as a new version whose parent is `expected_version_id`,
+        and make it the head only if the head is still that version.
+        
+        Returns:
+            True on success, False on errors
+            
+        Raises:
+            PromptVersionConflict: Another writer moved the head first
+        """
+        try:
+            if not self.versioned:
+                return self._update_prompt_in_place(name, content)
+            response = self.http.post(
+                f"{self.rest_url}/prompt_versions",
+                headers=self.headers,
+                json={"name": name, "content": content, "parent_id": expected_version_id, "change_note": change_note}
+            )
+            response.raise_for_status()
+            version_id = response.json()[0]["id"]
+            
+            response = self.http.patch(
+                self._head_url(name, expected_version_id),
+                headers=self.headers,
+                json={"content": content, "version_id": version_id}
+            )
+            response.raise_for_status()
+            if not response.json():
+                # The new version stays in history as an unmerged branch
+                raise PromptVersionConflict(f"Prompt '{name}' moved past version {expected_version_id}")
+            
+            print(f"✅ Prompt '{name}' updated to version {version_id} (parent {expected_version_id})")
+            return True
+            
+        except PromptVersionConflict:
+            raise
+        except Exception as e:
+            print(f"❌ DB Error updating prompt '{name}': {e}")
+            return False
+    
+    @traced("DatabaseService.get_prompt")
     def get_prompt(self, name: str = "chatbot_prompt") -> Optional[str]:
         """Retrieve a prompt from the database by name."""
         try:
             url = f"{self.rest_url}/prompts?name=eq.{name}&select=content"
-            response = requests.get(url, headers=self.headers)
+            response = self.http.get(url, headers=self.headers)
             response.raise_for_status()
             
             data = response.json()
@@ -43,12 +192,28 @@ class DatabaseService:
             print(f"❌ DB Error getting prompt '{name}': {e}")
             return None
     
-    def update_prompt(self, name: str, content: str) -> bool:
-        """Update an existing prompt in the database."""
+    @traced("DatabaseService.update_prompt")
+    def update_prompt(self, name: str, content: str, change_note: str = "") -> bool:
+        """
+        Update an existing prompt in the database, whatever its current version
+        (the write still becomes a new version on top of the head).
+        """
+        for _ in range(self.cas_retries + 1):
+            head = self.get_prompt_head(name)
+            try:
+                return self.commit_prompt_version(name, content, head[1] if head else None, change_note)
+            except PromptVersionConflict:
+                PROMPT_CONFLICTS.inc()
+                continue
+        print(f"❌ DB Error updating prompt '{name}': head kept moving")
+        return False
+    
+    def _update_prompt_in_place(self, name: str, content: str) -> bool:
+        """Unversioned update for schemas without prompt_versions."""
         try:
             url = f"{self.rest_url}/prompts?name=eq.{name}"
             payload = {"content": content}
-            response = requests.patch(url, headers=self.headers, json=payload)
+            response = self.http.patch(url, headers=self.headers, json=payload)
             response.raise_for_status()
             
             print(f"✅ Prompt '{name}' updated successfully")
@@ -58,21 +223,53 @@ class DatabaseService:
             print(f"❌ DB Error updating prompt '{name}': {e}")
             return False
     
+    @traced("DatabaseService.create_prompt")
+    @timed_stage("db_write")
     def create_prompt(self, name: str, content: str) -> bool:
-        """Create a new prompt in the database."""
+        """
+        Create a new prompt in the database.
+        
+        The prompts row is inserted first, so a failed insert (e.g. the row
+        already exists) leaves nothing behind; its initial version is then
+        committed on top of the empty head like any other write.
+        """
         try:
             url = f"{self.rest_url}/prompts"
             payload = {"name": name, "content": content}
-            response = requests.post(url, headers=self.headers, json=payload)
+            versioned = self.versioned
+            response = self.http.post(url, headers=self.headers, json=payload)
             response.raise_for_status()
             
-            print(f"✅ Prompt '{name}' created successfully")
-            return True
-            
         except Exception as e:
             print(f"❌ DB Error creating prompt '{name}': {e}")
             return False
+        
+        print(f"✅ Prompt '{name}' created successfully")
+        if not versioned:
+            return True
+        try:
+            self.commit_prompt_version(name, content, None, "initial version")
+        except PromptVersionConflict:
+            pass  # Another writer already versioned the new row
+        return True
+    
+    @traced("DatabaseService.list_prompt_versions")
+    def list_prompt_versions(self, name: str = "chatbot_prompt", limit: int = 20) -> list:
+        """Newest-first version history of a prompt (without content); [] if unversioned."""
+        try:
+            if not self.versioned:
+                return []
+            url = (f"{self.rest_url}/prompt_versions?name=eq.{name}"
+                   f"&select=id,parent_id,change_note,created_at&order=id.desc&limit={int(limit)}")
+            response = self.http.get(url, headers=self.headers)
+            response.raise_for_status()
+            return response.json()
+            
+        except Exception as e:
+            print(f"❌ DB Error listing versions of prompt '{name}': {e}")
+            return []
     
+    @traced("DatabaseService.get_or_create_prompt")
     def get_or_create_prompt(self, name: str, default_content: str) -> str:
         """Get a prompt, or create it with default content if it doesn't exist."""
         existing = self.get_prompt(name)
@@ -82,6 +279,153 @@ class DatabaseService:
         self.create_prompt(name, default_content)
         return default_content
 
+    
+    # Async counterparts (used from the shared event loop, see app.services.async_runtime)
+    
+    @traced("DatabaseService.get_prompt")
+    async def aget_prompt(self, name: str = "chatbot_prompt") -> Optional[str]:
+        """Retrieve a prompt from the database by name (async)."""
+        try:
+            url = f"{self.rest_url}/prompts?name=eq.{name}&select=content"
+            response = await self.http.aget(url, headers=self.headers)
+            response.raise_for_status()
+            
+            data = response.json()
+            if data and len(data) > 0:
+                return data[0].get("content")
+            return None
+            
+        except Exception as e:
+            print(f"❌ DB Error getting prompt '{name}': {e}")
+            return None
+    
+    async def _aversioned(self) -> bool:
+        if self._versioned is None:
+            # One-time probe; run it off the event loop
+            return await asyncio.to_thread(lambda: self.versioned)
+        return self._versioned
+    
+    @traced("DatabaseService.get_prompt_head")
+    async def aget_prompt_head(self, name: str = "chatbot_prompt") -> Optional[Tuple[str, Optional[int]]]:
+        """Retrieve a prompt and its current version id (async)."""
+        try:
+            if not await self._aversioned():
+                content = await self.aget_prompt(name)
+                return (content, None) if content else None
+            url = f"{self.rest_url}/prompts?name=eq.{name}&select=content,version_id"
+            response = await self.http.aget(url, headers=self.headers)
+            response.raise_for_status()
+            
+            data = response.json()
+            if data and data[0].get("content"):
+                return data[0]["content"], data[0].get("version_id")
+            return None
+            
+        except Exception as e:
+            print(f"❌ DB Error getting prompt '{name}': {e}")
+            return None
+    
+    @traced("DatabaseService.commit_prompt_version")
+    @timed_stage("db_write")
+    async def acommit_prompt_version(
+        self,
+        name: str,
+        content: str,
+        expected_version_id: Optional[int],
+        change_note: str = ""
+    ) -> bool:
+        """Async counterpart of commit_prompt_version()."""
+        try:
+            if not await self._aversioned():
+                return await self._aupdate_prompt_in_place(name, content)
+            response = await self.http.apost(
+                f"{self.rest_url}/prompt_versions",
+                headers=self.headers,
+                json={"name": name, "content": content, "parent_id": expected_version_id, "change_note": change_note}
+            )
+            response.raise_for_status()
+            version_id = response.json()[0]["id"]
+            
+            response = await self.http.apatch(
+                self._head_url(name, expected_version_id),
+                headers=self.headers,
+                json={"content": content, "version_id": version_id}
+            )
+            response.raise_for_status()
+            if not response.json():
+                raise PromptVersionConflict(f"Prompt '{name}' moved past version {expected_version_id}")
+            
+            print(f"✅ Prompt '{name}' updated to version {version_id} (parent {expected_version_id})")
+            return True
+            
+        except PromptVersionConflict:
+            raise
+        except Exception as e:
+            print(f"❌ DB Error updating prompt '{name}': {e}")
+            return False
+    
+    @traced("DatabaseService.update_prompt")
+    async def aupdate_prompt(self, name: str, content: str, change_note: str = "") -> bool:
+        """Update an existing prompt in the database, whatever its current version (async)."""
+        for _ in range(self.cas_retries + 1):
+            head = await self.aget_prompt_head(name)
+            try:
+                return await self.acommit_prompt_version(name, content, head[1] if head else None, change_note)
+            except PromptVersionConflict:
+                PROMPT_CONFLICTS.inc()
+                continue
+        print(f"❌ DB Error updating prompt '{name}': head kept moving")
+        return False
+    
+    async def _aupdate_prompt_in_place(self, name: str, content: str) -> bool:
+        """Unversioned update for schemas without prompt_versions (async)."""
+        try:
+            url = f"{self.rest_url}/prompts?name=eq.{name}"
+            payload = {"content": content}
+            response = await self.http.apatch(url, headers=self.headers, json=payload)
+            response.raise_for_status()
+            
+            print(f"✅ Prompt '{name}' updated successfully")
+            return True
+            
+        except Exception as e:
+            print(f"❌ DB Error updating prompt '{name}': {e}")
+            return False
+    
+    @traced("DatabaseService.create_prompt")
+    @timed_stage("db_write")
+    async def acreate_prompt(self, name: str, content: str) -> bool:
+        """Create a new prompt in the database (async, see create_prompt())."""
+        try:
+            url = f"{self.rest_url}/prompts"
+            payload = {"name": name, "content": content}
+            versioned = await self._aversioned()
+            response = await self.http.apost(url, headers=self.headers, json=payload)
+            response.raise_for_status()
+            
+        except Exception as e:
+            print(f"❌ DB Error creating prompt '{name}': {e}")
+            return False
+        
+        print(f"✅ Prompt '{name}' created successfully")
+        if not versioned:
+            return True
+        try:
+            await self.acommit_prompt_version(name, content, None, "initial version")
+        except PromptVersionConflict:
+            pass  # Another writer already versioned the new row
+        return True
+    
+    @traced("DatabaseService.get_or_create_prompt")
+    async def aget_or_create_prompt(self, name: str, default_content: str) -> str:
+        """Get a prompt, or create it with default content if it doesn't exist (async)."""
+        existing = await self.aget_prompt(name)
+        if existing:
+            return existing
+        
+        await self.acreate_prompt(name, default_content)
+        return default_content
+
 
 # Singleton instance
 _db_instance: Optional[DatabaseService] = None
@@ -0,0 +1,230 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple, Union
+
+from app.services.llm_service import get_llm_service
+from app.services.usage import estimate_tokens, usage_tags
+from app.prompts.base_prompts import SUMMARY_PROMPT
+
+NO_HISTORY = "No previous messages."
+SUMMARY_LABEL = "[CONVERSATION SUMMARY]"
+
+
+def format_history_line(msg: dict) -> str:
+    """Format one API chat history message as "[ROLE]: message"."""
+    role = msg.get('role', 'unknown').upper()
+    # Accept both {message: "..."} and {content: "..."}
+    message = msg.get('message') if msg.get('message') is not None else msg.get('content', '')
+    return f"[{role}]: {message}"
+
+
+def format_history_lines(chat_history: list) -> List[str]:
+    """Convert API chat history to one "[ROLE]: message" line per message."""
+    return [format_history_line(msg) for msg in chat_history or []]
+
+
+def _digest(lines: List[str]) -> str:
+    return hashlib.sha1("\x1e".join(lines).encode("utf-8")).hexdigest()
+
+
+class HistoryCompactor:
+    """
+    Keeps formatted chat history within a token budget.
+
+    Histories under the budget pass through verbatim. Longer ones become a
+    rolling summary of the older messages followed by the most recent turns
+    verbatim. Summaries are cached per contact together with how many
+    messages they cover; later turns reuse the summary while the uncovered
+    messages still fit, and otherwise extend it with just the new messages
+    rather than summarizing the whole conversation again. Set
+    HISTORY_TOKEN_BUDGET to 0 to disable compaction.
+    """
+
+    def __init__(self, llm=None, token_budget: int = None, keep_turns: int = None, max_contacts: int = None):
+        self.llm = llm or get_llm_service()
+        self.token_budget = token_budget if token_budget is not None else int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+        self.keep_turns = keep_turns if keep_turns is not None else int(os.getenv("HISTORY_KEEP_TURNS", "8"))
+        self.max_contacts = max_contacts if max_contacts is not None else int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", "1000"))
+
+        # key -> (messages covered, digest of those messages, summary)
+        self._summaries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.compactions = 0
+        self.summaries_created = 0
+        self.summaries_extended = 0
+        self.summary_reuses = 0
+        self.fallbacks = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.token_budget > 0
+
+    def compact(self, chat_history: list, contact_id: str = None) -> str:
+        """
+        Format API chat history for the prompt, compacting it if over budget.
+
+        Args:
+            chat_history: [{"role": ..., "message": ...}, ...] oldest first
+            contact_id: Stable conversation id used to cache the summary
+
+        Returns:
+            Formatted history string
+        """
+        return self.compact_lines(format_history_lines(chat_history), contact_id)
+
+    async def acompact(self, chat_history: list, contact_id: str = None) -> str:
+        """Async counterpart of compact()."""
+        return await self.acompact_lines(format_history_lines(chat_history), contact_id)
+
+    def compact_lines(self, lines: List[str], contact_id: str = None, text: str = None) -> str:
+        """
+        compact() for already formatted lines (e.g. a server-side session);
+        `text` is their "\\n"-joined form, if the caller already has it.
+        """
+        plan = self._plan(lines, contact_id, text)
+        if isinstance(plan, str):
+            return plan
+        key, summary, start, end = plan
+        try:
+            with usage_tags(operation="summary"):
+                updated = self.llm.generate(self._summary_prompt(summary, lines[start:end]), max_tokens=self._summary_max_tokens())
+        except Exception as e:
+            return self._fallback(lines, e)
+        return self._finish(lines, key, summary, updated, end)
+
+    async def acompact_lines(self, lines: List[str], contact_id: str = None, text: str = None) -> str:
+        """Async counterpart of compact_lines()."""
+        plan = self._plan(lines, contact_id, text)
+        if isinstance(plan, str):
+            return plan
+        key, summary, start, end = plan
+        try:
+            with usage_tags(operation="summary"):
+                updated = await self.llm.agenerate(self._summary_prompt(summary, lines[start:end]), max_tokens=self._summary_max_tokens())
+        except Exception as e:
+            return self._fallback(lines, e)
+        return self._finish(lines, key, summary, updated, end)
+
+    def _plan(self, lines: List[str], contact_id: Optional[str], text: str = None) -> Union[str, Tuple[str, str, int, int]]:
+        """
+        Decide how to render a history.
+
+        Returns:
+            The final history string, or (cache key, current summary,
+            first message to summarize, end of messages to summarize)
+            when the summary must be created or extended first.
+        """
+        if not lines:
+            return NO_HISTORY
+        if text is None:
+            text = "\n".join(lines)
+        if not self.enabled or estimate_tokens(text) <= self.token_budget:
+            return text
+
+        self.compactions += 1
+        key = f"contact:{contact_id}" if contact_id else f"first:{_digest(lines[:1])}"
+        covered, summary = self._cached_summary(key, lines)
+
+        if covered:
+            rendered = self._render(summary, lines[covered:])
+            if estimate_tokens(rendered) <= self.token_budget:
+                self.summary_reuses += 1
+                return rendered
+
+        end = len(lines) - max(1, self.keep_turns)
+        if end <= covered:
+            # The recent turns alone overflow the budget; the summary can't absorb more
+            return self._trim(summary, lines[covered:])
+        return key, summary, covered, end
+
+    def _cached_summary(self, key: str, lines: List[str]) -> Tuple[int, str]:
+        """(messages covered, summary) if the cached summary is a prefix of this history, else (0, "")."""
+        with self._lock:
+            entry = self._summaries.get(key)
+            if entry is not None:
+                self._summaries.move_to_end(key)
+        if entry is None:
+            return 0, ""
+        covered, digest, summary = entry
+        if covered < len(lines) and _digest(lines[:covered]) == digest:
+            return covered, summary
+        return 0, ""
+
+    def _finish(self, lines: List[str], key: str, previous: str, summary: str, end: int) -> str:
+        summary = (summary or "").strip()
+        if not summary:
+            return self._fallback(lines, ValueError("empty summary"))
+
+        if previous:
+            self.summaries_extended += 1
+        else:
+            self.summaries_created += 1
+        with self._lock:
+            self._summaries[key] = (end, _digest(lines[:end]), summary)
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.max_contacts:
+                self._summaries.popitem(last=False)
+        return self._trim(summary, lines[end:])
+
+    def _summary_prompt(self, summary: str, new_lines: List[str]) -> str:
+        return SUMMARY_PROMPT.format(
+            existing_summary=summary or "(none yet)",
+            new_messages="\n".join(new_lines),
+            max_words=max(50, int(self.token_budget / 3 * 0.75))
+        )
+
+    def _summary_max_tokens(self) -> int:
+        # The summary targets a third of the budget; leave headroom so it isn't cut mid-sentence
+        return max(128, self.token_budget // 2)
+
+    @staticmethod
+    def _render(summary: str, recent: List[str], omitted: int = 0) -> str:
+        parts = []
+        if summary:
+            parts.append(f"{SUMMARY_LABEL}: {summary}")
+        if omitted:
+            parts.append(f"[... {omitted} earlier messages omitted ...]")
+        parts.extend(recent)
+        return "\n".join(parts)
+
+    def _trim(self, summary: str, recent: List[str]) -> str:
+        """Render summary + recent turns, dropping the oldest turns until within budget (always keeps one)."""
+        omitted = 0
+        rendered = self._render(summary, recent)
+        while estimate_tokens(rendered) > self.token_budget and omitted < len(recent) - 1:
+            omitted += 1
+            rendered = self._render(summary, recent[omitted:], omitted)
+        return rendered
+
+    def _fallback(self, lines: List[str], error: Exception) -> str:
+        """Summary unavailable: keep only the newest turns that fit."""
+        print(f"⚠️ History summary failed, truncating instead: {error}")
+        self.fallbacks += 1
+        return self._trim("", lines)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "tokenBudget": self.token_budget,
+            "keepTurns": self.keep_turns,
+            "cachedSummaries": len(self._summaries),
+            "compactions": self.compactions,
+            "summariesCreated": self.summaries_created,
+            "summariesExtended": self.summaries_extended,
+            "summaryReuses": self.summary_reuses,
+            "fallbacks": self.fallbacks
+        }
+
+
+# Singleton instance
+_compactor_instance = None
+
+def get_history_compactor() -> HistoryCompactor:
+    """Get or create history compactor instance."""
+    global _compactor_instance
+    if _compactor_instance is None:
+        _compactor_instance = HistoryCompactor()
+    return _compactor_instance
@@ -0,0 +1,249 @@
+import asyncio
+import os
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import EmptyPoolError
+from urllib3.util.retry import Retry
+
+
+class _PoolTimeoutMixin:
+    """Connection pool that waits at most `pool_timeout` seconds for a free connection."""
+
+    pool_timeout: Optional[float] = None
+
+    def _get_conn(self, timeout=None):
+        return super()._get_conn(timeout if timeout is not None else self.pool_timeout)
+
+
+class _PoolTimeoutAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose blocking pools give up after `pool_timeout`.
+
+    requests never passes a pool timeout to urllib3, so with pool_block=True
+    a request waits forever once every connection to the host is checked out.
+    """
+
+    def __init__(self, pool_timeout: float, **kwargs):
+        self.pool_timeout = pool_timeout
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: type(pool_cls.__name__, (_PoolTimeoutMixin, pool_cls), {"pool_timeout": self.pool_timeout})
+            for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+
+class HTTPTransport:
+    """
+    Shared keep-alive HTTP transport for outbound REST calls.
+
+    Keeps one pooled requests.Session per host so TCP+TLS handshakes are paid
+    once per connection instead of once per call. Every request gets a
+    (connect, read) timeout, and idempotent reads are retried with backoff.
+    Each host gets up to `pool_maxsize` connections (default: one per gunicorn
+    thread); a request that finds them all busy waits at most `pool_timeout`.
+    The async path mirrors this with one httpx.AsyncClient per host, used
+    from the shared event loop in app.services.async_runtime.
+    """
+
+    IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(
+        self,
+        pool_maxsize: int = None,
+        pool_timeout: float = None,
+        connect_timeout: float = None,
+        read_timeout: float = None,
+        max_retries: int = None
+    ):
+        self.pool_maxsize = pool_maxsize or int(os.getenv("HTTP_POOL_MAXSIZE") or os.getenv("GUNICORN_THREADS") or "256")
+        self.pool_timeout = pool_timeout or float(os.getenv("HTTP_POOL_TIMEOUT", "10"))
+        self.connect_timeout = connect_timeout or float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+        self.read_timeout = read_timeout or float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("HTTP_MAX_RETRIES", "2"))
+
+        self._sessions: Dict[str, requests.Session] = {}
+        self._request_counts: Dict[str, int] = {}
+        self._async_clients: Dict[str, httpx.AsyncClient] = {}
+        self._async_request_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self) -> tuple:
+        """Default (connect, read) timeout tuple."""
+        return (self.connect_timeout, self.read_timeout)
+
+    def _build_session(self) -> requests.Session:
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=self.max_retries,
+            status=self.max_retries,
+            backoff_factor=0.3,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=self.IDEMPOTENT_METHODS,
+            raise_on_status=False
+        )
+        adapter = _PoolTimeoutAdapter(
+            pool_timeout=self.pool_timeout,
+            pool_connections=1,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=True,  # cap concurrent connections per host
+            max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @staticmethod
+    def _host(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def session_for(self, url: str) -> requests.Session:
+        """Get (or lazily create) the pooled session for the URL's host."""
+        host = self._host(url)
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._build_session()
+                self._sessions[host] = session
+                self._request_counts[host] = 0
+            self._request_counts[host] += 1
+        return session
+
+    def request(self, method: str, url: str, timeout=None, **kwargs) -> requests.Response:
+        """Send a request over the host's pooled session."""
+        session = self.session_for(url)
+        try:
+            return session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+        except EmptyPoolError:
+            raise requests.exceptions.ConnectionError(
+                f"No free connection to {self._host(url)} within {self.pool_timeout}s "
+                f"(pool size {self.pool_maxsize})"
+            ) from None
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", url, **kwargs)
+
+    def async_client_for(self, url: str) -> httpx.AsyncClient:
+        """Get (or lazily create) the pooled async client for the URL's host."""
+        host = self._host(url)
+        with self._lock:
+            client = self._async_clients.get(host)
+            if client is None:
+                limits = httpx.Limits(
+                    max_connections=self.pool_maxsize,
+                    max_keepalive_connections=self.pool_maxsize
+                )
+                client = httpx.AsyncClient(
+                    limits=limits,
+                    timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout, pool=self.pool_timeout),
+                    transport=httpx.AsyncHTTPTransport(limits=limits, retries=self.max_retries)
+                )
+                self._async_clients[host] = client
+                self._async_request_counts[host] = 0
+            self._async_request_counts[host] += 1
+        return client
+
+    async def arequest(self, method: str, url: str, timeout=None, **kwargs) -> httpx.Response:
+        """
+        Async counterpart of request().
+
+        Accepts the same (connect, read) timeout tuple; idempotent reads are
+        retried on transport errors and gateway statuses with backoff.
+        """
+        client = self.async_client_for(url)
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0], pool=self.pool_timeout)
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+
+        attempts = 1 + (self.max_retries if method.upper() in self.IDEMPOTENT_METHODS else 0)
+        for attempt in range(attempts):
+            last_try = attempt == attempts - 1
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                if last_try:
+                    raise
+            else:
+                if response.status_code not in self.RETRY_STATUSES or last_try:
+                    return response
+            await asyncio.sleep(0.3 * (2 ** attempt))
+
+    async def aget(self, url: str, **kwargs) -> httpx.Response:
+        return await self.arequest("GET", url, **kwargs)
+
+    async def apost(self, url: str, **kwargs) -> httpx.Response:
+        return await self.arequest("POST", url, **kwargs)
+
+    async def apatch(self, url: str, **kwargs) -> httpx.Response:
+        return await self.arequest("PATCH", url, **kwargs)
+
+    def stats(self) -> dict:
+        """
+        Report connection reuse per host.
+
+        `connectionsOpened` counts TCP(+TLS) handshakes performed by the pool;
+        every other request went over a reused keep-alive connection.
+        """
+        hosts = {}
+        with self._lock:
+            sessions = dict(self._sessions)
+            counts = dict(self._request_counts)
+            async_counts = dict(self._async_request_counts)
+
+        for host, session in sessions.items():
+            opened = 0
+            pool_requests = 0
+            adapter = session.get_adapter(host)
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                opened += pool.num_connections
+                pool_requests += pool.num_requests
+            hosts[host] = {
+                "requests": counts.get(host, 0),
+                "connectionsOpened": opened,
+                "connectionsReused": max(pool_requests - opened, 0),
+                "poolMaxsize": self.pool_maxsize
+            }
+
+        for host, count in async_counts.items():
+            hosts.setdefault(host, {"poolMaxsize": self.pool_maxsize})["asyncRequests"] = count
+
+        return {
+            "poolTimeout": self.pool_timeout,
+            "connectTimeout": self.connect_timeout,
+            "readTimeout": self.read_timeout,
+            "hosts": hosts
+        }
+
+
+# Singleton instance
+_transport_instance: Optional[HTTPTransport] = None
+
+def get_http_transport() -> HTTPTransport:
+    """Get or create the shared HTTP transport."""
+    global _transport_instance
+    if _transport_instance is None:
+        _transport_instance = HTTPTransport()
+    return _transport_instance
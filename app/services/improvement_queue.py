@@ -0,0 +1,278 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+from app.services.async_runtime import run_sync
+from app.services.tracing import get_slow_request_log
+from app.services.usage import usage_tags
+from app.utils.paths import data_path
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class ImprovementQueue:
+    """
+    Durable queue of /improve-ai examples, drained by a pool of worker threads.
+
+    Jobs live in a local SQLite file, so accepted examples survive restarts.
+    Each worker claims every pending job (up to max_batch) in one
+    transaction, predicts replies for them concurrently, and learns from the
+    whole group with a single editor call. Several processes may share the
+    file: claims are atomic, and each records its owner and a lease that
+    the owning process renews while it is alive. Only jobs whose lease has
+    run out (their process died) go back to pending, so a worker booting
+    next to live ones never requeues batches they are still processing.
+    """
+
+    def __init__(self, path: str = None, workers: int = None, max_batch: int = None, poll_interval: float = None,
+                 lease: float = None, editor=None):
+        self.path = path if path is not None else improvement_queue_path()
+        self.workers = workers if workers is not None else int(os.getenv("IMPROVE_WORKERS", "2"))
+        self.max_batch = max_batch if max_batch is not None else int(os.getenv("IMPROVE_MAX_BATCH", "10"))
+        self.poll_interval = poll_interval if poll_interval is not None else float(os.getenv("IMPROVE_QUEUE_POLL", "2"))
+        self.lease = lease if lease is not None else float(os.getenv("IMPROVE_LEASE_SECONDS", "120"))
+        self.prediction_concurrency = int(os.getenv("BATCH_CONCURRENCY", "8"))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        # Can be injected (e.g. a fake for scripts/check_improvement_queue.py); defaults to the shared editor
+        self.editor = editor
+
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS improvement_jobs ("
+                " id TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " result TEXT,"
+                " error TEXT,"
+                " batch_id TEXT,"
+                " batch_size INTEGER,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " claimed_by TEXT,"
+                " claimed_at REAL)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(improvement_jobs)")}
+            for column, kind in (("claimed_by", "TEXT"), ("claimed_at", "REAL")):
+                if column not in columns:  # queue files created before leases
+                    conn.execute(f"ALTER TABLE improvement_jobs ADD COLUMN {column} {kind}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_improvement_jobs_status ON improvement_jobs (status, created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def start(self):
+        """Start the worker threads and the lease keeper (idempotent)."""
+        if self._threads:
+            return
+        for i in range(max(1, self.workers)):
+            thread = threading.Thread(target=self._run, name=f"improvement-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self._renew_leases, name="improvement-leases", daemon=True).start()
+        print(f"✅ Improvement queue started ({len(self._threads)} workers, batches of up to {self.max_batch})")
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def enqueue(self, client_message: str, chat_history: str, consultant_reply: str) -> str:
+        """Persist an example and return its job id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        payload = json.dumps({
+            "client_message": client_message,
+            "chat_history": chat_history,
+            "consultant_reply": consultant_reply
+        })
+        self._connect().execute(
+            "INSERT INTO improvement_jobs (id, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, PENDING, payload, now, now)
+        )
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Job status for the status endpoint, or None if unknown."""
+        row = self._connect().execute(
+            "SELECT status, result, error, batch_id, batch_size, created_at, updated_at FROM improvement_jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, result, error, batch_id, batch_size, created_at, updated_at = row
+        job = {"jobId": job_id, "status": status, "createdAt": created_at, "updatedAt": updated_at}
+        if result:
+            job["result"] = json.loads(result)
+        if error:
+            job["error"] = error
+        if batch_id:
+            job["batchId"] = batch_id
+            job["batchSize"] = batch_size
+        return job
+
+    def _claim(self) -> List[tuple]:
+        """Atomically requeue expired leases, then move up to max_batch pending jobs to running under ours."""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Running jobs whose owner stopped renewing belonged to a process that is gone
+            # (rows claimed before leases existed only have updated_at)
+            recovered = conn.execute(
+                "UPDATE improvement_jobs SET status = ?, claimed_by = NULL, claimed_at = NULL, updated_at = ?"
+                " WHERE status = ? AND COALESCE(claimed_at, updated_at) < ?",
+                (PENDING, now, RUNNING, now - self.lease)
+            ).rowcount
+            rows = conn.execute(
+                "SELECT id, payload FROM improvement_jobs WHERE status = ? ORDER BY created_at LIMIT ?",
+                (PENDING, self.max_batch)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE improvement_jobs SET status = ?, claimed_by = ?, claimed_at = ?, updated_at = ? WHERE id = ?",
+                    [(RUNNING, self.owner, now, now, job_id) for job_id, _ in rows]
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if recovered:
+            print(f"🔁 Requeued {recovered} improvement jobs whose worker stopped renewing its lease")
+        return [(job_id, json.loads(payload)) for job_id, payload in rows]
+
+    def _renew_leases(self):
+        """Keep this process's running jobs leased; stops (and so lets them expire) when the process dies."""
+        while not self._stop.wait(self.lease / 4):
+            try:
+                self._connect().execute(
+                    "UPDATE improvement_jobs SET claimed_at = ? WHERE status = ? AND claimed_by = ?",
+                    (time.time(), RUNNING, self.owner)
+                )
+            except Exception as e:
+                print(f"❌ Improvement queue lease renewal failed: {e}")
+
+    def _finish(self, job_id: str, status: str, batch_id: str, batch_size: int, result: dict = None, error: str = None):
+        self._connect().execute(
+            "UPDATE improvement_jobs SET status = ?, result = ?, error = ?, batch_id = ?, batch_size = ?, updated_at = ? WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, batch_id, batch_size, time.time(), job_id)
+        )
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                jobs = self._claim()
+            except Exception as e:
+                print(f"❌ Improvement queue claim failed: {e}")
+                jobs = []
+            if not jobs:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            # Background batches get their own trace (and slow-log entry), like requests,
+            # and their LLM spend is billed to the endpoint that accepted the jobs
+            slow_log = get_slow_request_log()
+            trace = slow_log.start("improvement batch", batchSize=len(jobs))
+            try:
+                with usage_tags(endpoint="improve-ai"):
+                    self._process(jobs)
+            finally:
+                slow_log.finish(*trace)
+
+    def _process(self, jobs: List[tuple]):
+        """Predict replies for a claimed group, then make one editor call for all of it."""
+        from app.services.prompt_editor import get_prompt_editor
+
+        batch_id = uuid.uuid4().hex[:12]
+        size = len(jobs)
+        print(f"🎯 Improvement batch {batch_id}: {size} examples")
+        finished = set()
+        try:
+            editor = self.editor or get_prompt_editor()
+            predictions = run_sync(editor.agenerate_replies(
+                [(payload["client_message"], payload["chat_history"]) for _, payload in jobs],
+                concurrency=self.prediction_concurrency
+            ))
+
+            learnable = []
+            for (job_id, payload), prediction in zip(jobs, predictions):
+                if "error" in prediction:
+                    self._finish(job_id, FAILED, batch_id, size, error=f"Prediction failed: {prediction['error']}")
+                    finished.add(job_id)
+                    continue
+                learnable.append((job_id, dict(payload, predicted_reply=prediction["aiReply"])))
+            if not learnable:
+                return
+
+            examples = [example for _, example in learnable]
+            result = editor.improve_from_example(**examples[0]) if len(examples) == 1 else editor.improve_from_batch(examples)
+
+            # Held-out scores of the candidate, when the evaluator gated the update
+            evaluation = {"evaluation": result["evaluation"]} if "evaluation" in result else {}
+            for job_id, example in learnable:
+                if result.get("success"):
+                    self._finish(job_id, DONE, batch_id, size, result={
+                        "predictedReply": example["predicted_reply"],
+                        "updatedPrompt": result.get("updated_prompt", ""),
+                        "changesMade": result.get("changes_made", ""),
+                        **evaluation
+                    })
+                else:
+                    self._finish(job_id, FAILED, batch_id, size,
+                                 result={"predictedReply": example["predicted_reply"], **evaluation},
+                                 error=result.get("error", "Failed to improve prompt"))
+                finished.add(job_id)
+
+        except Exception as e:
+            print(f"❌ Improvement batch {batch_id} failed: {e}")
+            for job_id, _ in jobs:
+                if job_id not in finished:
+                    self._finish(job_id, FAILED, batch_id, size, error=str(e))
+
+    def stats(self) -> dict:
+        counts = dict(self._connect().execute("SELECT status, COUNT(*) FROM improvement_jobs GROUP BY status").fetchall())
+        return {
+            "workers": len(self._threads),
+            "maxBatch": self.max_batch,
+            "pending": counts.get(PENDING, 0),
+            "running": counts.get(RUNNING, 0),
+            "done": counts.get(DONE, 0),
+            "failed": counts.get(FAILED, 0)
+        }
+
+
+def improvement_queue_path() -> str:
+    """Queue database file: IMPROVE_QUEUE_PATH, relative paths under DATA_DIR."""
+    return data_path(os.getenv("IMPROVE_QUEUE_PATH", "improvement_queue.db"))
+
+
+# Singleton instance
+_queue_instance = None
+_queue_lock = threading.Lock()
+
+def get_improvement_queue() -> ImprovementQueue:
+    """Get or create the improvement queue and make sure its workers are running."""
+    global _queue_instance
+    with _queue_lock:
+        if _queue_instance is None:
+            _queue_instance = ImprovementQueue()
+            _queue_instance.start()
+        return _queue_instance
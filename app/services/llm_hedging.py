@@ -0,0 +1,272 @@
+import asyncio
+import bisect
+import os
+import threading
+import time
+from contextlib import closing
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.services.async_runtime import run_sync
+from app.services.tracing import traced
+from app.services.llm_service import LLMService
+
+# Bucket upper bounds in seconds: 50ms growing by 20% per bucket up to ~3 minutes
+_BOUNDS: List[float] = []
+_bound = 0.05
+while _bound < 180:
+    _BOUNDS.append(round(_bound, 4))
+    _bound *= 1.2
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram for one provider and request size.
+
+    Counts are halved every `decay_every` samples so percentiles follow the
+    provider's recent behaviour instead of its all-time average.
+
+    Calls that were cancelled (lost a hedge race) or failed are recorded as
+    censored samples: the call took at least that long. Percentiles are
+    Kaplan-Meier estimates, so the slow calls hedging cuts short still pull
+    the percentile up instead of leaving only the fast winners behind.
+    """
+
+    def __init__(self, decay_every: int = 500):
+        self.decay_every = decay_every
+        self._counts = [0.0] * (len(_BOUNDS) + 1)
+        self._censored = [0.0] * (len(_BOUNDS) + 1)
+        self._total = 0.0
+        self._since_decay = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, censored: bool = False):
+        with self._lock:
+            counts = self._censored if censored else self._counts
+            counts[bisect.bisect_left(_BOUNDS, seconds)] += 1
+            self._total += 1
+            self._since_decay += 1
+            if self._since_decay >= self.decay_every:
+                self._counts = [count / 2 for count in self._counts]
+                self._censored = [count / 2 for count in self._censored]
+                self._total /= 2
+                self._since_decay = 0
+
+    @property
+    def count(self) -> float:
+        return self._total
+
+    @property
+    def censored(self) -> float:
+        return sum(self._censored)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        Upper bound of the bucket holding the p-th percentile, or None if empty.
+
+        When too many calls were censored for the percentile to be reached,
+        returns the longest censored time: a lower bound on it.
+        """
+        with self._lock:
+            at_risk = self._total
+            if at_risk <= 0:
+                return None
+            target = 1.0 - p / 100.0
+            survival = 1.0
+            last = 0
+            for i, (events, censored) in enumerate(zip(self._counts, self._censored)):
+                if events or censored:
+                    last = i
+                if events:
+                    survival *= 1.0 - events / at_risk
+                    if survival <= target + 1e-9:
+                        return _BOUNDS[min(i, len(_BOUNDS) - 1)]
+                at_risk -= events + censored
+            return _BOUNDS[min(last, len(_BOUNDS) - 1)]
+
+
+class HedgedLLMService(LLMService):
+    """
+    LLMService that spreads each call over several providers.
+
+    The first provider gets the request. If it hasn't answered by its own
+    p-th percentile latency (per request size), the next provider is sent
+    the same request; the first success wins and the others are cancelled.
+    A provider that fails hands over to the next one immediately. Streams
+    fail over only until the first chunk has been yielded.
+    """
+
+    def __init__(
+        self,
+        services: List[LLMService],
+        hedge_percentile: float = None,
+        hedge_min_samples: int = None,
+        default_delay: float = None,
+        max_in_flight: int = None
+    ):
+        if not services:
+            raise ValueError("HedgedLLMService needs at least one provider")
+        self.services = services
+        # Rate limits and logs are attributed to the primary provider
+        self.provider = services[0].provider
+        self.model_name = getattr(services[0], "model_name", "")
+        self.hedge_percentile = hedge_percentile if hedge_percentile is not None else float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+        self.hedge_min_samples = hedge_min_samples if hedge_min_samples is not None else int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+        self.default_delay = default_delay if default_delay is not None else float(os.getenv("LLM_HEDGE_DELAY", "5"))
+        self.max_in_flight = max_in_flight if max_in_flight is not None else int(os.getenv("LLM_HEDGE_MAX_IN_FLIGHT", "2"))
+
+        self._histograms: Dict[Tuple[str, int], LatencyHistogram] = {}
+        self._histograms_lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.wins: Dict[str, int] = {service.provider: 0 for service in services}
+
+        print(f"✅ Hedged LLM Service across providers: {', '.join(s.provider for s in services)}")
+
+    def _histogram(self, provider: str, max_tokens: int) -> LatencyHistogram:
+        key = (provider, max_tokens)
+        with self._histograms_lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            return histogram
+
+    def hedge_delay(self, provider: str, max_tokens: int) -> float:
+        """Seconds to wait on `provider` before sending a backup request."""
+        histogram = self._histogram(provider, max_tokens)
+        if histogram.count < self.hedge_min_samples:
+            return self.default_delay
+        return histogram.percentile(self.hedge_percentile)
+
+    async def _timed(self, service: LLMService, call: Callable[[LLMService], Awaitable[str]], max_tokens: int) -> str:
+        histogram = self._histogram(service.provider, max_tokens)
+        started = time.monotonic()
+        try:
+            result = await call(service)
+        except BaseException:
+            # Cancelled or failed: no answer yet after this long, so a lower bound on its latency
+            histogram.record(time.monotonic() - started, censored=True)
+            raise
+        histogram.record(time.monotonic() - started)
+        return result
+
+    async def _race(self, call: Callable[[LLMService], Awaitable[str]], max_tokens: int) -> str:
+        loop = asyncio.get_running_loop()
+        queue = list(self.services)
+        pending: Dict[asyncio.Task, LLMService] = {}
+        next_hedge_at = None
+        last_error: Optional[BaseException] = None
+        self.calls += 1
+
+        def launch():
+            nonlocal next_hedge_at
+            service = queue.pop(0)
+            pending[loop.create_task(self._timed(service, call, max_tokens))] = service
+            next_hedge_at = time.monotonic() + self.hedge_delay(service.provider, max_tokens)
+
+        launch()
+        try:
+            while pending:
+                can_hedge = queue and len(pending) < self.max_in_flight
+                timeout = max(0.0, next_hedge_at - time.monotonic()) if can_hedge else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    self.hedges += 1
+                    launch()
+                    continue
+
+                for task in done:
+                    service = pending.pop(task)
+                    if task.exception() is None:
+                        self.wins[service.provider] += 1
+                        if service is not self.services[0]:
+                            self.hedge_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+                    print(f"⚠️ LLM provider {service.provider} failed: {last_error}")
+
+                # Replace the failed request right away instead of waiting for a hedge timer
+                if queue and len(pending) < self.max_in_flight:
+                    self.failovers += 1
+                    launch()
+        finally:
+            for task in pending:
+                if task.done() and not task.cancelled():
+                    task.exception()  # lost the race; don't warn about it
+                else:
+                    task.cancel()
+
+        raise last_error
+
+    def generate(self, prompt: str, max_tokens: int = 1024) -> str:
+        """Generate a response, hedging across providers (runs on the shared event loop)."""
+        return run_sync(self.agenerate(prompt, max_tokens))
+
+    @traced("HedgedLLMService.generate")
+    async def agenerate(self, prompt: str, max_tokens: int = 1024) -> str:
+        """Async counterpart of generate()."""
+        return await self._race(lambda service: service.agenerate(prompt, max_tokens), max_tokens)
+
+    def stream(self, prompt: str, max_tokens: int = 1024, tags: dict = None) -> Iterator[str]:
+        """Stream from the first provider that produces a chunk."""
+        last_error: Optional[Exception] = None
+        for i, service in enumerate(self.services):
+            if i:
+                self.failovers += 1
+            started = False
+            try:
+                with closing(service.stream(prompt, max_tokens, tags)) as chunks:
+                    for chunk in chunks:
+                        started = True
+                        yield chunk
+                return
+            except Exception as e:
+                if started:
+                    raise
+                last_error = e
+                print(f"⚠️ LLM provider {service.provider} stream failed before the first chunk: {e}")
+        raise last_error
+
+    def stats(self) -> dict:
+        latency = {}
+        with self._histograms_lock:
+            histograms = list(self._histograms.items())
+        for (provider, max_tokens), histogram in histograms:
+            latency[f"{provider}:{max_tokens}"] = {
+                "samples": round(histogram.count, 1),
+                "censored": round(histogram.censored, 1),
+                "p50": histogram.percentile(50),
+                "p95": histogram.percentile(95),
+                "hedgeDelay": self.hedge_delay(provider, max_tokens)
+            }
+        return {
+            "providers": [service.provider for service in self.services],
+            "hedgePercentile": self.hedge_percentile,
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedgeWins": self.hedge_wins,
+            "failovers": self.failovers,
+            "wins": dict(self.wins),
+            "latency": latency
+        }
+
+
+def build_hedged_service(providers: List[str]) -> LLMService:
+    """
+    Build a HedgedLLMService over the named providers, skipping any that
+    can't be initialised (missing key or SDK). Falls back to a plain
+    LLMService when only one provider is usable.
+    """
+    services = []
+    for name in providers:
+        try:
+            services.append(LLMService(provider=name))
+        except ValueError as e:
+            print(f"⚠️ Skipping LLM provider {name}: {e}")
+    if not services:
+        raise ValueError(f"None of LLM_PROVIDERS could be initialised: {', '.join(providers)}")
+    if len(services) == 1:
+        return services[0]
+    return HedgedLLMService(services)
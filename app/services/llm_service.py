@@ -1,18 +1,68 @@
 import os
 import json
+import asyncio
+import random
+import time
+from typing import Iterator, Optional, Tuple
+
+import httpx
 import requests
-from typing import Optional
+
+from app.services.http_transport import get_http_transport
+from app.services.rate_limiter import estimate_request_tokens, get_rate_limiter, rate_limit_delay
+from app.services.circuit_breaker import get_circuit_breaker
+from app.services.metrics import EDITOR_JSON_FALLBACKS, LLM_CALL_SECONDS, LLM_RETRIES
+from app.services.tracing import redact, set_span_attributes, traced
+from app.services.usage import current_tags, record_llm_usage
 
 # Try to import optional LLM libraries
 try:
-    from groq import Groq
+    from groq import Groq, AsyncGroq
 except ImportError:
-    Groq = None
+    Groq = AsyncGroq = None
 
 try:
-    from anthropic import Anthropic
+    from anthropic import Anthropic, AsyncAnthropic
 except ImportError:
-    Anthropic = None
+    Anthropic = AsyncAnthropic = None
+
+GROQ_SYSTEM_MSG = (
+    "You are a helpful assistant. Follow ALL instructions exactly. "
+    "If chat history exists, DO NOT greet. Follow-up replies must have zero questions, "
+    "zero greetings, max 2 sentences (or one compact list). New chats max 3 sentences (or one compact list); "
+    "at most one short question only if blocking. Never use handholding or confirmation phrases like "
+    "'Would you like', 'Let me guide/walk you through', 'Can I help you', 'Shall I'. "
+    "End with a statement, not a question."
+)
+
+RETRYABLE_STATUSES = frozenset({408, 500, 502, 503, 504, 529})
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """An LLM call (including its retries) ran past LLM_DEADLINE."""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, connection errors and 5xx/overloaded responses; never client errors."""
+    if isinstance(error, (TimeoutError, requests.ConnectionError, requests.Timeout, httpx.TransportError)):
+        return True
+    # groq/openai/anthropic SDKs: APIConnectionError (and its APITimeoutError subclass)
+    if any(cls.__name__ == "APIConnectionError" for cls in type(error).__mro__):
+        return True
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    return status in RETRYABLE_STATUSES
+
+
+class _CallBudget:
+    """Per-call retry bookkeeping."""
+
+    __slots__ = ("deadline", "retries", "throttles")
+
+    def __init__(self, seconds: float):
+        self.deadline = time.monotonic() + seconds
+        self.retries = 0
+        self.throttles = 0
 
 
 class LLMService:
@@ -27,6 +77,19 @@ class LLMService:
             provider = self._detect_provider()
         
         self.provider = provider
+        self.http = get_http_transport()
+        # LLM completions take far longer than REST reads; keep a separate read timeout
+        self.timeout = float(os.getenv("LLM_TIMEOUT", "60"))
+        # Shared with every other LLMService for this provider in the process
+        self.limiter = get_rate_limiter(provider)
+        self.bulk_limiter = get_rate_limiter(provider, bulk=True)
+        self.rate_limit_retries = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3"))
+        self.breaker = get_circuit_breaker(provider)
+        # Total budget for one call including retries, so no request holds a worker forever
+        self.deadline = float(os.getenv("LLM_DEADLINE", "90"))
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", "2"))
+        self.backoff_base = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+        self.backoff_max = float(os.getenv("LLM_BACKOFF_MAX", "8"))
         self._init_client()
     
     def _detect_provider(self) -> str:
@@ -56,7 +119,8 @@ class LLMService:
                 raise ValueError("GROQ_API_KEY not found")
             if Groq is None:
                 raise ValueError("groq package not installed")
-            self.client = Groq(api_key=api_key)
+            self.client = Groq(api_key=api_key, timeout=self.timeout, max_retries=0)
+            self.async_client = AsyncGroq(api_key=api_key, timeout=self.timeout, max_retries=0)
             self.model_name = "llama-3.3-70b-versatile"
             
         elif self.provider == "anthropic":
@@ -65,81 +129,359 @@ class LLMService:
                 raise ValueError("ANTHROPIC_API_KEY not found")
             if Anthropic is None:
                 raise ValueError("anthropic package not installed")
-            self.client = Anthropic(api_key=api_key)
+            self.client = Anthropic(api_key=api_key, timeout=self.timeout, max_retries=0)
+            self.async_client = AsyncAnthropic(api_key=api_key, timeout=self.timeout, max_retries=0)
             self.model_name = "claude-3-sonnet-20240229"
             
         elif self.provider == "openai":
-            from openai import OpenAI
+            from openai import OpenAI, AsyncOpenAI
             api_key = os.getenv("OPENAI_API_KEY")
             if not api_key:
                 raise ValueError("OPENAI_API_KEY not found")
-            self.client = OpenAI(api_key=api_key)
+            self.client = OpenAI(api_key=api_key, timeout=self.timeout, max_retries=0)
+            self.async_client = AsyncOpenAI(api_key=api_key, timeout=self.timeout, max_retries=0)
             self.model_name = "gpt-4o-mini"
         
         print(f"✅ LLM Service initialized with provider: {self.provider}")
     
+    def _google_url(self, method: str = "generateContent") -> str:
+        return f"https://generativelanguage.googleapis.com/v1beta/models/{self.model_name}:{method}?key={self.api_key}"
+    
+    def _google_payload(self, prompt: str, max_tokens: int) -> dict:
+        return {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "maxOutputTokens": max_tokens,
+                "temperature": 0.5  # Lower temperature for more consistent responses
+            }
+        }
+    
+    def _chat_kwargs(self, prompt: str, max_tokens: int) -> dict:
+        """Build the create() kwargs for the chat-completions style providers."""
+        if self.provider == "groq":
+            return {
+                "model": self.model_name,
+                "messages": [
+                    {"role": "system", "content": GROQ_SYSTEM_MSG},
+                    {"role": "user", "content": prompt}
+                ],
+                "max_tokens": max_tokens,
+                "temperature": 0.3  # Even lower temperature for better instruction following
+            }
+        if self.provider == "anthropic":
+            return {
+                "model": self.model_name,
+                "max_tokens": max_tokens,
+                "messages": [{"role": "user", "content": prompt}]
+            }
+        return {
+            "model": self.model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens
+        }
+    
+    def _usage(self, response) -> Optional[Tuple[int, int]]:
+        """(input, output) tokens the provider reported for a response, if any."""
+        if self.provider == "google":
+            meta = response.get("usageMetadata") or {}
+            if "promptTokenCount" not in meta:
+                return None
+            return meta["promptTokenCount"], meta.get("candidatesTokenCount", 0)
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return None
+        if self.provider == "anthropic":
+            return usage.input_tokens, usage.output_tokens
+        return usage.prompt_tokens, usage.completion_tokens
+    
+    def _record_usage(self, prompt: str, text: str, usage: Optional[Tuple[int, int]], tags: dict = None):
+        entry = record_llm_usage(self.provider, self.model_name, prompt, text, usage, tags)
+        set_span_attributes(inputTokens=entry["inputTokens"], outputTokens=entry["outputTokens"])
+    
+    def _generate_once(self, prompt: str, max_tokens: int, timeout: float) -> Tuple[str, Optional[Tuple[int, int]]]:
+        """One provider call; returns (text, reported (input, output) tokens or None)."""
+        if self.provider == "google":
+            response = self.http.post(
+                self._google_url(),
+                json=self._google_payload(prompt, max_tokens),
+                timeout=(self.http.connect_timeout, timeout)
+            )
+            response.raise_for_status()
+            result = response.json()
+            return result["candidates"][0]["content"]["parts"][0]["text"], self._usage(result)
+        
+        elif self.provider == "anthropic":
+            response = self.client.messages.create(timeout=timeout, **self._chat_kwargs(prompt, max_tokens))
+            return response.content[0].text, self._usage(response)
+        
+        elif self.provider in ("groq", "openai"):
+            response = self.client.chat.completions.create(timeout=timeout, **self._chat_kwargs(prompt, max_tokens))
+            return response.choices[0].message.content, self._usage(response)
+    
+    async def _agenerate_once(self, prompt: str, max_tokens: int, timeout: float) -> Tuple[str, Optional[Tuple[int, int]]]:
+        if self.provider == "google":
+            response = await self.http.apost(
+                self._google_url(),
+                json=self._google_payload(prompt, max_tokens),
+                timeout=(self.http.connect_timeout, timeout)
+            )
+            response.raise_for_status()
+            result = response.json()
+            return result["candidates"][0]["content"]["parts"][0]["text"], self._usage(result)
+        
+        elif self.provider == "anthropic":
+            response = await self.async_client.messages.create(timeout=timeout, **self._chat_kwargs(prompt, max_tokens))
+            return response.content[0].text, self._usage(response)
+        
+        elif self.provider in ("groq", "openai"):
+            response = await self.async_client.chat.completions.create(timeout=timeout, **self._chat_kwargs(prompt, max_tokens))
+            return response.choices[0].message.content, self._usage(response)
+    
+    def _deadline_exceeded(self) -> LLMDeadlineExceeded:
+        return LLMDeadlineExceeded(f"{self.provider} call exceeded its {self.deadline:.0f}s deadline")
+    
+    def _attempt_timeout(self, call: _CallBudget) -> float:
+        """Read timeout for the next attempt: the per-call timeout, capped by the deadline."""
+        remaining = call.deadline - time.monotonic()
+        if remaining <= 0:
+            raise self._deadline_exceeded()
+        return min(self.timeout, remaining)
+    
+    def _observe_call(self, start: float, error: Exception = None):
+        """Record one provider attempt in dtv_llm_call_duration_seconds."""
+        if error is None:
+            outcome = "ok"
+        elif rate_limit_delay(error) is not None:
+            outcome = "throttled"
+        elif isinstance(error, (TimeoutError, requests.Timeout, httpx.TimeoutException)) or "Timeout" in type(error).__name__:
+            outcome = "timeout"
+        else:
+            outcome = "error"
+        LLM_CALL_SECONDS.observe(time.perf_counter() - start, provider=self.provider, model=self.model_name, outcome=outcome)
+    
+    def _record_failure(self, error: Exception) -> str:
+        """Report a failed attempt to the limiter/breaker; returns "throttled", "retryable" or "fatal"."""
+        throttle = rate_limit_delay(error)
+        if throttle is not None:
+            self.breaker.record_success()  # provider is up, just busy
+            # Any 429 means the provider is saturated, so bulk work backs off too
+            self.limiter.record_throttle(throttle)
+            self.bulk_limiter.record_throttle(throttle)
+            return "throttled"
+        if is_retryable(error):
+            self.breaker.record_failure()
+            return "retryable"
+        self.breaker.record_success()
+        return "fatal"
+    
+    def _retry_after(self, error: Exception, call: _CallBudget) -> Optional[float]:
+        """
+        Decide what to do after a failed attempt.
+        
+        Returns seconds to sleep before retrying, or None to give up.
+        429s go to the rate limiter (which paces the retry itself);
+        timeouts, connection errors and 5xx count against the circuit
+        breaker and are retried with full-jitter exponential backoff;
+        anything else (bad request, auth, parse errors) is not retried.
+        """
+        kind = self._record_failure(error)
+        set_span_attributes(lastError=type(error).__name__)
+        if kind == "throttled":
+            call.throttles += 1
+            set_span_attributes(throttles=call.throttles)
+            if call.throttles > self.rate_limit_retries:
+                return None
+            rpm = self.limiter.stats()["requestsPerMinute"]
+            print(f"⏳ {self.provider} rate limited; retrying " + (f"at {rpm} req/min" if rpm else "after its Retry-After"))
+            LLM_RETRIES.inc(provider=self.provider, reason="throttled")
+            return 0.0
+        
+        if kind == "fatal":
+            return None
+        
+        call.retries += 1
+        set_span_attributes(retries=call.retries)
+        if call.retries > self.max_retries:
+            return None
+        backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (call.retries - 1)))
+        if time.monotonic() + backoff >= call.deadline:
+            return None
+        print(f"🔁 {self.provider} attempt {call.retries} failed ({error}); retrying in {backoff:.2f}s")
+        LLM_RETRIES.inc(provider=self.provider, reason="transient")
+        return backoff
+    
+    def _limiters(self, tags: dict = None) -> tuple:
+        """Limiters a call must pass: bulk calls (tagged bulk=True) also go through the bulk limiter."""
+        tags = current_tags() if tags is None else tags
+        return (self.bulk_limiter, self.limiter) if tags.get("bulk") else (self.limiter,)
+
+    @traced("LLMService.generate")
     def generate(self, prompt: str, max_tokens: int = 1024) -> str:
-        """Generate a response from the LLM."""
+        """
+        Generate a response from the LLM.
+        
+        Every call goes through the provider's shared rate limiter and
+        circuit breaker, and is bounded by LLM_DEADLINE seconds in total.
+        Retryable failures are retried with jittered exponential backoff.
+        """
+        set_span_attributes(provider=self.provider, model=self.model_name, maxTokens=max_tokens, prompt=redact(prompt))
+        tokens = estimate_request_tokens(prompt, max_tokens)
+        limiters = self._limiters()
+        call = _CallBudget(self.deadline)
+        while True:
+            self.breaker.before_call()
+            if not all(limiter.wait(tokens, call.deadline) for limiter in limiters):
+                # Rate limited (or paused by a 429) past the deadline: fail now rather than late
+                self.breaker.release_probe()
+                raise self._deadline_exceeded()
+            start = time.perf_counter()
+            try:
+                result, usage = self._generate_once(prompt, max_tokens, self._attempt_timeout(call))
+            except LLMDeadlineExceeded:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                self._observe_call(start, e)
+                backoff = self._retry_after(e, call)
+                if backoff is None:
+                    print(f"❌ LLM Error ({self.provider}): {e}")
+                    raise
+                time.sleep(backoff)
+                continue
+            self._observe_call(start)
+            self._record_usage(prompt, result, usage)
+            self.breaker.record_success()
+            for limiter in limiters:
+                limiter.record_success()
+            return result
+    
+    @traced("LLMService.generate")
+    async def agenerate(self, prompt: str, max_tokens: int = 1024) -> str:
+        """Async counterpart of generate(); must run on the shared event loop."""
+        set_span_attributes(provider=self.provider, model=self.model_name, maxTokens=max_tokens, prompt=redact(prompt))
+        tokens = estimate_request_tokens(prompt, max_tokens)
+        limiters = self._limiters()
+        call = _CallBudget(self.deadline)
+        while True:
+            self.breaker.before_call()
+            for limiter in limiters:
+                if not await limiter.acquire(tokens, call.deadline):
+                    self.breaker.release_probe()
+                    raise self._deadline_exceeded()
+            start = time.perf_counter()
+            try:
+                timeout = self._attempt_timeout(call)
+                # Hard stop even if the client ignores its timeout
+                result, usage = await asyncio.wait_for(self._agenerate_once(prompt, max_tokens, timeout), timeout)
+            except (LLMDeadlineExceeded, asyncio.CancelledError):
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                self._observe_call(start, e)
+                backoff = self._retry_after(e, call)
+                if backoff is None:
+                    print(f"❌ LLM Error ({self.provider}): {e}")
+                    raise
+                await asyncio.sleep(backoff)
+                continue
+            self._observe_call(start)
+            self._record_usage(prompt, result, usage)
+            self.breaker.record_success()
+            for limiter in limiters:
+                limiter.record_success()
+            return result
+    
+    def stream(self, prompt: str, max_tokens: int = 1024, tags: dict = None) -> Iterator[str]:
+        """
+        Generate a response from the LLM, yielding text chunks as they arrive.
+        
+        Closing the generator early closes the upstream stream, so callers
+        that stop reading also stop paying for tokens. Streams are not
+        retried (chunks may already have been shown), but failures still
+        count against the circuit breaker. Token usage is estimated from
+        the text streamed so far and recorded with `tags` on top of the
+        usage tags current when the stream started (the generator may be
+        finished from another context).
+        """
+        tags = {**current_tags(), **(tags or {})}
+        self.breaker.before_call()
+        limiters = self._limiters(tags)
+        deadline = time.monotonic() + self.deadline
+        if not all(limiter.wait(estimate_request_tokens(prompt, max_tokens), deadline) for limiter in limiters):
+            self.breaker.release_probe()
+            raise self._deadline_exceeded()
+        start = time.perf_counter()
+        chunks = []
         try:
             if self.provider == "google":
-                url = f"https://generativelanguage.googleapis.com/v1beta/models/{self.model_name}:generateContent?key={self.api_key}"
-                payload = {
-                    "contents": [{"parts": [{"text": prompt}]}],
-                    "generationConfig": {
-                        "maxOutputTokens": max_tokens,
-                        "temperature": 0.5  # Lower temperature for more consistent responses
-                    }
-                }
-                response = requests.post(url, json=payload)
-                response.raise_for_status()
-                result = response.json()
-                return result["candidates"][0]["content"]["parts"][0]["text"]
-            
-            elif self.provider == "groq":
-                system_msg = (
-                    "You are a helpful assistant. Follow ALL instructions exactly. "
-                    "If chat history exists, DO NOT greet. Follow-up replies must have zero questions, "
-                    "zero greetings, max 2 sentences (or one compact list). New chats max 3 sentences (or one compact list); "
-                    "at most one short question only if blocking. Never use handholding or confirmation phrases like "
-                    "'Would you like', 'Let me guide/walk you through', 'Can I help you', 'Shall I'. "
-                    "End with a statement, not a question."
+                response = self.http.post(
+                    self._google_url("streamGenerateContent") + "&alt=sse",
+                    json=self._google_payload(prompt, max_tokens),
+                    timeout=(self.http.connect_timeout, self.timeout),
+                    stream=True
                 )
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": system_msg},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=max_tokens,
-                    temperature=0.3  # Even lower temperature for better instruction following
-                )
-                return response.choices[0].message.content
+                try:
+                    response.raise_for_status()
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith("data:"):
+                            continue
+                        event = json.loads(line[5:])
+                        for candidate in event.get("candidates", [])[:1]:
+                            for part in candidate.get("content", {}).get("parts", []):
+                                if part.get("text"):
+                                    chunks.append(part["text"])
+                                    yield part["text"]
+                finally:
+                    response.close()
             
             elif self.provider == "anthropic":
-                response = self.client.messages.create(
-                    model=self.model_name,
-                    max_tokens=max_tokens,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                return response.content[0].text
+                with self.client.messages.stream(**self._chat_kwargs(prompt, max_tokens)) as stream:
+                    for text in stream.text_stream:
+                        chunks.append(text)
+                        yield text
             
-            elif self.provider == "openai":
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=max_tokens
+            elif self.provider in ("groq", "openai"):
+                stream = self.client.chat.completions.create(
+                    stream=True, **self._chat_kwargs(prompt, max_tokens)
                 )
-                return response.choices[0].message.content
+                try:
+                    for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            chunks.append(chunk.choices[0].delta.content)
+                            yield chunk.choices[0].delta.content
+                finally:
+                    stream.close()
+            
+            self._observe_call(start)
+            self._record_usage(prompt, "".join(chunks), None, tags)
+            self.breaker.record_success()
                 
+        except GeneratorExit:
+            # Caller stopped reading; the provider was answering fine
+            self._observe_call(start)
+            self._record_usage(prompt, "".join(chunks), None, tags)
+            self.breaker.record_success()
+            raise
         except Exception as e:
+            self._observe_call(start, e)
+            self._record_failure(e)
             print(f"❌ LLM Error ({self.provider}): {e}")
             raise
     
+    def stats(self) -> dict:
+        return {"providers": [self.provider], "model": self.model_name}
+    
     def generate_json(self, prompt: str) -> dict:
         """Generate a response and parse it as JSON."""
+        return self._parse_json_response(self.generate(prompt))
+    
+    async def agenerate_json(self, prompt: str) -> dict:
+        """Async counterpart of generate_json()."""
+        return self._parse_json_response(await self.agenerate(prompt))
+    
+    def _parse_json_response(self, response: str) -> dict:
+        """Parse an editor response as JSON, tolerating common LLM formatting issues."""
         import re
-        response = self.generate(prompt)
-        
         try:
             # Try to extract JSON from response
             # Look for JSON object in the response
@@ -159,7 +501,9 @@ class LLMService:
                 # Replace actual newlines inside strings with \n
                 fixed_json = re.sub(r'(?<!\\)\n', '\\n', json_str)
                 try:
-                    return json.loads(fixed_json)
+                    parsed = json.loads(fixed_json)
+                    EDITOR_JSON_FALLBACKS.inc(method="newline_fix")
+                    return parsed
                 except json.JSONDecodeError:
                     pass
                 
@@ -168,6 +512,7 @@ class LLMService:
                 changes_match = re.search(r'"changes_made"\s*:\s*"([^"]*)"', json_str)
                 
                 if prompt_match:
+                    EDITOR_JSON_FALLBACKS.inc(method="regex")
                     return {
                         "prompt": prompt_match.group(1).replace('\\n', '\n').replace('\\"', '"'),
                         "changes_made": changes_match.group(1) if changes_match else "Updated prompt"
@@ -178,6 +523,7 @@ class LLMService:
             pass
         
         # Return raw response if JSON parsing fails
+        EDITOR_JSON_FALLBACKS.inc(method="failed")
         return {"error": "Failed to parse JSON", "raw_response": response}
 
 
@@ -185,8 +531,18 @@ class LLMService:
 _llm_instance: Optional[LLMService] = None
 
 def get_llm_service(provider: str = None) -> LLMService:
-    """Get or create LLM service instance."""
+    """
+    Get or create LLM service instance.
+    
+    With LLM_PROVIDERS listing several providers (e.g. "groq,google") and no
+    explicit provider, calls are hedged across them (see llm_hedging).
+    """
     global _llm_instance
     if _llm_instance is None or (provider and _llm_instance.provider != provider):
-        _llm_instance = LLMService(provider=provider)
+        providers = [p.strip() for p in os.getenv("LLM_PROVIDERS", "").split(",") if p.strip()]
+        if provider is None and len(providers) > 1:
+            from app.services.llm_hedging import build_hedged_service
+            _llm_instance = build_hedged_service(providers)
+        else:
+            _llm_instance = LLMService(provider=provider or (providers[0] if providers else None))
     return _llm_instance
\ No newline at end of file
@@ -0,0 +1,280 @@
+import bisect
+import inspect
+import threading
+import time
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Seconds; covers sub-millisecond stages (render, post-processing) up to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._labelset = frozenset(self.labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if labels.keys() != self._labelset:
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    """Monotonic count per label set."""
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        # An unlabelled counter is exported as 0 from the start
+        self._values: Dict[Tuple[str, ...], float] = {} if self.labelnames else {(): 0}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket latency histogram per label set."""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        self._observe(self._key(labels), value)
+
+    def _observe(self, key: Tuple[str, ...], value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def observer(self, **labels) -> Callable[[float], None]:
+        """observe() with the labels resolved once, for call sites on the per-request hot path."""
+        key = self._key(labels)
+        return lambda value: self._observe(key, value)
+
+    def time(self, **labels) -> "_Timer":
+        """Observe the wall-clock duration of the with-block (also when it raises)."""
+        return _Timer(self.observer(**labels))
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return sum(entry[0]) if entry else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = self._header()
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(round(total, 6))}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    """Context manager behind Histogram.time() (a plain class: @contextmanager costs microseconds per use)."""
+
+    __slots__ = ("_observe", "_start")
+
+    def __init__(self, observe: Callable[[float], None]):
+        self._observe = observe
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._observe(time.perf_counter() - self._start)
+
+
+class MetricsRegistry:
+    """
+    Process-wide metrics rendered in the Prometheus text format (0.0.4).
+
+    Collectors are callbacks run at scrape time that turn counters the
+    services already keep (cache hits, ...) into extra lines, so nothing is
+    counted twice.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], List[str]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                print(f"⚠️ Metrics collector failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def counter_lines(name: str, documentation: str, labelname: str, values: Dict[str, float]) -> List[str]:
+    """Render a one-label counter from values kept elsewhere (for collectors)."""
+    return [f"# HELP {name} {documentation}", f"# TYPE {name} counter"] + [
+        f'{name}{{{labelname}="{_escape(label)}"}} {_format_value(value)}' for label, value in sorted(values.items())
+    ]
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "dtv_stage_duration_seconds",
+    "Time spent in each stage of a request: prompt_fetch, history_format, retrieval, template_render, postprocess, db_write, session_write.",
+    ("stage",)
+)
+LLM_CALL_SECONDS = REGISTRY.histogram(
+    "dtv_llm_call_duration_seconds",
+    "Duration of each LLM provider call attempt, by outcome (ok, throttled, error, timeout).",
+    ("provider", "model", "outcome")
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "dtv_http_request_duration_seconds",
+    "Time to the response headers, by route and status code.",
+    ("route", "method", "status")
+)
+LLM_RETRIES = REGISTRY.counter(
+    "dtv_llm_retries_total",
+    "LLM call attempts that were retried, by reason (throttled = 429, transient = timeout/connection/5xx).",
+    ("provider", "reason")
+)
+PROMPT_CONFLICTS = REGISTRY.counter(
+    "dtv_prompt_conflicts_total",
+    "Prompt writes that lost the version compare-and-swap to another writer (retried on the new head up to PROMPT_CAS_RETRIES times)."
+)
+LLM_TOKENS = REGISTRY.counter(
+    "dtv_llm_tokens_total",
+    "Tokens billed by LLM providers, by endpoint and direction (input, output).",
+    ("provider", "model", "endpoint", "direction")
+)
+LLM_COST_USD = REGISTRY.counter(
+    "dtv_llm_cost_usd_total",
+    "Estimated LLM spend in USD from the pricing table (LLM_PRICING), by endpoint.",
+    ("provider", "model", "endpoint")
+)
+EDITOR_JSON_FALLBACKS = REGISTRY.counter(
+    "dtv_editor_json_fallbacks_total",
+    "Editor responses that were not valid JSON, by how they were recovered (newline_fix, regex, failed).",
+    ("method",)
+)
+
+PROMPT_EVALUATIONS = REGISTRY.counter(
+    "dtv_prompt_evaluations_total",
+    "Candidate prompts scored against the held-out set, by outcome (promoted, rejected, inconclusive).",
+    ("outcome",)
+)
+
+
+_stage_observers: Dict[str, Callable[[float], None]] = {}
+
+
+def stage_observer(stage: str) -> Callable[[float], None]:
+    """
+    Record seconds for one stage into dtv_stage_duration_seconds.
+
+    For microsecond-scale stages, time inline with time.perf_counter() and
+    call this, rather than paying for a context manager on every call.
+    """
+    observe = _stage_observers.get(stage)
+    if observe is None:
+        observe = _stage_observers.setdefault(stage, STAGE_SECONDS.observer(stage=stage))
+    return observe
+
+
+def time_stage(stage: str) -> _Timer:
+    """Context manager timing one request stage into dtv_stage_duration_seconds."""
+    return _Timer(stage_observer(stage))
+
+
+def timed_stage(stage: str):
+    """Decorator form of time_stage() for sync and async functions."""
+    observe = stage_observer(stage)
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    observe(time.perf_counter() - start)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
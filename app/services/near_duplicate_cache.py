@@ -0,0 +1,208 @@
+import math
+import os
+import re
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from app.utils.text_vectorizer import HashingVectorizer, np
+
+SIGNATURE_BITS = 128
+
+# Apostrophes, in-word hyphens/slashes and thousands separators: "I'm"/"Im", "re-entering"/"reentering", "400,000"/"400000"
+_JOINERS = re.compile(r"['\u2019]|(?<=\w)[-/](?=\w)|(?<=\d),(?=\d{3})")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+class SimHashIndex:
+    """
+    Append-only nearest-neighbour index over unit vectors.
+
+    Every vector gets a 128-bit SimHash signature (signs of random
+    projections). A lookup XORs the query signature against all stored
+    signatures, keeps rows within a Hamming radius derived from the cosine
+    threshold, and re-ranks only those with an exact dot product. The
+    signature scan is two vectorized popcounts over contiguous uint64
+    arrays, which keeps lookups sub-millisecond at 100k entries.
+    """
+
+    MAX_CANDIDATES = 256
+
+    def __init__(self, dim: int, threshold: float, capacity: int = 1024, seed: int = 7):
+        self.dim = dim
+        self.threshold = threshold
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((dim, SIGNATURE_BITS)).astype(np.float32)
+
+        # Expected Hamming distance at the threshold angle, plus 3 standard deviations
+        p = math.acos(max(-1.0, min(1.0, threshold))) / math.pi
+        self.radius = int(SIGNATURE_BITS * p + 3 * math.sqrt(SIGNATURE_BITS * p * (1 - p))) + 1
+
+        self._size = 0
+        self._vectors = np.zeros((capacity, dim), dtype=np.float16)
+        self._sig_lo = np.zeros(capacity, dtype=np.uint64)
+        self._sig_hi = np.zeros(capacity, dtype=np.uint64)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _signature(self, vector: "np.ndarray") -> Tuple[int, int]:
+        packed = np.packbits((vector @ self._planes) > 0, bitorder="little").view(np.uint64)
+        return packed[0], packed[1]
+
+    def _grow(self):
+        capacity = self._vectors.shape[0] * 2
+        self._vectors = np.resize(self._vectors, (capacity, self.dim))
+        self._sig_lo = np.resize(self._sig_lo, capacity)
+        self._sig_hi = np.resize(self._sig_hi, capacity)
+
+    def add(self, vector: "np.ndarray") -> int:
+        """Append a unit vector and return its row id."""
+        if self._size == self._vectors.shape[0]:
+            self._grow()
+        row = self._size
+        self._vectors[row] = vector
+        self._sig_lo[row], self._sig_hi[row] = self._signature(vector)
+        self._size += 1
+        return row
+
+    def nearest(self, vector: "np.ndarray") -> Optional[Tuple[int, float]]:
+        """Return (row, cosine) of the best match at or above the threshold, if any."""
+        if self._size == 0:
+            return None
+        lo, hi = self._signature(vector)
+        distance = _popcount(self._sig_lo[:self._size] ^ lo)
+        distance += _popcount(self._sig_hi[:self._size] ^ hi)
+
+        candidates = np.flatnonzero(distance <= self.radius)
+        if len(candidates) == 0:
+            return None
+        if len(candidates) > self.MAX_CANDIDATES:
+            nearest = np.argpartition(distance[candidates], self.MAX_CANDIDATES)[:self.MAX_CANDIDATES]
+            candidates = candidates[nearest]
+
+        scores = self._vectors[candidates].astype(np.float32) @ vector
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        if score < self.threshold:
+            return None
+        return int(candidates[best]), score
+
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8) if np is not None else None
+
+
+def _popcount(values: "np.ndarray") -> "np.ndarray":
+    """Per-element popcount of a uint64 array, as uint8."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    # NumPy < 2.0: byte lookup table
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+class NearDuplicateCache:
+    """
+    Optional cache for first-turn (new chat) messages that repeat an earlier
+    one almost verbatim.
+
+    This is not a semantic cache: HashingVectorizer only sees surface
+    features, so genuine paraphrases score far below the threshold, while
+    different questions sharing boilerplate can come close to it. The cache
+    therefore only serves a reply when a message is a near-duplicate of a
+    cached one after normalization: case, punctuation, spacing,
+    apostrophes, greetings, emoji and filler stopwords are ignored, a
+    neighbour must have cosine similarity >= threshold (keep it high), and
+    any numbers in the two messages must be identical ("500,000 THB" and
+    "800,000 THB" never share a reply). Entries are scoped to one prompt
+    version: the first lookup under a new version starts an empty index.
+    """
+
+    def __init__(self, enabled: bool = None, threshold: float = None, max_entries: int = None, dim: int = 256):
+        if enabled is None:
+            enabled = os.getenv("NEAR_DUPLICATE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+        if enabled and np is None:
+            print("⚠️ NEAR_DUPLICATE_CACHE_ENABLED is set but numpy is not installed; near-duplicate cache disabled")
+            enabled = False
+
+        self.enabled = enabled
+        self.threshold = threshold if threshold is not None else float(os.getenv("NEAR_DUPLICATE_CACHE_THRESHOLD", "0.9"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("NEAR_DUPLICATE_CACHE_MAX_ENTRIES", "100000"))
+        self.vectorizer = HashingVectorizer(dim=dim) if enabled else None
+
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._index: Optional[SimHashIndex] = None
+        self._replies: List[str] = []
+        self._numbers: List[tuple] = []
+
+        self.hits = 0
+        self.misses = 0
+        self._lookup_seconds = 0.0
+
+    @staticmethod
+    def normalize(client_message: str) -> str:
+        """Join what writers split inconsistently; tokenize() then handles case, punctuation and stopwords."""
+        return _JOINERS.sub("", client_message)
+
+    @staticmethod
+    def numbers(client_message: str) -> tuple:
+        """The numbers in a (normalized) message, in order."""
+        return tuple(_NUMBER.findall(client_message))
+
+    def _index_for(self, version: str) -> SimHashIndex:
+        """Index for this prompt version, replacing any older one. Caller holds the lock."""
+        if self._version != version or self._index is None:
+            self._version = version
+            self._index = SimHashIndex(self.vectorizer.dim, self.threshold)
+            self._replies = []
+            self._numbers = []
+        return self._index
+
+    def get(self, version: str, client_message: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        text = self.normalize(client_message)
+        vector = self.vectorizer.transform_one(text)
+        with self._lock:
+            index = self._index_for(version)
+            started = time.perf_counter()
+            match = index.nearest(vector)
+            self._lookup_seconds += time.perf_counter() - started
+            if match is None or self._numbers[match[0]] != self.numbers(text):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._replies[match[0]]
+
+    def set(self, version: str, client_message: str, reply: str):
+        if not self.enabled or not reply:
+            return
+        text = self.normalize(client_message)
+        vector = self.vectorizer.transform_one(text)
+        with self._lock:
+            index = self._index_for(version)
+            if len(index) >= self.max_entries:
+                return
+            index.add(vector)
+            self._replies.append(reply)
+            self._numbers.append(self.numbers(text))
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._index = None
+            self._replies = []
+            self._numbers = []
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "version": self._version,
+            "entries": len(self._index) if self._index is not None else 0,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "avgLookupMs": round(self._lookup_seconds / lookups * 1000, 4) if lookups else 0.0
+        }
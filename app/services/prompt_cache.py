@@ -0,0 +1,248 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Optional, Tuple, Union
+
+
+def compute_prompt_version(content: str, version_id: Optional[int] = None) -> str:
+    """
+    Version key for prompt content: the database version id when there is
+    one ("v42"), otherwise a short, stable hash of the content.
+    """
+    if version_id is not None:
+        return f"v{version_id}"
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:12]
+
+
+class PromptMissing(LookupError):
+    """The loader positively reported that the prompt does not exist (as opposed to failing)."""
+
+
+class PromptCache:
+    """
+    In-process cache for the live chatbot prompt.
+
+    Entries are keyed by prompt version and served for `ttl` seconds. Once an
+    entry is stale it keeps being served while a single background thread
+    refreshes it (stale-while-revalidate). Only when an entry is older than
+    `max_stale` does a reader block on the loader; if that load fails too,
+    the stale prompt is still returned rather than failing the request.
+
+    A loader returns None (or empty content) when the prompt does not exist
+    and raises when it cannot tell; get() reports the two differently when
+    nothing is cached, so callers only create the prompt when it is missing.
+
+    Cold misses are single-flight: concurrent readers wait for one load
+    instead of each hitting the database. Every invalidate() bumps a
+    generation counter, and a load only stores its result if no
+    invalidation happened while it ran, so a refresh that read the old
+    prompt cannot put it back after a write.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], Union[None, str, Tuple[str, Optional[int]]]],
+        ttl: float = None,
+        max_stale: float = None
+    ):
+        self.loader = loader
+        self.ttl = ttl if ttl is not None else float(os.getenv("PROMPT_CACHE_TTL", "60"))
+        self.max_stale = max_stale if max_stale is not None else float(os.getenv("PROMPT_CACHE_MAX_STALE", "3600"))
+
+        self._lock = threading.Lock()
+        self._content: Optional[str] = None
+        self._version: Optional[str] = None
+        self._loaded_at = 0.0
+        self._refreshing = False
+        self._generation = 0
+        self._missing = False  # the last load found no prompt (rather than failing)
+        self._flight: Optional[threading.Event] = None  # cold load in progress (sync readers)
+        self._aflight: Optional[asyncio.Future] = None  # cold load in progress (async readers)
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.invalidations = 0
+
+    def get(self) -> Tuple[str, str]:
+        """
+        Return (content, version) for the current prompt.
+
+        Raises:
+            PromptMissing: If nothing is cached and the loader found no prompt.
+            LookupError: If nothing is cached and the loader failed.
+        """
+        with self._lock:
+            content, version = self._content, self._version
+            age = time.monotonic() - self._loaded_at
+
+            if content is not None and age < self.ttl:
+                self.hits += 1
+                return content, version
+
+            if content is not None and age < self.max_stale:
+                self.stale_hits += 1
+                self._schedule_refresh()
+                return content, version
+
+            self.misses += 1
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = threading.Event()
+
+        # Cold or expired beyond max_stale: one caller loads, the others wait for it
+        loaded = None
+        if leader:
+            try:
+                loaded = self._refresh()
+            finally:
+                with self._lock:
+                    self._flight = None
+                flight.set()
+        else:
+            flight.wait()
+
+        with self._lock:
+            if self._content is not None:
+                return self._content, self._version
+        if loaded:
+            return loaded  # invalidated while loading: serve it, but it was not stored
+        if content is not None:
+            return content, version
+        if self._missing:
+            raise PromptMissing("Prompt does not exist")
+        raise LookupError("Prompt could not be loaded")
+
+    async def aget(self, aloader: Callable[[], Awaitable[Union[None, str, Tuple[str, Optional[int]]]]]) -> Optional[Tuple[str, str]]:
+        """
+        Async counterpart of get(): the fresh or stale entry, or else one
+        load through `aloader` shared by every concurrent cold-miss caller.
+
+        Returns None when there is nothing cached and that load found
+        nothing (the caller falls back to get()).
+        """
+        cached = self.get_nowait()
+        if cached:
+            return cached
+        flight = self._aflight
+        if flight is None or flight.done():
+            flight = self._aflight = asyncio.ensure_future(self._aload(aloader))
+        # Shielded: a cancelled caller must not cancel the load the others wait on
+        return await asyncio.shield(flight)
+
+    async def _aload(self, aloader) -> Optional[Tuple[str, str]]:
+        generation = self._generation
+        try:
+            loaded = await aloader()
+        except Exception as e:
+            print(f"⚠️ Prompt cache refresh failed: {e}")
+            return None
+        content, version_id = loaded if isinstance(loaded, tuple) else (loaded, None)
+        if not content:
+            return None
+        return content, self.set(content, version_id, generation)
+
+    def get_nowait(self) -> Optional[Tuple[str, str]]:
+        """
+        Non-blocking variant of get() for the async path.
+
+        Returns the fresh or stale entry, or None when a load is required
+        (see aget() for the loading variant).
+        """
+        with self._lock:
+            age = time.monotonic() - self._loaded_at
+            if self._content is not None and age < self.ttl:
+                self.hits += 1
+                return self._content, self._version
+            if self._content is not None and age < self.max_stale:
+                self.stale_hits += 1
+                self._schedule_refresh()
+                return self._content, self._version
+            self.misses += 1
+            return None
+
+    def set(self, content: str, version_id: Optional[int] = None, generation: int = None) -> str:
+        """
+        Store freshly loaded or written prompt content and return its version.
+
+        A load passes the `generation` it started under; if invalidate() ran
+        since, the content is stale and is not stored.
+        """
+        version = compute_prompt_version(content, version_id)
+        with self._lock:
+            if generation is None or generation == self._generation:
+                self._content = content
+                self._version = version
+                self._loaded_at = time.monotonic()
+        return version
+
+    def invalidate(self):
+        """Drop the cached prompt so the next read goes to the database."""
+        with self._lock:
+            self._content = None
+            self._version = None
+            self._loaded_at = 0.0
+            self._generation += 1
+            self.invalidations += 1
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._version
+
+    def stats(self) -> dict:
+        """Return hit/miss counters for the stats endpoint."""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "version": self._version,
+            "ttlSeconds": self.ttl,
+            "hits": self.hits,
+            "staleHits": self.stale_hits,
+            "misses": self.misses,
+            "hitRatio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            "refreshes": self.refreshes,
+            "refreshErrors": self.refresh_errors,
+            "invalidations": self.invalidations
+        }
+
+    def _schedule_refresh(self):
+        """Start a background refresh unless one is already running. Caller holds the lock."""
+        if self._refreshing:
+            return
+        self._refreshing = True
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self._refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _refresh(self) -> Optional[Tuple[str, str]]:
+        """Call the loader and store its result unless invalidated meanwhile. Returns (content, version), or None on failure."""
+        with self._lock:
+            generation = self._generation
+        try:
+            loaded = self.loader()
+            failed = False
+        except Exception as e:
+            print(f"⚠️ Prompt cache refresh failed: {e}")
+            loaded, failed = None, True
+
+        # Loaders return either content or (content, database version id)
+        content, version_id = loaded if isinstance(loaded, tuple) else (loaded, None)
+        if not content:
+            with self._lock:
+                self.refresh_errors += 1
+                self._missing = not failed
+            return None
+
+        version = self.set(content, version_id, generation)
+        with self._lock:
+            self.refreshes += 1
+        return content, version
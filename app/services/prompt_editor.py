@@ -1,7 +1,31 @@
 from app.services.llm_service import get_llm_service
-from app.services.db_service import get_db_service
-from app.prompts.base_prompts import EDITOR_PROMPT, MANUAL_EDITOR_PROMPT, CHATBOT_PROMPT
+from app.services.db_service import get_db_service, PromptVersionConflict
+from app.services.prompt_cache import PromptCache, PromptMissing, compute_prompt_version
+from app.services.prompt_evaluator import PromptEvaluator
+from app.services.reply_stream import IncrementalReplyProcessor
+from app.services.reply_rules import DEFAULT_RULES, ReplyRules, parse_banned_phrases
+from app.services.reply_cache import ReplyCache
+from app.services.near_duplicate_cache import NearDuplicateCache
+from app.services.retrieval import get_retrieval_service
+from app.services.metrics import PROMPT_CONFLICTS, REGISTRY, counter_lines, stage_observer, time_stage, timed_stage
+from app.services.history_compactor import get_history_compactor
+from app.services.tracing import traced
+from app.services.usage import usage_tags
+from app.prompts.base_prompts import (
+    EDITOR_PROMPT,
+    MANUAL_EDITOR_PROMPT,
+    CHATBOT_PROMPT,
+    BATCH_EDITOR_PROMPT,
+    BATCH_EXAMPLE_TEMPLATE,
+    RETRIEVED_EXAMPLES_TEMPLATE,
+    RETRIEVED_EXAMPLE_TEMPLATE
+)
+import asyncio
 import re
+import time
+from typing import Callable, Iterator, List, Optional, Tuple
+
+_observe_postprocess = stage_observer("postprocess")
 
 
 class PromptEditorService:
@@ -10,19 +34,176 @@ class PromptEditorService:
     Compares AI predictions with real consultant replies to refine the chatbot prompt.
     """
     
-    def __init__(self, llm_provider: str = None):
-        self.llm = get_llm_service(provider=llm_provider)
-        self.db = get_db_service()
+    def __init__(self, llm_provider: str = None, llm=None, db=None, retrieval=None):
+        # llm/db/retrieval can be injected (e.g. fakes for benchmarks); defaults are the shared services
+        self.llm = llm or get_llm_service(provider=llm_provider)
+        self.db = db or get_db_service()
+        self.prompt_cache = PromptCache(loader=lambda: self.db.load_prompt_head("chatbot_prompt"))
+        self.reply_cache = ReplyCache()
+        self.near_duplicate_cache = NearDuplicateCache()
+        self.retrieval = retrieval or get_retrieval_service()
+        self.evaluator = PromptEvaluator(self.llm, self._build_eval_prompt)
+        self._reply_rules: Optional[ReplyRules] = None
+        self._reply_rules_version: Optional[str] = None
     
     def get_current_prompt(self) -> str:
-        """Get the current chatbot prompt from database, or initialize with default."""
-        prompt = self.db.get_prompt("chatbot_prompt")
-        if not prompt:
+        """Get the current chatbot prompt (cached), or initialize with default."""
+        return self.get_prompt_with_version()[0]
+
+    @timed_stage("prompt_fetch")
+    def get_prompt_with_version(self) -> Tuple[str, str]:
+        """Get (prompt, version) for the current chatbot prompt."""
+        try:
+            return self.prompt_cache.get()
+        except PromptMissing:
             # Initialize with base prompt if not exists
             self.db.create_prompt("chatbot_prompt", CHATBOT_PROMPT)
-            return CHATBOT_PROMPT
-        return prompt
+            head = self.db.get_prompt_head("chatbot_prompt")
+            if head:
+                return head[0], self.prompt_cache.set(*head)
+        except LookupError:
+            pass
+        # Database unreachable with nothing cached: serve the base prompt without caching it,
+        # so the next request reads the database again
+        print("⚠️ Prompt could not be loaded; serving the base prompt uncached")
+        return CHATBOT_PROMPT, compute_prompt_version(CHATBOT_PROMPT)
+
+    async def aget_current_prompt(self) -> str:
+        """Async counterpart of get_current_prompt(); never blocks the loop on a cache hit."""
+        return (await self.aget_prompt_with_version())[0]
+
+    @timed_stage("prompt_fetch")
+    async def aget_prompt_with_version(self) -> Tuple[str, str]:
+        """Async counterpart of get_prompt_with_version()."""
+        cached = await self.prompt_cache.aget(lambda: self.db.aget_prompt_head("chatbot_prompt"))
+        if cached:
+            return cached
+
+        # Missing or DB failure: reuse the sync path's stale fallback / initialization
+        return await asyncio.to_thread(self.get_prompt_with_version)
+
+    def invalidate_prompt_cache(self):
+        """Force the next prompt read to hit the database and drop replies cached under the old prompt."""
+        self.prompt_cache.invalidate()
+        self._reply_rules_version = None
+        self.reply_cache.clear()
+        self.near_duplicate_cache.clear()
+
+    def _lookup_reply(self, version: str, chat_history: str, client_message: str) -> Tuple[str, Optional[str]]:
+        """
+        Check the reply caches before calling the LLM.
+        
+        Returns:
+            (exact cache key, cached reply or None)
+        """
+        cache_key = ReplyCache.make_key(version, chat_history, client_message)
+        cached = self.reply_cache.get(cache_key)
+        if cached is None and self._is_new_chat(chat_history):
+            cached = self.near_duplicate_cache.get(version, client_message)
+        return cache_key, cached
+
+    def _remember_reply(self, cache_key: str, version: str, chat_history: str, client_message: str, reply: str):
+        """Store a freshly generated reply in the reply caches."""
+        self.reply_cache.set(cache_key, reply)
+        if self._is_new_chat(chat_history):
+            self.near_duplicate_cache.set(version, client_message, reply)
+
+    @staticmethod
+    def _is_new_chat(chat_history: str) -> bool:
+        return chat_history.strip() == "No previous messages."
+
+    @timed_stage("prompt_fetch")
+    def _prompt_head(self) -> Tuple[str, Optional[int]]:
+        """(prompt, database version id) read fresh, as the base for an edit."""
+        head = self.db.get_prompt_head("chatbot_prompt")
+        if head:
+            return head
+        return self.get_current_prompt(), None
+
+    @timed_stage("prompt_fetch")
+    async def _aprompt_head(self) -> Tuple[str, Optional[int]]:
+        """Async counterpart of _prompt_head()."""
+        head = await self.db.aget_prompt_head("chatbot_prompt")
+        if head:
+            return head
+        return await self.aget_current_prompt(), None
+
+    def _save_prompt(self, content: str, expected_version_id: Optional[int], change_note: str = "") -> bool:
+        """
+        Write a new chatbot prompt on top of `expected_version_id` and
+        invalidate the cached copy.
+        
+        Raises:
+            PromptVersionConflict: The prompt changed since it was read
+        """
+        try:
+            return self.db.commit_prompt_version("chatbot_prompt", content, expected_version_id, str(change_note)[:1000])
+        finally:
+            self.invalidate_prompt_cache()
+
+    async def _asave_prompt(self, content: str, expected_version_id: Optional[int], change_note: str = "") -> bool:
+        """Async counterpart of _save_prompt()."""
+        try:
+            return await self.db.acommit_prompt_version("chatbot_prompt", content, expected_version_id, str(change_note)[:1000])
+        finally:
+            self.invalidate_prompt_cache()
+
+    def _improve(self, build_editor_input: Callable[[str], str]) -> dict:
+        """
+        Run the editor on the current prompt and commit its candidate.
+        
+        If another improvement landed while the editor was running, the
+        edit is rebased: the editor runs again on the new head, so both
+        changes survive instead of the later write clobbering the earlier.
+        
+        With the evaluator enabled, a candidate that scores worse than the
+        current prompt on the held-out set is not committed.
+        """
+        attempts = self.db.cas_retries + 1
+        for attempt in range(1, attempts + 1):
+            current_prompt, head = self._prompt_head()
+            with usage_tags(operation="editor", prompt_version=compute_prompt_version(current_prompt, head)):
+                result = self.llm.generate_json(build_editor_input(current_prompt))
+            
+            candidate = self._candidate_from_editor(result)
+            if not candidate:
+                return self._editor_failure(result)
+            if self.evaluator.enabled:
+                candidate["evaluation"] = self.evaluator.compare(current_prompt, candidate["prompt"])
+                if not candidate["evaluation"]["promote"]:
+                    return self._regression_failure(candidate)
+            try:
+                success = self._save_prompt(candidate["prompt"], head, candidate["changes_made"])
+                return self._improvement_response(success, candidate)
+            except PromptVersionConflict:
+                PROMPT_CONFLICTS.inc()
+                print(f"🔁 Prompt changed during improvement (attempt {attempt}/{attempts}); rebasing on the new version")
+        return self._conflict_failure(attempts)
+
+    async def _aimprove(self, build_editor_input: Callable[[str], str]) -> dict:
+        """Async counterpart of _improve()."""
+        attempts = self.db.cas_retries + 1
+        for attempt in range(1, attempts + 1):
+            current_prompt, head = await self._aprompt_head()
+            with usage_tags(operation="editor", prompt_version=compute_prompt_version(current_prompt, head)):
+                result = await self.llm.agenerate_json(build_editor_input(current_prompt))
+            
+            candidate = self._candidate_from_editor(result)
+            if not candidate:
+                return self._editor_failure(result)
+            if self.evaluator.enabled:
+                candidate["evaluation"] = await self.evaluator.acompare(current_prompt, candidate["prompt"])
+                if not candidate["evaluation"]["promote"]:
+                    return self._regression_failure(candidate)
+            try:
+                success = await self._asave_prompt(candidate["prompt"], head, candidate["changes_made"])
+                return self._improvement_response(success, candidate)
+            except PromptVersionConflict:
+                PROMPT_CONFLICTS.inc()
+                print(f"🔁 Prompt changed during improvement (attempt {attempt}/{attempts}); rebasing on the new version")
+        return self._conflict_failure(attempts)
     
+    @traced("PromptEditorService.improve_from_example")
     def improve_from_example(
         self,
         client_message: str,
@@ -42,46 +223,139 @@ class PromptEditorService:
         Returns:
             dict with success status, updated_prompt, and changes description
         """
-        current_prompt = self.get_current_prompt()
+        return self._improve(lambda current_prompt: self._build_editor_input(
+            current_prompt, client_message, chat_history, consultant_reply, predicted_reply
+        ))
+    
+    @traced("PromptEditorService.improve_from_example")
+    async def aimprove_from_example(
+        self,
+        client_message: str,
+        chat_history: str,
+        consultant_reply: str,
+        predicted_reply: str
+    ) -> dict:
+        """Async counterpart of improve_from_example()."""
+        return await self._aimprove(lambda current_prompt: self._build_editor_input(
+            current_prompt, client_message, chat_history, consultant_reply, predicted_reply
+        ))
+    
+    @traced("PromptEditorService.improve_from_batch")
+    def improve_from_batch(self, examples: List[dict]) -> dict:
+        """
+        Improve the prompt from several (predicted, actual) examples with one editor call.
         
-        # Build the editor prompt
-        editor_input = EDITOR_PROMPT.format(
+        Args:
+            examples: dicts with client_message, chat_history, consultant_reply
+                and predicted_reply (same meaning as improve_from_example's args)
+            
+        Returns:
+            dict with success status, updated_prompt, and changes description
+        """
+        if not examples:
+            return {"success": False, "error": "No examples to learn from", "raw_response": ""}
+        
+        return self._improve(lambda current_prompt: self._build_batch_editor_input(current_prompt, examples))
+    
+    def _build_batch_editor_input(self, current_prompt: str, examples: List[dict]) -> str:
+        """Fill BATCH_EDITOR_PROMPT with every example in the batch."""
+        rendered = "\n".join(
+            BATCH_EXAMPLE_TEMPLATE.format(
+                number=number,
+                chat_history=example["chat_history"],
+                client_message=example["client_message"],
+                consultant_reply=example["consultant_reply"],
+                predicted_reply=example["predicted_reply"]
+            )
+            for number, example in enumerate(examples, start=1)
+        )
+        return BATCH_EDITOR_PROMPT.format(
+            current_prompt=current_prompt,
+            example_count=len(examples),
+            examples=rendered
+        )
+    
+    def _build_editor_input(
+        self,
+        current_prompt: str,
+        client_message: str,
+        chat_history: str,
+        consultant_reply: str,
+        predicted_reply: str
+    ) -> str:
+        """Fill EDITOR_PROMPT with one (predicted, actual) example."""
+        return EDITOR_PROMPT.format(
             current_prompt=current_prompt,
             chat_history=chat_history,
             client_message=client_message,
             consultant_reply=consultant_reply,
             predicted_reply=predicted_reply
         )
+    
+    def _candidate_from_editor(self, result: dict) -> dict:
+        """
+        Pick the new prompt out of an editor result.
         
-        # Get improvement suggestions from LLM
-        result = self.llm.generate_json(editor_input)
-        
+        Returns:
+            dict with prompt and changes_made, or None if nothing usable came back
+        """
         if "prompt" in result and result["prompt"]:
-            # Update database with new prompt
-            success = self.db.update_prompt("chatbot_prompt", result["prompt"])
-            
             return {
-                "success": success,
-                "updated_prompt": result["prompt"],
+                "prompt": result["prompt"],
                 "changes_made": result.get("changes_made", "No description provided")
             }
 
         # Fallback: try to salvage a prompt from raw LLM output when JSON parsing fails
         fallback = self._extract_prompt_from_raw(result.get("raw_response", ""))
         if fallback:
-            success = self.db.update_prompt("chatbot_prompt", fallback)
             return {
-                "success": success,
-                "updated_prompt": fallback,
+                "prompt": fallback,
                 "changes_made": result.get("changes_made", "Extracted prompt from raw response")
             }
-        
+        return None
+    
+    def _improvement_response(self, success: bool, candidate: dict) -> dict:
+        response = {
+            "success": success,
+            "updated_prompt": candidate["prompt"],
+            "changes_made": candidate["changes_made"]
+        }
+        if "evaluation" in candidate:
+            response["evaluation"] = candidate["evaluation"]
+        return response
+    
+    def _regression_failure(self, candidate: dict) -> dict:
+        evaluation = candidate["evaluation"]
+        if evaluation["outcome"] == "inconclusive":
+            error = "Could not score the current prompt on the held-out set; update not applied"
+        elif evaluation["delta"] >= -evaluation["threshold"]:
+            error = (f"Candidate prompt scored {evaluation['candidate']['score']:.4f}, too far below the best prompt so far "
+                     f"({evaluation['anchor']['version']}: {evaluation['anchor']['score']:.4f}); update not applied")
+        else:
+            error = (f"Candidate prompt scored {evaluation['candidate']['score']:.4f} vs "
+                     f"{evaluation['baseline']['score']:.4f} on {evaluation['baseline']['pairs']} held-out pairs; update not applied")
+        return {
+            "success": False,
+            "error": error,
+            "changes_made": candidate["changes_made"],
+            "evaluation": evaluation,
+            "raw_response": ""
+        }
+    
+    def _editor_failure(self, result: dict) -> dict:
         return {
             "success": False,
             "error": result.get("error", "Failed to generate improved prompt"),
             "raw_response": result.get("raw_response", "")
         }
     
+    def _conflict_failure(self, attempts: int) -> dict:
+        return {
+            "success": False,
+            "error": f"Prompt kept changing concurrently; gave up after {attempts} attempts",
+            "raw_response": ""
+        }
+    
     def improve_manually(self, instructions: str) -> dict:
         """
         Improve the prompt based on manual user instructions.
@@ -92,8 +366,19 @@ class PromptEditorService:
         Returns:
             dict with success status and updated_prompt
         """
+        attempts = self.db.cas_retries + 1
+        for attempt in range(1, attempts + 1):
+            current_prompt, head = self._prompt_head()
+            try:
+                return self._improve_manually_from(current_prompt, head, instructions)
+            except PromptVersionConflict:
+                PROMPT_CONFLICTS.inc()
+                print(f"🔁 Prompt changed during manual edit (attempt {attempt}/{attempts}); reapplying on the new version")
+        return self._conflict_failure(attempts)
+    
+    def _improve_manually_from(self, current_prompt: str, head: Optional[int], instructions: str) -> dict:
+        """One manual-edit attempt against a specific prompt version."""
         import re
-        current_prompt = self.get_current_prompt()
         
         # Build the manual editor prompt
         editor_input = MANUAL_EDITOR_PROMPT.format(
@@ -102,11 +387,12 @@ class PromptEditorService:
         )
         
         # Get updated prompt from LLM
-        result = self.llm.generate_json(editor_input)
+        with usage_tags(operation="editor", prompt_version=compute_prompt_version(current_prompt, head)):
+            result = self.llm.generate_json(editor_input)
         
         if "prompt" in result and result["prompt"]:
             # Update database with new prompt
-            success = self.db.update_prompt("chatbot_prompt", result["prompt"])
+            success = self._save_prompt(result["prompt"], head, "manual: " + instructions[:200])
             
             return {
                 "success": success,
@@ -130,7 +416,7 @@ class PromptEditorService:
                 extracted = extracted.replace('\\n', '\n').replace('\\"', '"').rstrip('"')
                 
                 if len(extracted) > 100:  # Reasonable prompt length
-                    success = self.db.update_prompt("chatbot_prompt", extracted)
+                    success = self._save_prompt(extracted, head, "manual: " + instructions[:200])
                     return {
                         "success": success,
                         "updated_prompt": extracted[:200] + "..." if len(extracted) > 200 else extracted
@@ -142,6 +428,7 @@ class PromptEditorService:
             "raw_response": raw[:500] if raw else ""
         }
     
+    @traced("PromptEditorService.generate_reply")
     def generate_reply(self, client_message: str, chat_history: str) -> str:
         """
         Generate a reply using the current prompt.
@@ -153,58 +440,189 @@ class PromptEditorService:
         Returns:
             Generated reply string
         """
-        current_prompt = self.get_current_prompt()
+        current_prompt, version = self.get_prompt_with_version()
+        
+        # Same (or, for new chats, near-identical) conversation under this prompt version: skip the LLM call
+        cache_key, cached = self._lookup_reply(version, chat_history, client_message)
+        if cached is not None:
+            return cached
         
         # Format the full prompt
-        full_prompt = current_prompt.format(
-            chat_history=chat_history,
-            client_message=client_message
-        )
-        raw_reply = self.llm.generate(full_prompt, max_tokens=220)
-        return self._postprocess_reply(raw_reply, chat_history)
+        full_prompt = self._build_reply_prompt(current_prompt, client_message, chat_history)
+        with usage_tags(operation="reply", prompt_version=version):
+            raw_reply = self.llm.generate(full_prompt, max_tokens=220)
+        reply = self._postprocess_reply(raw_reply, chat_history, self._rules_for(version))
+        self._remember_reply(cache_key, version, chat_history, client_message, reply)
+        return reply
+
+    @traced("PromptEditorService.generate_reply")
+    async def agenerate_reply(self, client_message: str, chat_history: str) -> str:
+        """Async counterpart of generate_reply()."""
+        current_prompt, version = await self.aget_prompt_with_version()
+        
+        cache_key, cached = self._lookup_reply(version, chat_history, client_message)
+        if cached is not None:
+            return cached
+        
+        full_prompt = self._build_reply_prompt(current_prompt, client_message, chat_history)
+        with usage_tags(operation="reply", prompt_version=version):
+            raw_reply = await self.llm.agenerate(full_prompt, max_tokens=220)
+        reply = self._postprocess_reply(raw_reply, chat_history, await self._arules_for(version))
+        self._remember_reply(cache_key, version, chat_history, client_message, reply)
+        return reply
+
+    async def agenerate_replies(
+        self,
+        items: List[Tuple[str, str]],
+        concurrency: int = 8
+    ) -> List[dict]:
+        """
+        Generate replies for many (client_message, chat_history) pairs at once.
+        
+        The prompt is read once for the whole batch. LLM calls run concurrently,
+        at most `concurrency` at a time and within the provider's rate limit.
+        
+        Args:
+            items: (client_message, formatted chat_history) tuples
+            concurrency: Maximum number of in-flight LLM calls
+            
+        Returns:
+            One dict per item, in input order: {"aiReply": ...} or {"error": ...}
+        """
+        current_prompt, version = await self.aget_prompt_with_version()
+        rules = await self._arules_for(version)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        
+        async def run_one(client_message: str, chat_history: str) -> dict:
+            cache_key, cached = self._lookup_reply(version, chat_history, client_message)
+            if cached is not None:
+                return {"aiReply": cached}
+            async with semaphore:
+                try:
+                    full_prompt = self._build_reply_prompt(current_prompt, client_message, chat_history)
+                    raw_reply = await self.llm.agenerate(full_prompt, max_tokens=220)
+                    reply = self._postprocess_reply(raw_reply, chat_history, rules)
+                    self._remember_reply(cache_key, version, chat_history, client_message, reply)
+                    return {"aiReply": reply}
+                except Exception as e:
+                    return {"error": str(e)}
+        
+        # gather() copies the context into each task, so every call carries these tags
+        with usage_tags(operation="reply", prompt_version=version):
+            return await asyncio.gather(*(run_one(message, history) for message, history in items))
+
+    def stream_reply(self, client_message: str, chat_history: str, tags: dict = None) -> Iterator[str]:
+        """
+        Generate a reply using the current prompt, yielding post-processed
+        sentences as soon as the LLM has produced them.
+        
+        Args:
+            client_message: The client's message
+            chat_history: Formatted chat history string
+            tags: Usage tags to bill the call to (streams are usually consumed
+                after the request's own tags were reset)
+            
+        Yields:
+            Reply sentences, in order (join with spaces for the full reply)
+        """
+        current_prompt, version = self.get_prompt_with_version()
+        
+        cache_key, cached = self._lookup_reply(version, chat_history, client_message)
+        if cached is not None:
+            yield cached
+            return
+        
+        full_prompt = self._build_reply_prompt(current_prompt, client_message, chat_history)
+        processor = IncrementalReplyProcessor(chat_history, self._rules_for(version))
+        chunks = self.llm.stream(full_prompt, max_tokens=220, tags={**(tags or {}), "operation": "reply", "prompt_version": version})
+        try:
+            for chunk in chunks:
+                yield from processor.feed(chunk)
+                if processor.done:
+                    # Sentence cap reached: stop reading (and paying for) the completion
+                    break
+            yield from processor.finish()
+        finally:
+            chunks.close()
+        self._remember_reply(cache_key, version, chat_history, client_message, processor.text)
 
-    def _postprocess_reply(self, reply: str, chat_history: str) -> str:
+    def _build_reply_prompt(self, current_prompt: str, client_message: str, chat_history: str, retrieve: bool = True) -> str:
+        """
+        Fill the chatbot prompt and, when a retrieval index is loaded, inject
+        the most similar real exchanges as few-shot examples just before the
+        CHAT HISTORY section (or at the end if the prompt has none).
+        """
+        fields = {"chat_history": chat_history, "client_message": client_message}
+        examples = None
+        if retrieve:
+            with time_stage("retrieval"):
+                examples = self.retrieval.search(client_message)
+        with time_stage("template_render"):
+            if not examples:
+                return current_prompt.format(**fields)
+            
+            block = RETRIEVED_EXAMPLES_TEMPLATE.format(
+                examples="\n\n".join(RETRIEVED_EXAMPLE_TEMPLATE.format(**example) for example in examples)
+            )
+            # Split the template on a literal marker so each half formats on its own
+            split_at = current_prompt.find("CHAT HISTORY:")
+            if split_at < 0:
+                return current_prompt.format(**fields) + "\n\n" + block
+            return current_prompt[:split_at].format(**fields) + block + current_prompt[split_at:].format(**fields)
+
+    def _build_eval_prompt(self, current_prompt: str, client_message: str, chat_history: str) -> str:
+        """
+        The reply prompt as the evaluator scores it: without retrieved
+        examples, which could be the held-out replies themselves and change
+        with every /improve-ai call (invalidating cached predictions).
+        """
+        return self._build_reply_prompt(current_prompt, client_message, chat_history, retrieve=False)
+
+    def _postprocess_reply(self, reply: str, chat_history: str, rules: ReplyRules = None) -> str:
         """Enforce greeting/question bans and length caps."""
-        is_follow_up = chat_history.strip() != "No previous messages."
-
-        # Strip leading greetings on follow-ups
-        if is_follow_up:
-            reply = re.sub(r"^\s*(sawasdee[^\w]*|hello[^\w]*|hi[^\w]*|hey[^\w]*)", "", reply, flags=re.IGNORECASE)
-
-        # Split into lines to handle lists
-        lines = [line.strip() for line in reply.splitlines() if line.strip()]
-
-        # Drop greeting lines that slipped through
-        if is_follow_up:
-            lines = [line for line in lines if not re.match(r'^(sawasdee|hello|hi|hey)\b', line, flags=re.IGNORECASE)]
-
-        # Remove handholding/invite phrases
-        invite_patterns = [r"would you like", r"let me ", r"can i ", r"shall i", r"i can .*guide", r"we can .*guide"]
-        filtered_lines = []
-        for line in lines:
-            lower = line.lower()
-            if any(re.search(pat, lower) for pat in invite_patterns):
-                continue
-            filtered_lines.append(line)
-        lines = filtered_lines
-
-        # Rejoin for sentence trimming
-        text = " ".join(lines)
-
-        # Sentence split
-        sentences = re.split(r"(?<=[.!?])\s+", text)
-        # Drop empty fragments
-        sentences = [s.strip() for s in sentences if s.strip()]
-
-        if is_follow_up:
-            sentences = sentences[:2]  # max 2 sentences, may include one question if present
-        else:
-            sentences = sentences[:3]  # max 3 sentences
+        # Timed inline: a few microseconds of wrapper would be a sizeable share of this stage
+        start = time.perf_counter()
+        reply = (rules or self._reply_rules or DEFAULT_RULES).apply(reply, not self._is_new_chat(chat_history))
+        _observe_postprocess(time.perf_counter() - start)
+        return reply
 
-        # Reassemble
-        final = " ".join(sentences).strip()
+    def _rules_for(self, version: str) -> ReplyRules:
+        """
+        Reply rules for a prompt version, compiled once when the version loads.
+        
+        Extra banned phrases come from the "banned_phrases" prompt row (one
+        per line), so they can change without a deploy; they are picked up
+        with the next prompt version or /reset-prompt.
+        """
+        if self._reply_rules is not None and self._reply_rules_version == version:
+            return self._reply_rules
+        rules = ReplyRules(parse_banned_phrases(self.db.get_prompt("banned_phrases") or ""))
+        self._reply_rules, self._reply_rules_version = rules, version
+        return rules
 
-        return final
+    async def _arules_for(self, version: str) -> ReplyRules:
+        """Async counterpart of _rules_for(); only touches the DB when the version changed."""
+        if self._reply_rules is not None and self._reply_rules_version == version:
+            return self._reply_rules
+        return await asyncio.to_thread(self._rules_for, version)
+
+    def cache_metrics(self) -> List[str]:
+        """Cache hit/miss counters for /metrics, read from the counters the caches already keep."""
+        compactor = get_history_compactor()
+        hits = {
+            "prompt": self.prompt_cache.hits + self.prompt_cache.stale_hits,
+            "reply": self.reply_cache.hits,
+            "near_duplicate": self.near_duplicate_cache.hits,
+            "history_summary": compactor.summary_reuses
+        }
+        misses = {
+            "prompt": self.prompt_cache.misses,
+            "reply": self.reply_cache.misses,
+            "near_duplicate": self.near_duplicate_cache.misses,
+            "history_summary": compactor.summaries_created + compactor.summaries_extended
+        }
+        return (counter_lines("dtv_cache_hits_total", "Cache lookups answered from the cache (prompt hits include stale ones).", "cache", hits)
+                + counter_lines("dtv_cache_misses_total", "Cache lookups that had to load or generate.", "cache", misses))
 
     def _extract_prompt_from_raw(self, raw: str) -> str:
         """
@@ -236,4 +654,5 @@ def get_prompt_editor(llm_provider: str = None) -> PromptEditorService:
     global _editor_instance
     if _editor_instance is None:
         _editor_instance = PromptEditorService(llm_provider=llm_provider)
+        REGISTRY.add_collector(_editor_instance.cache_metrics)
     return _editor_instance
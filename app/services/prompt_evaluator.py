@@ -0,0 +1,377 @@
+import asyncio
+import hashlib
+import heapq
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+from app.services.async_runtime import run_sync
+from app.services.history_compactor import NO_HISTORY
+from app.services.metrics import PROMPT_EVALUATIONS, time_stage
+from app.services.prompt_cache import compute_prompt_version
+from app.services.reply_rules import DEFAULT_RULES, GREETING_LINE
+from app.services.tracing import set_span_attributes, traced
+from app.services.usage import usage_tags
+from app.utils.paths import project_path
+from app.utils.conversation_parser import (
+    format_chat_history,
+    format_client_sequence,
+    iter_conversation_pairs,
+    iter_conversations
+)
+from app.utils.text_vectorizer import HashingVectorizer, np
+
+# Per-pair score = weighted sum of the three local metrics (each in [0, 1])
+SIMILARITY_WEIGHT = 0.6
+LENGTH_WEIGHT = 0.2
+GREETING_WEIGHT = 0.2
+
+# New chats must open with the Sawasdee greeting (see the GREETING RULE in the prompt)
+SAWASDEE_PREFIX = re.compile(r"^\W*sawasdee", re.IGNORECASE)
+
+
+def pair_key(client_message: str, chat_history: str) -> str:
+    """Stable id of a (formatted) exchange, shared by the held-out split and the prediction cache."""
+    return hashlib.sha1(f"{chat_history}\n{client_message}".encode("utf-8")).hexdigest()[:16]
+
+
+def _eval_pair(pair: dict) -> dict:
+    """Parser pair -> the formatted fields the evaluator works with."""
+    client_message = format_client_sequence(pair["client_sequence"])
+    chat_history = format_chat_history(pair["chat_history"])
+    return {
+        "key": pair_key(client_message, chat_history),
+        "client_message": client_message,
+        "chat_history": chat_history,
+        "reference": "\n".join(pair["consultant_reply"]),
+        "is_follow_up": chat_history.strip() != NO_HISTORY
+    }
+
+
+def load_held_out_pairs(path: str, size: int) -> List[dict]:
+    """
+    The held-out set: the `size` pairs of a conversation export with the
+    smallest key hash. The sample is deterministic (same file, same set) and
+    is streamed, so only `size` pairs are ever kept in memory.
+    """
+    pairs = (_eval_pair(pair) for pair in iter_conversation_pairs(iter_conversations(path)))
+    return heapq.nsmallest(size, pairs, key=lambda pair: pair["key"])
+
+
+class PromptEvaluator:
+    """
+    Offline regression check for chatbot prompt updates.
+
+    A candidate prompt answers every pair of a held-out set (sampled from
+    the conversation export) concurrently, and the replies are scored
+    against the real consultant replies with local metrics only: cosine
+    similarity of HashingVectorizer embeddings (words, bigrams, character
+    trigrams), word-count ratio, and compliance with the greeting rule
+    (Sawasdee on new chats, no greeting on follow-ups, checked on the raw
+    LLM output since post-processing would hide it). `build_prompt` should
+    leave out retrieved few-shot examples: the index may contain the
+    held-out replies and grows at runtime. Predictions are cached per
+    (prompt content hash, pair), so the live prompt is only scored once and
+    a promoted candidate's replies are reused as the next baseline.
+
+    compare() works on paired per-pair score deltas (candidate - baseline)
+    over the pairs the baseline answered. Both sides are single LLM
+    samples, so a neutral candidate's mean delta is noise around 0;
+    a candidate is rejected only when the mean drops by more than
+    `tolerance` plus `noise_z` standard errors of the deltas.
+
+    Since every promoted candidate becomes the next baseline, small allowed
+    drops could add up. Each candidate is therefore also compared, the same
+    way, with an anchor: the best-scoring prompt seen so far (live or
+    promoted, kept in memory as its per-pair scores). It is rejected when
+    it falls below the anchor by more than `max_drift` plus `noise_z`
+    standard errors, which caps the cumulative drop.
+    """
+
+    def __init__(
+        self,
+        llm,
+        build_prompt: Callable[[str, str, str], str],
+        enabled: bool = None,
+        path: str = None,
+        size: int = None,
+        concurrency: int = None,
+        tolerance: float = None,
+        noise_z: float = None,
+        max_drift: float = None,
+        max_predictions: int = None,
+        dim: int = 512
+    ):
+        if enabled is None:
+            enabled = os.getenv("PROMPT_EVAL_ENABLED", "true").lower() in ("1", "true", "yes")
+        # Relative to the project root, not the working directory (gunicorn may start elsewhere)
+        self.path = path if path is not None else project_path(os.getenv("PROMPT_EVAL_PATH", "conversations.json"))
+        if enabled and np is None:
+            print("⚠️ PROMPT_EVAL_ENABLED is set but numpy is not installed; prompt updates are not evaluated")
+            enabled = False
+        if enabled and not os.path.exists(self.path):
+            print(f"⚠️ Held-out conversations not found at {self.path}; prompt updates are not evaluated")
+            enabled = False
+
+        self.enabled = enabled
+        self.llm = llm
+        self.build_prompt = build_prompt
+        self.size = size if size is not None else int(os.getenv("PROMPT_EVAL_SET_SIZE", "32"))
+        self.concurrency = concurrency if concurrency is not None else int(os.getenv("PROMPT_EVAL_CONCURRENCY", "16"))
+        self.tolerance = tolerance if tolerance is not None else float(os.getenv("PROMPT_EVAL_TOLERANCE", "0.01"))
+        self.noise_z = noise_z if noise_z is not None else float(os.getenv("PROMPT_EVAL_NOISE_Z", "2.0"))
+        self.max_drift = max_drift if max_drift is not None else float(os.getenv("PROMPT_EVAL_MAX_DRIFT", "0.02"))
+        self.max_predictions = max_predictions if max_predictions is not None else int(os.getenv("PROMPT_EVAL_CACHE_SIZE", "10000"))
+        self.vectorizer = HashingVectorizer(dim=dim) if enabled else None
+
+        self._lock = threading.Lock()
+        self._pairs: Optional[List[dict]] = None
+        self._keys = frozenset()
+        self._reference_vectors = None
+        self._predictions: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._anchor: Optional[dict] = None  # best prompt so far: version, mean score, per-pair score and answered
+
+        self.evaluations = 0
+        self.outcomes = {"promoted": 0, "rejected": 0, "inconclusive": 0}
+        self.llm_calls = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self._seconds = 0.0
+
+    def held_out(self) -> List[dict]:
+        """The held-out pairs (loaded on first use)."""
+        with self._lock:
+            if self._pairs is None:
+                pairs = load_held_out_pairs(self.path, self.size)
+                self._reference_vectors = self.vectorizer.transform([pair["reference"] for pair in pairs])
+                self._keys = frozenset(pair["key"] for pair in pairs)
+                self._pairs = pairs
+                print(f"📏 Loaded {len(pairs)} held-out pairs for prompt evaluation from {self.path}")
+            return self._pairs
+
+    def is_held_out(self, pair: dict) -> bool:
+        """Whether a parser pair (see parse_conversation_pairs) is in the held-out set, e.g. to keep it out of training."""
+        if not self.enabled:
+            return False
+        self.held_out()
+        return _eval_pair(pair)["key"] in self._keys
+
+    def _cached(self, version: str, key: str) -> Optional[str]:
+        with self._lock:
+            reply = self._predictions.get((version, key))
+            if reply is not None:
+                self._predictions.move_to_end((version, key))
+                self.cache_hits += 1
+            return reply
+
+    def _remember(self, version: str, key: str, reply: str):
+        with self._lock:
+            self._predictions[(version, key)] = reply
+            while len(self._predictions) > self.max_predictions:
+                self._predictions.popitem(last=False)
+
+    async def _apredict(self, prompt: str, version: str, pairs: List[dict]) -> List[Optional[str]]:
+        """Raw LLM reply per pair (None where the call failed), at most `concurrency` in flight."""
+        semaphore = asyncio.Semaphore(max(1, self.concurrency))
+        failures: List[Exception] = []
+
+        async def predict(pair: dict) -> Optional[str]:
+            cached = self._cached(version, pair["key"])
+            if cached is not None:
+                return cached
+            async with semaphore:
+                try:
+                    full_prompt = self.build_prompt(prompt, pair["client_message"], pair["chat_history"])
+                    self.llm_calls += 1
+                    reply = await self.llm.agenerate(full_prompt, max_tokens=220)
+                except Exception as e:
+                    # A candidate that breaks the template fails here too, and scores 0 on the pair
+                    failures.append(e)
+                    return None
+            self._remember(version, pair["key"], reply)
+            return reply
+
+        # Up to a few dozen calls at once: paced by the bulk rate limiter
+        with usage_tags(operation="eval", prompt_version=version, bulk=True):
+            replies = await asyncio.gather(*(predict(pair) for pair in pairs))
+        if failures:
+            self.errors += len(failures)
+            print(f"⚠️ {len(failures)}/{len(pairs)} evaluation predictions failed for {version}: {failures[0]!r}")
+        return replies
+
+    def _score(self, pairs: List[dict], replies: List[Optional[str]]) -> dict:
+        """Per-pair metric arrays (0 where the prediction failed) and the mask of answered pairs."""
+        answered = np.array([reply is not None for reply in replies], dtype=bool)
+        follow_up = np.array([pair["is_follow_up"] for pair in pairs], dtype=bool)
+        raw = [reply or "" for reply in replies]
+        final = [DEFAULT_RULES.apply(text, pair["is_follow_up"]) for text, pair in zip(raw, pairs)]
+
+        vectors = self.vectorizer.transform(final)
+        similarity = np.clip(np.einsum("ij,ij->i", vectors, self._reference_vectors), 0.0, 1.0)
+
+        predicted_words = np.array([len(text.split()) for text in final], dtype=np.float32)
+        reference_words = np.array([len(pair["reference"].split()) for pair in pairs], dtype=np.float32)
+        length = np.minimum(predicted_words, reference_words) / np.maximum(np.maximum(predicted_words, reference_words), 1.0)
+
+        greeted = np.array([bool(GREETING_LINE.match(text.strip())) for text in raw], dtype=bool)
+        sawasdee = np.array([bool(SAWASDEE_PREFIX.match(text)) for text in raw], dtype=bool)
+        greeting = np.where(follow_up, ~greeted, sawasdee).astype(np.float32)
+
+        metrics = {"similarity": similarity, "length": length, "greeting": greeting}
+        metrics = {name: np.where(answered, values, 0.0) for name, values in metrics.items()}
+        metrics["score"] = (
+            SIMILARITY_WEIGHT * metrics["similarity"]
+            + LENGTH_WEIGHT * metrics["length"]
+            + GREETING_WEIGHT * metrics["greeting"]
+        )
+        metrics["answered"] = answered
+        return metrics
+
+    @staticmethod
+    def _summary(version: str, metrics: dict, mask: "np.ndarray", seconds: float) -> dict:
+        count = int(mask.sum())
+        summary = {name: round(float(metrics[name][mask].mean()), 4) if count else 0.0
+                   for name in ("score", "similarity", "length", "greeting")}
+        summary.update({
+            "version": version,
+            "pairs": count,
+            "failed": int((~metrics["answered"][mask]).sum()),
+            "seconds": round(seconds, 2)
+        })
+        return summary
+
+    async def _aevaluate(self, prompt: str) -> Tuple[str, dict, float]:
+        started = time.perf_counter()
+        # Content hash, not the database id, so a promoted candidate's predictions are reused as the next baseline
+        version = compute_prompt_version(prompt)
+        pairs = await asyncio.to_thread(self.held_out)
+        replies = await self._apredict(prompt, version, pairs)
+        metrics = await asyncio.to_thread(self._score, pairs, replies)
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self.evaluations += 1
+            self._seconds += seconds
+        return version, metrics, seconds
+
+    async def aevaluate(self, prompt: str) -> dict:
+        """Score one prompt on the held-out set (failed predictions count as 0)."""
+        version, metrics, seconds = await self._aevaluate(prompt)
+        return self._summary(version, metrics, np.ones(len(metrics["score"]), dtype=bool), seconds)
+
+    def evaluate(self, prompt: str) -> dict:
+        """Sync counterpart of aevaluate() (runs on the shared event loop)."""
+        return run_sync(self.aevaluate(prompt))
+
+    @staticmethod
+    def _paired(candidate: "np.ndarray", reference: "np.ndarray", mask: "np.ndarray") -> Tuple[float, float]:
+        """Mean per-pair delta (candidate - reference) over `mask` and its standard error."""
+        deltas = (candidate - reference)[mask]
+        delta = float(deltas.mean()) if len(deltas) else 0.0
+        stderr = float(deltas.std(ddof=1) / np.sqrt(len(deltas))) if len(deltas) > 1 else 0.0
+        return delta, stderr
+
+    def _update_anchor(self, version: str, metrics: dict) -> dict:
+        """Make a live or promoted prompt the anchor if it beats the current one; returns the anchor."""
+        answered = metrics["answered"]
+        mean = float(metrics["score"].mean())
+        with self._lock:
+            if answered.sum() * 2 >= len(answered) and (self._anchor is None or mean > self._anchor["mean"]):
+                self._anchor = {"version": version, "mean": mean, "score": metrics["score"], "answered": answered}
+            return self._anchor or {"version": version, "mean": mean, "score": metrics["score"], "answered": answered}
+
+    @traced("PromptEvaluator.compare")
+    async def acompare(self, baseline_prompt: str, candidate_prompt: str) -> dict:
+        """
+        Score the live prompt and a candidate on the same held-out pairs.
+
+        Returns:
+            {"promote": bool, "outcome": "promoted" | "rejected" | "inconclusive",
+             "delta": mean per-pair candidate - baseline score,
+             "stderr": its standard error, "threshold": the drop that rejects,
+             "anchor": {"version", "score", "delta", "stderr", "threshold"}
+             for the same check against the best prompt so far,
+             "baseline": {...}, "candidate": {...}}
+            where each side has score, similarity, length, greeting, pairs,
+            failed and seconds.
+        """
+        with time_stage("evaluation"):
+            if candidate_prompt == baseline_prompt:
+                # Scoring the same prompt twice would only compare two samples of the LLM
+                base_version, base, base_seconds = await self._aevaluate(baseline_prompt)
+                cand_version, cand, cand_seconds = base_version, base, base_seconds
+            else:
+                (base_version, base, base_seconds), (cand_version, cand, cand_seconds) = await asyncio.gather(
+                    self._aevaluate(baseline_prompt), self._aevaluate(candidate_prompt)
+                )
+
+        # Pairs the live prompt could not answer say nothing about the candidate
+        mask = base["answered"]
+        baseline = self._summary(base_version, base, mask, base_seconds)
+        candidate = self._summary(cand_version, cand, mask, cand_seconds)
+        delta, stderr = self._paired(cand["score"], base["score"], mask)
+        threshold = self.tolerance + self.noise_z * stderr
+
+        anchor = self._update_anchor(base_version, base)
+        anchor_mask = mask & anchor["answered"]
+        anchor_delta, anchor_stderr = self._paired(cand["score"], anchor["score"], anchor_mask)
+        anchor_threshold = self.max_drift + self.noise_z * anchor_stderr
+
+        if baseline["pairs"] * 2 < len(mask):
+            outcome = "inconclusive"
+        elif delta < -threshold or anchor_delta < -anchor_threshold:
+            outcome = "rejected"
+        else:
+            outcome = "promoted"
+            self._update_anchor(cand_version, cand)
+
+        with self._lock:
+            self.outcomes[outcome] += 1
+        PROMPT_EVALUATIONS.inc(outcome=outcome)
+        set_span_attributes(outcome=outcome, baselineScore=baseline["score"],
+                            candidateScore=candidate["score"], pairs=baseline["pairs"])
+        print(f"📏 Prompt evaluation: candidate {candidate['score']:.4f} vs live {baseline['score']:.4f} "
+              f"(delta {delta:+.4f}, rejects below {-threshold:+.4f}; vs best {anchor['version']} {anchor_delta:+.4f}, "
+              f"rejects below {-anchor_threshold:+.4f}) on {baseline['pairs']} held-out pairs -> {outcome}")
+        return {
+            "promote": outcome == "promoted",
+            "outcome": outcome,
+            "delta": round(delta, 4),
+            "stderr": round(stderr, 4),
+            "threshold": round(threshold, 4),
+            "anchor": {
+                "version": anchor["version"],
+                "score": round(float(anchor["score"][anchor_mask].mean()), 4) if anchor_mask.any() else 0.0,
+                "delta": round(anchor_delta, 4),
+                "stderr": round(anchor_stderr, 4),
+                "threshold": round(anchor_threshold, 4)
+            },
+            "baseline": baseline,
+            "candidate": candidate
+        }
+
+    def compare(self, baseline_prompt: str, candidate_prompt: str) -> dict:
+        """Sync counterpart of acompare() (runs on the shared event loop)."""
+        return run_sync(self.acompare(baseline_prompt, candidate_prompt))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "path": self.path,
+                "heldOutPairs": len(self._pairs) if self._pairs is not None else None,
+                "tolerance": self.tolerance,
+                "noiseZ": self.noise_z,
+                "maxDrift": self.max_drift,
+                "anchorVersion": self._anchor["version"] if self._anchor else None,
+                "anchorScore": round(self._anchor["mean"], 4) if self._anchor else None,
+                "evaluations": self.evaluations,
+                **self.outcomes,
+                "llmCalls": self.llm_calls,
+                "errors": self.errors,
+                "cacheHits": self.cache_hits,
+                "cachedPredictions": len(self._predictions),
+                "avgSeconds": round(self._seconds / self.evaluations, 2) if self.evaluations else 0.0
+            }
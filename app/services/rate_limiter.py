@@ -0,0 +1,222 @@
+import asyncio
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from app.services.usage import estimate_tokens
+
+
+def estimate_request_tokens(prompt: str, max_tokens: int) -> int:
+    """Tokens a call may consume: the prompt's estimate plus the completion budget."""
+    return estimate_tokens(prompt) + max_tokens
+
+
+def rate_limit_delay(error: Exception) -> Optional[float]:
+    """
+    If `error` is a provider 429, return the seconds it asked us to wait
+    (0.0 when it sent no Retry-After); otherwise None.
+
+    Works for requests/httpx HTTP errors and the groq/openai/anthropic SDKs,
+    which all expose the status code and the raw response headers.
+    """
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status != 429:
+        return None
+    headers = getattr(response, "headers", None) or {}
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return 0.0
+
+
+class RateLimiter:
+    """
+    Adaptive token-bucket limiter for one LLM provider.
+
+    Two buckets are checked per call: requests per minute and tokens per
+    minute, each only when configured. Both refill at the configured rate times a scale
+    factor that adapts AIMD-style: every 429 halves it and pauses the
+    provider for its Retry-After, and every success while callers are
+    queueing on the limiter nudges it back up, to at most `max_scale`
+    times the configured limits. With neither limit set, calls are never
+    queued client-side, but a 429 still pauses the provider for its
+    Retry-After. Safe to share between the event loop and worker threads.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = None,
+        tokens_per_minute: float = None,
+        burst: float = None,
+        max_scale: float = None,
+        min_scale: float = 0.05,
+        increase_step: float = 0.02,
+        decrease_factor: float = 0.5
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.burst = burst or (max(1.0, requests_per_minute / 6) if requests_per_minute else 0.0)  # ~10s worth of requests
+        self.max_scale = max_scale if max_scale is not None else float(os.getenv("LLM_RATE_MAX_SCALE", "2"))
+        self.min_scale = min_scale
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+
+        self.scale = 1.0
+        self._requests = self.burst
+        self._tokens = self._token_capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._saturated_at = float("-inf")
+        self._lock = threading.Lock()
+
+        self.throttles = 0
+        self.waits = 0
+
+    @property
+    def _token_capacity(self) -> float:
+        return self.tokens_per_minute / 6 if self.tokens_per_minute else 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self.burst, self._requests + elapsed * self.requests_per_minute * self.scale / 60.0)
+        if self.tokens_per_minute:
+            self._tokens = min(self._token_capacity, self._tokens + elapsed * self.tokens_per_minute * self.scale / 60.0)
+
+    def _try_take(self, tokens: int = 0) -> float:
+        """Take a request (and `tokens`) if available; otherwise return seconds until they are."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._blocked_until:
+                self._saturated_at = now
+                return self._blocked_until - now
+
+            # A call bigger than the whole bucket may go once the bucket is full
+            tokens = min(tokens, self._token_capacity) if self.tokens_per_minute else 0
+            request_wait = 0.0
+            if self.requests_per_minute:
+                request_wait = max(0.0, 1 - self._requests) / (self.requests_per_minute * self.scale / 60.0)
+            token_wait = 0.0
+            if tokens:
+                token_wait = max(0.0, tokens - self._tokens) / (self.tokens_per_minute * self.scale / 60.0)
+            wait = max(request_wait, token_wait)
+            if wait > 0:
+                self._saturated_at = now
+                return wait
+
+            if self.requests_per_minute:
+                self._requests -= 1
+            self._tokens -= tokens
+            return 0.0
+
+    async def acquire(self, tokens: int = 0, deadline: float = None) -> bool:
+        """
+        Wait (without blocking the loop) until a request may be sent.
+
+        Returns False straight away, without taking anything, if that
+        would be after `deadline` (a time.monotonic() value).
+        """
+        while True:
+            wait = self._try_take(tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait >= deadline:
+                return False
+            self.waits += 1
+            await asyncio.sleep(wait)
+
+    def wait(self, tokens: int = 0, deadline: float = None) -> bool:
+        """Blocking counterpart of acquire() for worker threads and scripts."""
+        while True:
+            wait = self._try_take(tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait >= deadline:
+                return False
+            self.waits += 1
+            time.sleep(wait)
+
+    def record_success(self):
+        """Probe upward, but only while demand is actually being held back."""
+        with self._lock:
+            if time.monotonic() - self._saturated_at < 60 and self.scale < self.max_scale:
+                self.scale = min(self.max_scale, self.scale + self.increase_step)
+
+    def record_throttle(self, retry_after: float = None):
+        """The provider answered 429: back off and honour its Retry-After."""
+        with self._lock:
+            now = time.monotonic()
+            self.throttles += 1
+            self.scale = max(self.min_scale, self.scale * self.decrease_factor)
+            # Without a Retry-After, pause for one request interval at the new rate (1s when unlimited)
+            pause = retry_after or (60.0 / (self.requests_per_minute * self.scale) if self.requests_per_minute else 1.0)
+            self._blocked_until = max(self._blocked_until, now + pause)
+            self._requests = min(self._requests, 0.0)
+            self._saturated_at = now
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requestsPerMinute": round(self.requests_per_minute * self.scale, 2) if self.requests_per_minute else None,
+                "tokensPerMinute": round(self.tokens_per_minute * self.scale) if self.tokens_per_minute else None,
+                "scale": round(self.scale, 3),
+                "throttles": self.throttles,
+                "waits": self.waits,
+                "blockedFor": round(max(0.0, self._blocked_until - time.monotonic()), 2)
+            }
+
+
+# One limiter per provider, shared by every LLM call in the process
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(provider: str, bulk: bool = False) -> RateLimiter:
+    """
+    Get or create the rate limiter for a provider.
+
+    Limits come from <PROVIDER>_RPM / <PROVIDER>_TPM (e.g. GROQ_RPM),
+    falling back to LLM_RPM / LLM_TPM. Either may be left unset: no RPM
+    means calls are not limited by count, no TPM means they are not
+    limited by size, and with neither the limiter only honours 429s, so
+    interactive traffic is never queued behind a guessed default.
+
+    With `bulk`, returns the provider's second limiter, which bulk calls
+    (training, batch generation, prompt evaluation; tagged bulk=True) pass
+    on top of the first. It is limited by default, to
+    <PROVIDER>_BULK_RPM / LLM_BULK_RPM (60/min; empty disables) and
+    <PROVIDER>_BULK_TPM / LLM_BULK_TPM, so bulk work is paced and its AIMD
+    scale adapts instead of bursting into 429s.
+    """
+    key = f"{provider}:bulk" if bulk else provider
+    with _limiters_lock:
+        limiter: Optional[RateLimiter] = _limiters.get(key)
+        if limiter is None:
+            prefix = "BULK_" if bulk else ""
+            rpm = os.getenv(f"{provider.upper()}_{prefix}RPM") or os.getenv(f"LLM_{prefix}RPM", "60" if bulk else "")
+            tpm = os.getenv(f"{provider.upper()}_{prefix}TPM") or os.getenv(f"LLM_{prefix}TPM")
+            limiter = RateLimiter(requests_per_minute=float(rpm) if rpm else None, tokens_per_minute=float(tpm) if tpm else None)
+            _limiters[key] = limiter
+        return limiter
+
+
+def rate_limiter_stats() -> Dict[str, dict]:
+    """Current limits and throttle counters for every provider seen so far."""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {provider: limiter.stats() for provider, limiter in limiters.items()}
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace runs and trim, so formatting noise doesn't defeat the cache."""
+    return _WHITESPACE.sub(" ", text or "").strip()
+
+
+class ReplyCache:
+    """
+    Bounded LRU + TTL cache of post-processed replies.
+
+    Keys combine the prompt version, the normalized chat history string and
+    the normalized client message, so a prompt update can never serve a reply
+    generated under an older prompt. Set max_entries to 0 to disable.
+    """
+
+    def __init__(self, max_entries: int = None, ttl: float = None):
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("REPLY_CACHE_MAX_ENTRIES", "1000"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("REPLY_CACHE_TTL", "3600"))
+
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(prompt_version: str, chat_history: str, client_message: str) -> str:
+        raw = "\x1f".join([prompt_version or "", normalize_text(chat_history), normalize_text(client_message)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, reply: str):
+        if not self.enabled or not reply:
+            return
+        with self._lock:
+            self._entries[key] = (reply, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "ttlSeconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,79 @@
+import re
+from typing import Iterable, List
+
+# Greeting stripped from the start of follow-up replies
+GREETING_PREFIX = re.compile(r"^\s*(sawasdee[^\w]*|hello[^\w]*|hi[^\w]*|hey[^\w]*)", re.IGNORECASE)
+# A whole line that is a greeting (dropped on follow-ups)
+GREETING_LINE = re.compile(r"^(sawasdee|hello|hi|hey)\b", re.IGNORECASE)
+# Handholding/invite phrases, matched against the lowercased line
+INVITE_PATTERNS = (r"would you like", r"let me ", r"can i ", r"shall i", r"i can .*guide", r"we can .*guide")
+# Whitespace that ends a sentence
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+SENTENCE_END = (".", "!", "?")
+
+FOLLOW_UP_MAX_SENTENCES = 2
+NEW_CHAT_MAX_SENTENCES = 3
+
+
+def parse_banned_phrases(text: str) -> List[str]:
+    """One phrase per line; blank lines and lines starting with # are ignored."""
+    phrases = []
+    for line in (text or "").splitlines():
+        phrase = line.strip()
+        if phrase and not phrase.startswith("#"):
+            phrases.append(phrase)
+    return phrases
+
+
+class ReplyRules:
+    """
+    Compiled reply post-processing: greeting and handholding bans plus the
+    sentence cap.
+
+    Built once per prompt version. Every per-line ban (greeting line on
+    follow-ups, invite patterns, extra banned phrases from the database) is
+    folded into one regex, and the reply is walked line by line only until
+    the sentence cap is reached. Output is identical to the original
+    split/filter/join/re-split implementation.
+    """
+
+    def __init__(self, banned_phrases: Iterable[str] = ()):
+        self.banned_phrases = [phrase.lower() for phrase in banned_phrases if phrase.strip()]
+        invites = "|".join(INVITE_PATTERNS + tuple(re.escape(phrase) for phrase in self.banned_phrases))
+        # Matched against line.lower(); the greeting alternative keeps its own case-insensitivity
+        self.invite = re.compile(invites)
+        self.follow_up_line = re.compile(r"(?i:^(?:sawasdee|hello|hi|hey)\b)|" + invites)
+
+    def apply(self, reply: str, is_follow_up: bool) -> str:
+        """Post-process a complete LLM reply."""
+        if is_follow_up:
+            reply = GREETING_PREFIX.sub("", reply, count=1)
+            banned = self.follow_up_line
+            max_sentences = FOLLOW_UP_MAX_SENTENCES
+        else:
+            banned = self.invite
+            max_sentences = NEW_CHAT_MAX_SENTENCES
+
+        sentences: List[str] = []
+        current = ""  # sentence still open at the end of the previous kept line
+        for line in reply.splitlines():
+            line = line.strip()
+            if not line or banned.search(line.lower()):
+                continue
+            parts = SENTENCE_BREAK.split(line)
+            current = f"{current} {parts[0]}" if current else parts[0]
+            for part in parts[1:]:
+                sentences.append(current)
+                current = part
+            if line.endswith(SENTENCE_END):
+                sentences.append(current)
+                current = ""
+            if len(sentences) >= max_sentences:
+                break
+        if current:
+            sentences.append(current)
+
+        return " ".join(sentences[:max_sentences])
+
+
+DEFAULT_RULES = ReplyRules()
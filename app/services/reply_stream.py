@@ -0,0 +1,110 @@
+import re
+from typing import List
+
+from app.services.reply_rules import (
+    DEFAULT_RULES,
+    FOLLOW_UP_MAX_SENTENCES,
+    GREETING_LINE,
+    GREETING_PREFIX,
+    NEW_CHAT_MAX_SENTENCES,
+    ReplyRules
+)
+
+# Same rules as ReplyRules.apply, applied as text arrives
+# Next place where a unit can be closed: a line break, or sentence punctuation followed by whitespace
+BOUNDARY = re.compile(r"\n|[.!?](?=\s)")
+
+
+class IncrementalReplyProcessor:
+    """
+    Streaming counterpart of ReplyRules.apply.
+
+    Raw LLM chunks go in through feed(); finished sentences come out as soon
+    as their closing punctuation arrives. Greeting stripping, greeting-line
+    dropping and the sentence cap behave as in the batch version. Handholding
+    phrases are checked per sentence rather than per line, because earlier
+    sentences of a line have already been sent when a later one matches.
+    """
+
+    def __init__(self, chat_history: str, rules: ReplyRules = None):
+        self.is_follow_up = chat_history.strip() != "No previous messages."
+        self.max_sentences = FOLLOW_UP_MAX_SENTENCES if self.is_follow_up else NEW_CHAT_MAX_SENTENCES
+        self.invite = (rules or DEFAULT_RULES).invite
+
+        self._buffer = ""
+        self._sentence = ""
+        self._prefix_checked = False
+        self._line_has_content = False
+        self._line_dropped = False
+        self.sentences: List[str] = []
+
+    @property
+    def done(self) -> bool:
+        """True once the sentence cap is reached; the caller can stop reading the LLM."""
+        return len(self.sentences) >= self.max_sentences
+
+    @property
+    def text(self) -> str:
+        """The reply emitted so far, joined the same way as the batch version."""
+        return " ".join(self.sentences).strip()
+
+    def feed(self, chunk: str) -> List[str]:
+        """Add raw LLM text and return any sentences that are now final."""
+        if self.done:
+            return []
+        self._buffer += chunk
+        emitted = []
+
+        while not self.done:
+            match = BOUNDARY.search(self._buffer)
+            if not match:
+                break
+            if match.group() == "\n":
+                segment, self._buffer = self._buffer[:match.start()], self._buffer[match.end():]
+                emitted.extend(self._process(segment, ends_sentence=False))
+                self._end_line()
+            else:
+                segment, self._buffer = self._buffer[:match.end()], self._buffer[match.end():]
+                emitted.extend(self._process(segment, ends_sentence=True))
+
+        return emitted
+
+    def finish(self) -> List[str]:
+        """Flush whatever is left once the LLM stream has ended."""
+        if self.done:
+            return []
+        segment, self._buffer = self._buffer, ""
+        emitted = self._process(segment, ends_sentence=False)
+        self._end_line()
+        return emitted + self._close_sentence()
+
+    def _process(self, segment: str, ends_sentence: bool) -> List[str]:
+        if self.is_follow_up and not self._prefix_checked and segment.strip():
+            self._prefix_checked = True
+            segment = GREETING_PREFIX.sub("", segment, count=1)
+
+        part = segment.strip()
+        if part:
+            if not self._line_has_content:
+                self._line_has_content = True
+                self._line_dropped = self.is_follow_up and bool(GREETING_LINE.match(part))
+            if not self._line_dropped:
+                self._sentence = f"{self._sentence} {part}" if self._sentence else part
+
+        # A dropped line's punctuation must not close the sentence carried over from earlier lines
+        if not ends_sentence or self._line_dropped:
+            return []
+        return self._close_sentence()
+
+    def _close_sentence(self) -> List[str]:
+        if not self._sentence:
+            return []
+        sentence, self._sentence = self._sentence, ""
+        if self.invite.search(sentence.lower()):
+            return []
+        self.sentences.append(sentence)
+        return [sentence]
+
+    def _end_line(self):
+        self._line_has_content = False
+        self._line_dropped = False
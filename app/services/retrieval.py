@@ -0,0 +1,297 @@
+import gzip
+import heapq
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from app.utils.paths import data_path
+from app.utils.text_vectorizer import np, tokenize
+
+INDEX_FORMAT_VERSION = 1
+
+# Relative avgdl change tolerated before the cached per-term impacts are rebuilt
+AVGDL_DRIFT = 0.02
+
+
+class BM25Index:
+    """
+    In-memory inverted index over (client message -> consultant reply) examples.
+
+    Documents are the client side of a real exchange; the consultant reply is
+    stored alongside and returned with each hit. Postings map a term to
+    parallel lists of (doc ids, term frequencies), so adding a document only
+    appends to its own terms. Scoring is Okapi BM25 with the non-negative idf
+    variant, vectorized with numpy when it is installed.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents: List[tuple] = []
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._total_length = 0
+
+        # numpy copy of doc_lengths with spare capacity (grown by doubling), built on first search
+        self._length_array = None
+        # numpy (doc ids, length-normalized term frequency) per term, built lazily. idf is
+        # applied per query and avgdl is frozen in _avgdl until it drifts by AVGDL_DRIFT, so
+        # an add only drops the entries of its own terms
+        self._impacts: Dict[str, tuple] = {}
+        self._avgdl: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add(self, client_text: str, reply: str) -> int:
+        """Index one example and return its document id."""
+        doc_id = len(self.documents)
+        terms = Counter(tokenize(client_text))
+        self.documents.append((client_text, reply))
+        length = sum(terms.values())
+        self.doc_lengths.append(length)
+        self._total_length += length
+        for term, tf in terms.items():
+            ids, tfs = self.postings.setdefault(term, ([], []))
+            ids.append(doc_id)
+            tfs.append(tf)
+            self._impacts.pop(term, None)
+        if self._length_array is not None:
+            if doc_id >= len(self._length_array):
+                grown = np.zeros(2 * len(self._length_array), dtype=np.float32)
+                grown[:doc_id] = self._length_array[:doc_id]
+                self._length_array = grown
+            self._length_array[doc_id] = length
+        return doc_id
+
+    def search(self, query: str, k: int = 3, exclude: Optional[str] = None) -> List[dict]:
+        """
+        Top-k examples for a query, best first.
+
+        Args:
+            query: Client message to match
+            k: Number of examples to return
+            exclude: Client text to skip (an identical past message), if any
+
+        Returns:
+            [{"client": ..., "reply": ..., "score": ...}]
+        """
+        if not self.documents or k <= 0:
+            return []
+
+        terms = [term for term in set(tokenize(query)) if term in self.postings]
+        if not terms:
+            return []
+
+        # Over-fetch slightly so excluded duplicates don't shrink the result
+        fetch = k + 2
+        ranked = self._rank_numpy(terms, fetch) if np is not None else self._rank_python(terms, fetch)
+
+        exclude_key = " ".join(exclude.split()).lower() if exclude else None
+        results = []
+        for doc_id, score in ranked:
+            client_text, reply = self.documents[doc_id]
+            if exclude_key is not None and " ".join(client_text.split()).lower() == exclude_key:
+                continue
+            results.append({"client": client_text, "reply": reply, "score": round(score, 4)})
+            if len(results) == k:
+                break
+        return results
+
+    def _idf(self, term: str) -> float:
+        n = len(self.documents)
+        df = len(self.postings[term][0])
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _term_weights(self, term: str) -> Tuple[float, float, float]:
+        """(idf * (k1 + 1), length-independent norm, per-token norm) for a term."""
+        avgdl = self._total_length / len(self.documents) or 1.0
+        return self._idf(term) * (self.k1 + 1), self.k1 * (1 - self.b), self.k1 * self.b / avgdl
+
+    def _rank_python(self, terms: List[str], fetch: int) -> List[Tuple[int, float]]:
+        lengths = self.doc_lengths
+        scores: Dict[int, float] = {}
+        for term in terms:
+            weight, norm, scale = self._term_weights(term)
+            ids, tfs = self.postings[term]
+            for doc_id, tf in zip(ids, tfs):
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight * tf / (tf + norm + scale * lengths[doc_id])
+        return heapq.nlargest(fetch, scores.items(), key=lambda item: item[1])
+
+    def _refresh_avgdl(self):
+        """Freeze avgdl for the cached impacts, rebuilding them only once it has drifted."""
+        avgdl = self._total_length / len(self.documents) or 1.0
+        if self._avgdl is None or abs(avgdl - self._avgdl) > AVGDL_DRIFT * self._avgdl:
+            self._avgdl = avgdl
+            self._impacts.clear()
+        if self._length_array is None:
+            self._length_array = np.zeros(max(1024, 2 * len(self.doc_lengths)), dtype=np.float32)
+            self._length_array[:len(self.doc_lengths)] = self.doc_lengths
+
+    def _impact(self, term: str) -> tuple:
+        """(doc ids, (k1 + 1)-scaled length-normalized tf of this term per doc) as numpy arrays."""
+        impact = self._impacts.get(term)
+        if impact is None:
+            ids, tfs = self.postings[term]
+            ids = np.asarray(ids, dtype=np.int32)
+            tfs = np.asarray(tfs, dtype=np.float32)
+            lengths = self._length_array[ids]
+            norm, scale = self.k1 * (1 - self.b), self.k1 * self.b / self._avgdl
+            impact = (ids, (self.k1 + 1) * tfs / (tfs + norm + scale * lengths))
+            self._impacts[term] = impact
+        return impact
+
+    def _rank_numpy(self, terms: List[str], fetch: int) -> List[Tuple[int, float]]:
+        self._refresh_avgdl()
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        for term in terms:
+            ids, contribution = self._impact(term)
+            # Doc ids are unique within a posting list, so fancy-index += is safe
+            scores[ids] += self._idf(term) * contribution
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > fetch:
+            candidates = candidates[np.argpartition(scores[candidates], -fetch)[-fetch:]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in candidates]
+
+    def to_dict(self) -> dict:
+        return {
+            "format": INDEX_FORMAT_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "documents": self.documents,
+            "postings": {term: [ids, tfs] for term, (ids, tfs) in self.postings.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BM25Index":
+        if data.get("format") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported retrieval index format: {data.get('format')}")
+        index = cls(k1=data["k1"], b=data["b"])
+        index.documents = [tuple(doc) for doc in data["documents"]]
+        index.postings = {term: (ids, tfs) for term, (ids, tfs) in data["postings"].items()}
+        lengths = [0] * len(index.documents)
+        for ids, tfs in index.postings.values():
+            for doc_id, tf in zip(ids, tfs):
+                lengths[doc_id] += tf
+        index.doc_lengths = lengths
+        index._total_length = sum(lengths)
+        return index
+
+    def save(self, path: str):
+        """Write the index to disk atomically (gzipped if path ends in .gz)."""
+        tmp_path = f"{path}.tmp"
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+class RetrievalService:
+    """
+    Few-shot example retrieval for reply generation.
+
+    Loads the BM25 index built by scripts/build_retrieval_index.py from
+    RETRIEVAL_INDEX_PATH. Examples added at runtime (e.g. from /improve-ai)
+    are indexed in memory and appended to a journal next to the index, which
+    is replayed on load and folded in the next time the index is rebuilt.
+    Retrieval is disabled when no index file exists.
+    """
+
+    def __init__(self, path: str = None, top_k: int = None):
+        self.path = path if path is not None else data_path(os.getenv("RETRIEVAL_INDEX_PATH", "retrieval_index.json.gz"))
+        self.top_k = top_k if top_k is not None else int(os.getenv("RETRIEVAL_TOP_K", "3"))
+        self.journal_path = f"{self.path}.journal.jsonl"
+        self.index: Optional[BM25Index] = None
+        self._lock = threading.Lock()
+
+        self.searches = 0
+        self._search_seconds = 0.0
+
+        if self.path and os.path.exists(self.path):
+            try:
+                self.index = self.load_index(self.path)
+                print(f"✅ Retrieval index loaded: {len(self.index)} examples from {self.path}")
+            except Exception as e:
+                print(f"⚠️ Could not load retrieval index {self.path}: {e}")
+
+    @staticmethod
+    def load_index(path: str) -> BM25Index:
+        """Load an index file and replay its journal of incremental adds."""
+        index = BM25Index.load(path)
+        RetrievalService.replay_journal(index, f"{path}.journal.jsonl")
+        return index
+
+    @staticmethod
+    def replay_journal(index: BM25Index, journal_path: str) -> int:
+        """Add every journaled example to an index; returns how many were added."""
+        if not os.path.exists(journal_path):
+            return 0
+        added = 0
+        with open(journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entry = json.loads(line)
+                    index.add(entry["client"], entry["reply"])
+                    added += 1
+        return added
+
+    @property
+    def enabled(self) -> bool:
+        return self.index is not None and self.top_k > 0
+
+    def search(self, query: str) -> List[dict]:
+        """Top-k similar past exchanges for a client message ([] if disabled)."""
+        if not self.enabled:
+            return []
+        with self._lock:
+            started = time.perf_counter()
+            # An identical past message is skipped so training predictions can't copy the graded answer
+            results = self.index.search(query, k=self.top_k, exclude=query)
+            self._search_seconds += time.perf_counter() - started
+            self.searches += 1
+        return results
+
+    def add(self, client_text: str, reply: str):
+        """Index a new real exchange and journal it to disk."""
+        if not self.enabled or not client_text or not reply:
+            return
+        with self._lock:
+            self.index.add(client_text, reply)
+            try:
+                with open(self.journal_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"client": client_text, "reply": reply}, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"⚠️ Could not journal retrieval example: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "documents": len(self.index) if self.index is not None else 0,
+            "topK": self.top_k,
+            "searches": self.searches,
+            "avgSearchMs": round(self._search_seconds / self.searches * 1000, 4) if self.searches else 0.0
+        }
+
+
+# Singleton instance
+_retrieval_instance = None
+
+def get_retrieval_service() -> RetrievalService:
+    """Get or create retrieval service instance."""
+    global _retrieval_instance
+    if _retrieval_instance is None:
+        _retrieval_instance = RetrievalService()
+    return _retrieval_instance
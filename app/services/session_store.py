@@ -0,0 +1,261 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from app.services.history_compactor import NO_HISTORY, format_history_line
+from app.utils.paths import data_path
+
+
+class ConversationSession:
+    """
+    One conversation's history, kept in every form the prompt path needs.
+
+    Messages are only ever appended, so the formatted lines and the joined
+    history string are extended in place instead of being rebuilt per turn.
+    """
+
+    __slots__ = ("conversation_id", "messages", "lines", "text", "last_id", "lock")
+
+    def __init__(self, conversation_id: str):
+        self.conversation_id = conversation_id
+        self.messages: List[dict] = []
+        self.lines: List[str] = []
+        self.text = ""
+        self.last_id = 0  # highest backend row id already applied
+        self.lock = threading.Lock()
+
+    def extend(self, messages: List[dict]):
+        for msg in messages:
+            line = format_history_line(msg)
+            self.messages.append(msg)
+            self.lines.append(line)
+            self.text = f"{self.text}\n{line}" if self.text else line
+
+    @property
+    def history_text(self) -> str:
+        """Formatted history for the prompt ("No previous messages." when empty)."""
+        return self.text or NO_HISTORY
+
+    def snapshot(self) -> Tuple[List[str], str]:
+        """(formatted lines, joined text) as of now, safe to use while others append."""
+        with self.lock:
+            return self.lines[:], self.text
+
+    @property
+    def size(self) -> int:
+        """Approximate memory footprint in bytes (text is held twice: lines + joined)."""
+        return 2 * len(self.text) + 64 * len(self.messages)
+
+
+class SQLiteSessionBackend:
+    """
+    Durable session storage in a local SQLite file.
+
+    Rows are append-only with an autoincrement id, so any process sharing the
+    file can catch up on a conversation by reading rows past the last id it
+    has seen.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_messages ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " conversation_id TEXT NOT NULL,"
+                " role TEXT NOT NULL,"
+                " message TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_session_messages_conversation"
+                " ON session_messages (conversation_id, id)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def load_since(self, conversation_id: str, after_id: int) -> List[Tuple[int, dict]]:
+        rows = self._connect().execute(
+            "SELECT id, role, message FROM session_messages WHERE conversation_id = ? AND id > ? ORDER BY id",
+            (conversation_id, after_id)
+        ).fetchall()
+        return [(row_id, {"role": role, "message": message}) for row_id, role, message in rows]
+
+    def append(self, conversation_id: str, messages: List[dict]):
+        with self._connect() as conn:
+            self._insert(conn, conversation_id, messages)
+
+    def seed(self, conversation_id: str, messages: List[dict]) -> bool:
+        """
+        Insert messages only if the conversation has no rows yet.
+
+        The check and the insert share one write transaction, so concurrent
+        first requests (in any process) seed a conversation once. Returns
+        whether this call seeded it.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            exists = conn.execute(
+                "SELECT 1 FROM session_messages WHERE conversation_id = ? LIMIT 1", (conversation_id,)
+            ).fetchone()
+            if exists:
+                return False
+            self._insert(conn, conversation_id, messages)
+        return True
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, conversation_id: str, messages: List[dict]):
+        conn.executemany(
+            "INSERT INTO session_messages (conversation_id, role, message) VALUES (?, ?, ?)",
+            [(conversation_id, msg.get("role", "unknown"), msg.get("message", "")) for msg in messages]
+        )
+
+    def delete(self, conversation_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM session_messages WHERE conversation_id = ?", (conversation_id,))
+
+
+class SessionStore:
+    """
+    Server-side conversation histories for conversationId requests.
+
+    Sessions live in a memory-bounded LRU (by count and approximate bytes).
+    With a persistent backend every append is written through and evicted
+    sessions are reloaded on their next request; each access also picks up
+    rows appended by other worker processes. With the memory backend an
+    evicted conversation starts over empty.
+    """
+
+    def __init__(self, backend=None, max_sessions: int = None, max_bytes: int = None):
+        self.backend = backend
+        self.max_sessions = max_sessions if max_sessions is not None else int(os.getenv("SESSION_MAX_CONVERSATIONS", "10000"))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, conversation_id: str) -> ConversationSession:
+        """Session for a conversation, loading (or catching up) from the backend as needed."""
+        with self._lock:
+            session = self._sessions.get(conversation_id)
+            if session is not None:
+                self._sessions.move_to_end(conversation_id)
+                self.hits += 1
+            else:
+                session = ConversationSession(conversation_id)
+                self._sessions[conversation_id] = session
+                self.loads += 1
+        self._sync(session)
+        return session
+
+    def append(self, conversation_id: str, messages: List[dict]) -> ConversationSession:
+        """Append messages ({"role", "message"}) to a conversation."""
+        messages = [msg for msg in messages if msg.get("message")]
+        session = self.get(conversation_id)
+        if not messages:
+            return session
+        if self.backend is not None:
+            self.backend.append(conversation_id, messages)
+            # Re-read rather than extend locally so interleaved writers stay in order
+            self._sync(session)
+        else:
+            with session.lock:
+                before = session.size
+                session.extend(messages)
+                self._account(session, session.size - before)
+        return session
+
+    def seed(self, conversation_id: str, messages: List[dict]) -> ConversationSession:
+        """Start a conversation from client-supplied history unless it already has messages."""
+        messages = [msg for msg in messages if msg.get("message")]
+        session = self.get(conversation_id)
+        if not messages:
+            return session
+        if self.backend is not None:
+            if self.backend.seed(conversation_id, messages):
+                self._sync(session)
+        else:
+            with session.lock:
+                if not session.messages:
+                    before = session.size
+                    session.extend(messages)
+                    self._account(session, session.size - before)
+        return session
+
+    def delete(self, conversation_id: str):
+        with self._lock:
+            session = self._sessions.pop(conversation_id, None)
+            if session is not None:
+                self._bytes -= session.size
+        if self.backend is not None:
+            self.backend.delete(conversation_id)
+
+    def _sync(self, session: ConversationSession):
+        if self.backend is None:
+            return
+        with session.lock:
+            rows = self.backend.load_since(session.conversation_id, session.last_id)
+            if not rows:
+                return
+            before = session.size
+            session.extend([msg for _, msg in rows])
+            session.last_id = rows[-1][0]
+            self._account(session, session.size - before)
+
+    def _account(self, session: ConversationSession, delta: int):
+        """Track memory use and evict least-recently-used sessions over the bounds."""
+        with self._lock:
+            # A session evicted while a request still held it no longer counts
+            if self._sessions.get(session.conversation_id) is session:
+                self._bytes += delta
+            while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+                _, evicted = self._sessions.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": "sqlite" if self.backend is not None else "memory",
+            "sessions": len(self._sessions),
+            "maxSessions": self.max_sessions,
+            "bytes": self._bytes,
+            "maxBytes": self.max_bytes,
+            "hits": self.hits,
+            "loads": self.loads,
+            "evictions": self.evictions
+        }
+
+
+# Singleton instance
+_session_store = None
+
+def get_session_store() -> SessionStore:
+    """
+    Get or create the session store.
+
+    SESSION_BACKEND=sqlite (default) persists to SESSION_DB_PATH (under DATA_DIR);
+    SESSION_BACKEND=memory keeps sessions in this process only.
+    """
+    global _session_store
+    if _session_store is None:
+        backend_name = os.getenv("SESSION_BACKEND", "sqlite").lower()
+        backend: Optional[SQLiteSessionBackend] = None
+        if backend_name == "sqlite":
+            backend = SQLiteSessionBackend(data_path(os.getenv("SESSION_DB_PATH", "sessions.db")))
+        _session_store = SessionStore(backend=backend)
+        print(f"✅ Session store initialized ({_session_store.stats()['backend']} backend)")
+    return _session_store
@@ -0,0 +1,191 @@
+import contextvars
+import inspect
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import wraps
+from typing import List, Optional
+
+from app.utils.paths import data_path
+
+TRACE_HEADER = "X-Trace-Id"
+_VALID_TRACE_ID = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+# Innermost open span of the current request. Async views, asyncio.to_thread
+# and tasks all copy the caller's context, so spans nest across them.
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def redact(text: Optional[str]) -> str:
+    """Stand-in for prompt/message contents in span attributes: only the size is kept."""
+    return f"<redacted {len(text or '')} chars>"
+
+
+class Span:
+    """One timed operation in a trace; children are the operations it called."""
+
+    __slots__ = ("name", "trace_id", "start", "end", "attributes", "error", "children")
+
+    def __init__(self, name: str, trace_id: str, attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attributes = dict(attributes or {})
+        self.error: Optional[str] = None
+        self.children: List["Span"] = []
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self, origin: float = None) -> dict:
+        origin = self.start if origin is None else origin
+        node = {
+            "name": self.name,
+            "startMs": round((self.start - origin) * 1000, 2),
+            "durationMs": round(self.duration * 1000, 2)
+        }
+        if self.attributes:
+            node["attributes"] = self.attributes
+        if self.error:
+            node["error"] = self.error
+        if self.end is None:
+            node["unfinished"] = True  # e.g. a losing hedge still being cancelled
+        if self.children:
+            node["children"] = [child.to_dict(origin) for child in list(self.children)]
+        return node
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time the with-block as a child of the current span.
+
+    A no-op (yields None) outside a traced request, so services can be
+    instrumented unconditionally.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.trace_id, attributes)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def traced(name: str):
+    """Decorator form of span() for sync and async functions."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_span_attributes(**attributes):
+    """Add attributes to the current span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace_id if current is not None else None
+
+
+class SlowRequestLog:
+    """
+    Appends the span tree of every trace slower than `threshold_ms` to a
+    JSON-lines file. Span attributes never hold prompt or message text
+    (see redact()), so the log is safe to ship.
+    """
+
+    def __init__(self, path: str = None, threshold_ms: float = None):
+        self.path = path if path is not None else data_path(os.getenv("TRACE_SLOW_LOG", "slow_requests.jsonl"))
+        self.threshold_ms = threshold_ms if threshold_ms is not None else float(os.getenv("TRACE_SLOW_MS", "10000"))
+        self._lock = threading.Lock()
+
+        self.traces = 0
+        self.slow = 0
+        self.write_errors = 0
+
+    def start(self, name: str, trace_id: str = None, **attributes):
+        """
+        Open a root span and make it current.
+
+        Returns:
+            (root span, context token) to pass to finish()
+        """
+        if not trace_id or not _VALID_TRACE_ID.match(trace_id):
+            trace_id = uuid.uuid4().hex
+        root = Span(name, trace_id, attributes)
+        return root, _current_span.set(root)
+
+    def finish(self, root: Span, token, **attributes):
+        """Close the root span, restore the previous context and log the trace if it was slow."""
+        root.end = time.perf_counter()
+        root.attributes.update(attributes)
+        _current_span.reset(token)
+        self.traces += 1
+        duration_ms = root.duration * 1000
+        if duration_ms < self.threshold_ms or not self.path:
+            return
+        self.slow += 1
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "traceId": root.trace_id,
+            "name": root.name,
+            "durationMs": round(duration_ms, 2),
+            "spans": root.to_dict()
+        }
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            print(f"🐢 Slow request {root.name} took {duration_ms:.0f}ms (trace {root.trace_id})")
+        except OSError as e:
+            self.write_errors += 1
+            print(f"⚠️ Could not write slow request log: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "thresholdMs": self.threshold_ms,
+            "path": self.path,
+            "traces": self.traces,
+            "slow": self.slow,
+            "writeErrors": self.write_errors
+        }
+
+
+# Singleton instance
+_slow_log_instance = None
+
+def get_slow_request_log() -> SlowRequestLog:
+    """Get or create the slow request log."""
+    global _slow_log_instance
+    if _slow_log_instance is None:
+        _slow_log_instance = SlowRequestLog()
+    return _slow_log_instance
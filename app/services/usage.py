@@ -0,0 +1,198 @@
+import contextvars
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from app.services.metrics import LLM_COST_USD, LLM_TOKENS
+
+# USD per million (input, output) tokens; override or extend with LLM_PRICING='{"model": [in, out]}'
+DEFAULT_PRICING = {
+    "gemini-2.0-flash": (0.10, 0.40),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "claude-3-sonnet-20240229": (3.00, 15.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+# Who is paying for the current LLM call. Set per request (endpoint) and
+# narrowed by the services (operation, prompt version); copied into async
+# tasks and worker threads like the tracing context.
+_tags: contextvars.ContextVar = contextvars.ContextVar("usage_tags", default={})
+
+
+def load_pricing() -> Dict[str, Tuple[float, float]]:
+    pricing = dict(DEFAULT_PRICING)
+    raw = os.getenv("LLM_PRICING")
+    if raw:
+        try:
+            pricing.update({model: (float(prices[0]), float(prices[1])) for model, prices in json.loads(raw).items()})
+        except (ValueError, TypeError, IndexError, AttributeError) as e:
+            print(f"⚠️ Ignoring invalid LLM_PRICING: {e}")
+    return pricing
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Local token estimate (~4 UTF-8 bytes per token); no tokenizer or API call
+    needed. Used for history budgets, rate-limit buckets and calls whose
+    provider reported no usage.
+    """
+    return math.ceil(len(text.encode("utf-8")) / 4) if text else 0
+
+
+def current_tags() -> dict:
+    return dict(_tags.get())
+
+
+def set_usage_tags(**tags):
+    """Set tags for the rest of the current context; returns a token for reset_usage_tags()."""
+    return _tags.set({**_tags.get(), **{key: value for key, value in tags.items() if value is not None}})
+
+
+def reset_usage_tags(token):
+    _tags.reset(token)
+
+
+@contextmanager
+def usage_tags(**tags):
+    """Tag every LLM call made inside the with-block (merged with the outer tags)."""
+    token = set_usage_tags(**tags)
+    try:
+        yield
+    finally:
+        reset_usage_tags(token)
+
+
+def _empty() -> dict:
+    return {"calls": 0, "inputTokens": 0, "outputTokens": 0, "costUsd": 0.0, "estimatedCalls": 0}
+
+
+def _add(totals: dict, input_tokens: int, output_tokens: int, cost: float, estimated: bool):
+    totals["calls"] += 1
+    totals["inputTokens"] += input_tokens
+    totals["outputTokens"] += output_tokens
+    totals["costUsd"] += cost
+    totals["estimatedCalls"] += int(estimated)
+
+
+def _rounded(totals: dict) -> dict:
+    return dict(totals, costUsd=round(totals["costUsd"], 6))
+
+
+class UsageTracker:
+    """
+    In-memory token and cost accounting for LLM calls.
+
+    Each successful call is recorded with the provider's reported token
+    counts (estimated from text length when it reports none, e.g. streams)
+    and its cost from the pricing table, tagged with the endpoint, the
+    operation (reply, editor, summary) and the prompt version it ran on.
+    Totals per endpoint, provider, operation and endpoint/operation pair
+    are kept forever; the per prompt version breakdown keeps the most
+    recent `max_versions` versions.
+    """
+
+    def __init__(self, pricing: Dict[str, Tuple[float, float]] = None, max_versions: int = None):
+        self.pricing = pricing if pricing is not None else load_pricing()
+        self.max_versions = max_versions if max_versions is not None else int(os.getenv("USAGE_MAX_PROMPT_VERSIONS", "200"))
+        self._lock = threading.Lock()
+        self._totals = _empty()
+        self._groups: Dict[str, Dict[str, dict]] = {
+            "byEndpoint": {}, "byProvider": {}, "byOperation": {}, "byEndpointOperation": {}
+        }
+        self._versions: "OrderedDict[str, dict]" = OrderedDict()
+        self.unpriced_models = set()
+
+    def cost(self, model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+        prices = self.pricing.get(model)
+        if prices is None:
+            return None
+        return (input_tokens * prices[0] + output_tokens * prices[1]) / 1_000_000
+
+    def record(
+        self,
+        provider: str,
+        model: str,
+        input_tokens: int,
+        output_tokens: int,
+        estimated: bool = False,
+        tags: dict = None
+    ) -> dict:
+        """Record one call; returns the entry as recorded (tags, tokens, cost)."""
+        tags = current_tags() if tags is None else tags
+        endpoint = tags.get("endpoint", "other")
+        operation = tags.get("operation", "other")
+        version = tags.get("prompt_version")
+        cost = self.cost(model, input_tokens, output_tokens)
+        if cost is None:
+            self.unpriced_models.add(model)
+            cost = 0.0
+
+        with self._lock:
+            _add(self._totals, input_tokens, output_tokens, cost, estimated)
+            for group, key in (
+                ("byEndpoint", endpoint),
+                ("byProvider", f"{provider}/{model}"),
+                ("byOperation", operation),
+                ("byEndpointOperation", f"{endpoint}:{operation}")
+            ):
+                _add(self._groups[group].setdefault(key, _empty()), input_tokens, output_tokens, cost, estimated)
+            if version:
+                entry = self._versions.get(version)
+                if entry is None:
+                    entry = self._versions[version] = _empty()
+                    while len(self._versions) > self.max_versions:
+                        self._versions.popitem(last=False)
+                self._versions.move_to_end(version)
+                _add(entry, input_tokens, output_tokens, cost, estimated)
+
+        LLM_TOKENS.inc(input_tokens, provider=provider, model=model, endpoint=endpoint, direction="input")
+        LLM_TOKENS.inc(output_tokens, provider=provider, model=model, endpoint=endpoint, direction="output")
+        LLM_COST_USD.inc(cost, provider=provider, model=model, endpoint=endpoint)
+        return {"endpoint": endpoint, "operation": operation, "promptVersion": version,
+                "inputTokens": input_tokens, "outputTokens": output_tokens, "costUsd": cost}
+
+    def snapshot(self) -> dict:
+        """Totals only (cheap), e.g. to diff before/after a training run."""
+        with self._lock:
+            return _rounded(self._totals)
+
+    def stats(self) -> dict:
+        with self._lock:
+            report = {"totals": _rounded(self._totals)}
+            for group, values in self._groups.items():
+                report[group] = {key: _rounded(totals) for key, totals in sorted(values.items())}
+            report["byPromptVersion"] = {key: _rounded(totals) for key, totals in self._versions.items()}
+        report["unpricedModels"] = sorted(self.unpriced_models)
+        return report
+
+
+# Singleton instance
+_tracker_instance = None
+_tracker_lock = threading.Lock()
+
+def get_usage_tracker() -> UsageTracker:
+    """Get or create the usage tracker."""
+    global _tracker_instance
+    with _tracker_lock:
+        if _tracker_instance is None:
+            _tracker_instance = UsageTracker()
+        return _tracker_instance
+
+
+def record_llm_usage(
+    provider: str,
+    model: str,
+    prompt: str,
+    text: str,
+    usage: Optional[Tuple[int, int]],
+    tags: dict = None
+) -> dict:
+    """Record a call's reported (input, output) tokens, or estimates from the text when it had none."""
+    if usage is None:
+        return get_usage_tracker().record(provider, model, estimate_tokens(prompt), estimate_tokens(text),
+                                          estimated=True, tags=tags)
+    return get_usage_tracker().record(provider, model, int(usage[0] or 0), int(usage[1] or 0), tags=tags)
@@ -1,7 +1,10 @@
 # Utils package
 from app.utils.conversation_parser import (
     load_conversations,
+    iter_conversations,
     parse_conversation_pairs,
+    iter_conversation_pairs,
     format_client_sequence,
-    format_chat_history
+    format_chat_history,
+    ChatHistoryView
 )
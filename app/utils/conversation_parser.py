@@ -1,32 +1,189 @@
+import gzip
 import json
-from typing import List, Dict, Tuple
+import sys
+from itertools import islice
+from collections.abc import Sequence
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+class ConversationMessages:
+    """
+    One conversation's messages, shared by every training pair cut from it.
+    
+    Chat-history lines ("[ROLE]: text") are rendered lazily and at most once
+    per message, no matter how many pairs reference the conversation.
+    """
+    __slots__ = ("messages", "_lines")
+    
+    def __init__(self, messages: List[Dict]):
+        self.messages = messages
+        self._lines: List[str] = []
+    
+    @staticmethod
+    def role(msg: Dict) -> str:
+        return "client" if msg.get('direction') == 'in' else "consultant"
+    
+    def lines(self, length: int) -> List[str]:
+        """Rendered history lines for the first `length` messages."""
+        for msg in self.messages[len(self._lines):length]:
+            self._lines.append(f"[{self.role(msg).upper()}]: {msg.get('text', '')}")
+        return self._lines[:length]
+
+
+class ChatHistoryView(Sequence):
+    """
+    Read-only chat history for a training pair: the first `length` messages
+    of a shared ConversationMessages, exposed as {"role", "message"} dicts.
+    
+    Nothing is copied when a pair is created, so extraction is linear in the
+    number of messages; dicts and the formatted string are only built when
+    the pair is consumed.
+    """
+    __slots__ = ("_shared", "_length", "_rendered")
+    
+    def __init__(self, shared: ConversationMessages, length: int):
+        self._shared = shared
+        self._length = length
+        self._rendered = None
+    
+    def __len__(self) -> int:
+        return self._length
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("chat history index out of range")
+        msg = self._shared.messages[index]
+        return {"role": ConversationMessages.role(msg), "message": msg.get('text', '')}
+    
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (ChatHistoryView, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+    
+    def __repr__(self) -> str:
+        return f"ChatHistoryView({self._length} messages)"
+    
+    def render(self) -> str:
+        """Formatted history string (same output as format_chat_history), cached."""
+        if self._rendered is None:
+            self._rendered = "\n".join(self._shared.lines(self._length)) if self._length else "No previous messages."
+        return self._rendered
 
 
 def load_conversations(filepath: str) -> List[Dict]:
-    """Load conversations from JSON file."""
-    with open(filepath, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    """Load conversations from a JSON array, JSONL or gzipped file."""
+    return list(iter_conversations(filepath))
+
 
+def _open_text(filepath: str):
+    """Open a file as UTF-8 text, transparently decompressing gzip."""
+    with open(filepath, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(filepath, 'rt', encoding='utf-8')
+    return open(filepath, 'r', encoding='utf-8')
 
-def parse_conversation_pairs(conversations: List[Dict]) -> List[Dict]:
+
+def iter_conversations(filepath: str, chunk_size: int = 1 << 16) -> Iterator[Dict]:
+    """
+    Stream conversations from an export one at a time.
+    
+    Supports a top-level JSON array (parsed incrementally, element by
+    element), JSONL / concatenated JSON objects, and gzip of either. Only
+    the current conversation and one read chunk are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    
+    with _open_text(filepath) as f:
+        buffer = f.read(chunk_size)
+        eof = not buffer
+        pos = 0
+        
+        # Skip leading whitespace to detect array vs JSONL
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            buffer, pos = f.read(chunk_size), 0
+            eof = not buffer
+        
+        in_array = pos < len(buffer) and buffer[pos] == '['
+        if in_array:
+            pos += 1
+        
+        while True:
+            # Skip separators between values
+            while pos < len(buffer) and (buffer[pos].isspace() or (in_array and buffer[pos] == ',')):
+                pos += 1
+            
+            if pos < len(buffer) and in_array and buffer[pos] == ']':
+                return
+            
+            if pos >= len(buffer):
+                if eof:
+                    if in_array:
+                        raise ValueError(f"Unterminated JSON array in {filepath}")
+                    return
+                buffer, pos = f.read(chunk_size), 0
+                eof = not buffer
+                continue
+            
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                value, end = None, None
+            
+            # Incomplete value (or one that might continue past the buffer): read more
+            if end is None or (end == len(buffer) and not eof):
+                if eof:
+                    raise ValueError(f"Invalid JSON in {filepath} near character offset {pos}")
+                more = f.read(chunk_size)
+                eof = not more
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            
+            yield value
+            pos = end
+            
+            # Drop consumed text so the buffer never grows past one value + chunk
+            if pos > chunk_size:
+                buffer, pos = buffer[pos:], 0
+
+
+def parse_conversation_pairs(conversations: Iterable[Dict]) -> List[Dict]:
     """
     Parse conversations into training pairs.
     
     Each pair contains:
     - client_sequence: List of consecutive client messages
     - consultant_reply: List of consecutive consultant messages
-    - chat_history: All messages before this exchange
+    - chat_history: All messages before this exchange (a ChatHistoryView
+      sharing the conversation's message list)
     - scenario: The conversation scenario/context
     
     Returns:
         List of training pair dictionaries
     """
-    training_pairs = []
+    return list(iter_conversation_pairs(conversations))
+
+
+def iter_conversation_pairs(conversations: Iterable[Dict]) -> Iterator[Dict]:
+    """
+    Generator version of parse_conversation_pairs.
     
+    Consumes conversations lazily (e.g. from iter_conversations), so a
+    whole export never has to be in memory at once.
+    """
     for conv in conversations:
         messages = conv.get('conversation', [])
         scenario = conv.get('scenario', 'Unknown')
         contact_id = conv.get('contact_id', '')
+        shared = ConversationMessages(messages)
         
         i = 0
         while i < len(messages):
@@ -46,24 +203,14 @@ def parse_conversation_pairs(conversations: List[Dict]) -> List[Dict]:
             
             # Only add if we have both client message and consultant reply
             if client_sequence and consultant_reply:
-                # Build chat history from messages before this exchange
-                chat_history = []
-                for msg in messages[:client_start]:
-                    role = "client" if msg.get('direction') == 'in' else "consultant"
-                    chat_history.append({
-                        "role": role,
-                        "message": msg.get('text', '')
-                    })
-                
-                training_pairs.append({
+                yield {
                     "client_sequence": client_sequence,
                     "consultant_reply": consultant_reply,
-                    "chat_history": chat_history,
+                    # Messages before this exchange, by prefix length (no copy)
+                    "chat_history": ChatHistoryView(shared, client_start),
                     "scenario": scenario,
                     "contact_id": contact_id
-                })
-    
-    return training_pairs
+                }
 
 
 def format_client_sequence(sequence: List[str]) -> str:
@@ -75,6 +222,8 @@ def format_client_sequence(sequence: List[str]) -> str:
 
 def format_chat_history(history: List[Dict]) -> str:
     """Format chat history for inclusion in prompts."""
+    if isinstance(history, ChatHistoryView):
+        return history.render()
     if not history:
         return "No previous messages."
     
@@ -96,9 +245,19 @@ def format_chat_history_for_api(history: List[Dict]) -> List[Dict]:
 
 def get_sample_training_data(filepath: str = "conversations.json", limit: int = 5) -> List[Dict]:
     """Get sample training data for testing."""
-    conversations = load_conversations(filepath)
-    pairs = parse_conversation_pairs(conversations)
-    return pairs[:limit]
+    pairs = iter_conversation_pairs(iter_conversations(filepath))
+    return list(islice(pairs, limit))
+
+
+def peak_memory_mb() -> float:
+    """Peak resident memory of this process in MB (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,22 @@
+import os
+
+# Repository root (the directory holding app/ and scripts/)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def project_path(path: str) -> str:
+    """Resolve a relative path against the project root, so it does not depend on the working directory."""
+    return path if os.path.isabs(path) else os.path.join(PROJECT_ROOT, path)
+
+
+def data_path(path: str) -> str:
+    """
+    Resolve a relative runtime data file (indexes, SQLite databases, logs)
+    under DATA_DIR (default: data/ in the project root), creating the
+    directory. Absolute and empty paths are returned unchanged.
+    """
+    if not path or os.path.isabs(path):
+        return path
+    resolved = os.path.join(project_path(os.getenv("DATA_DIR", "data")), path)
+    os.makedirs(os.path.dirname(resolved), exist_ok=True)
+    return resolved
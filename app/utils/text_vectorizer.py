@@ -0,0 +1,71 @@
+import re
+import zlib
+from typing import List
+
+# NumPy is optional: without it the vectorizer (and the features built on it) is unavailable
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+STOPWORDS = frozenset("""
+a an the and or but if of to in on at for from by with about as into is are was were be been being
+i me my we our you your he she it its they them their this that these those there here
+do does did have has had can could would should will shall may might must
+what which who whom whose when where why how please hi hello hey thanks thank
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords removed and a light plural strip."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class HashingVectorizer:
+    """
+    CPU-only text embedding via the hashing trick.
+
+    Each text becomes a dense, L2-normalized float32 vector of `dim` buckets
+    built from content words, word bigrams and character trigrams (so "docs"
+    and "documents" still overlap). No vocabulary or fitting is needed, and
+    the same text always maps to the same vector.
+    """
+
+    def __init__(self, dim: int = 256):
+        if np is None:
+            raise ImportError("numpy is required for HashingVectorizer")
+        self.dim = dim
+
+    def features(self, text: str) -> List[tuple]:
+        """(feature, weight) pairs for a text."""
+        tokens = tokenize(text)
+        feats = [(f"w:{t}", 1.0) for t in tokens]
+        feats.extend((f"b:{a}_{b}", 0.7) for a, b in zip(tokens, tokens[1:]))
+        for token in tokens:
+            padded = f"<{token}>"
+            feats.extend((f"c:{padded[i:i + 3]}", 0.3) for i in range(len(padded) - 2))
+        return feats
+
+    def transform_one(self, text: str) -> "np.ndarray":
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self.features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += weight if (h >> 31) & 1 else -weight
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+    def transform(self, texts: List[str]) -> "np.ndarray":
+        """Embed many texts into an (n, dim) matrix."""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            matrix[i] = self.transform_one(text)
+        return matrix
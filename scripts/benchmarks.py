@@ -0,0 +1,259 @@
+"""
+Microbenchmarks for the /generate-reply hot path.
+
+Each stage of a request is timed in isolation with fake LLM and database
+stand-ins (no API keys, no network), so numbers reflect only our own code:
+
+    history_short        format a 10-message chatHistory (under the token budget)
+    history_long         compact an 80-message chatHistory (cached rolling summary)
+    prompt_render        fill a large (~4x base) prompt incl. retrieved few-shot examples
+    retrieval_search     BM25 top-k over every exchange in conversations.json
+    postprocess          reply rules on real consultant replies (both modes)
+    generate_json        parse messy editor output (fences, raw newlines, truncation)
+    parse_pairs_100x     parse_conversation_pairs on conversations.json repeated 100x
+    generate_reply       end to end through PromptEditorService.generate_reply
+
+Results are compared with scripts/benchmark_baselines.json; any stage slower
+than its baseline by more than --threshold (after one confirming re-run)
+fails the run. Baselines are machine-specific: re-save them (--save) when
+switching hardware or after an intended change.
+
+Usage:
+    python scripts/benchmarks.py
+    python scripts/benchmarks.py --stage postprocess --stage generate_json
+    python scripts/benchmarks.py --save
+    python scripts/benchmarks.py --threshold 0.5
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import timeit
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.prompts.base_prompts import CHATBOT_PROMPT
+from app.services.history_compactor import HistoryCompactor
+from app.services.llm_service import LLMService
+from app.services.prompt_editor import PromptEditorService
+from app.services.retrieval import BM25Index, RetrievalService
+from app.utils.conversation_parser import (
+    iter_conversations,
+    parse_conversation_pairs,
+    format_client_sequence,
+    format_chat_history
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONVERSATIONS_PATH = os.path.join(ROOT, "conversations.json")
+BASELINE_PATH = os.path.join(ROOT, "scripts", "benchmark_baselines.json")
+
+MESSY_EDITOR_OUTPUTS = [
+    '```json\n{"prompt": "You are a consultant.\\nBe brief.", "changes_made": "Shorter replies"}\n```',
+    'Here is the updated prompt:\n{"prompt": "You are a consultant.\nBe brief.\nNo greetings on follow-ups.", "changes_made": "Greeting rule"}',
+    '{"prompt": "You are a consultant. Say \\"Sawasdee\\" once.\nMention fees.", "changes_made": "Fees", }',
+    'Sorry, I could not produce JSON this time.',
+]
+
+
+class FakeLLM(LLMService):
+    """LLMService stand-in: cycles through canned responses instantly."""
+
+    def __init__(self, responses):
+        self.provider = "fake"
+        self.model_name = "fake-llm"
+        self._responses = itertools.cycle(responses)
+
+    def generate(self, prompt: str, max_tokens: int = 1024) -> str:
+        return next(self._responses)
+
+    async def agenerate(self, prompt: str, max_tokens: int = 1024) -> str:
+        return next(self._responses)
+
+
+class FakeDB:
+    """DatabaseService stand-in holding one prompt head in memory."""
+
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+
+    def get_prompt_head(self, name: str = "chatbot_prompt"):
+        return (self.prompt, 1) if name == "chatbot_prompt" else None
+
+    def load_prompt_head(self, name: str = "chatbot_prompt"):
+        return self.get_prompt_head(name)
+
+    async def aget_prompt_head(self, name: str = "chatbot_prompt"):
+        return self.get_prompt_head(name)
+
+    def get_prompt(self, name: str = "chatbot_prompt"):
+        head = self.get_prompt_head(name)
+        return head[0] if head else None
+
+
+def large_prompt() -> str:
+    """The base prompt plus ~3x its size in learned rules, as after long training."""
+    rules = "\n".join(
+        f"- Learned rule {i}: when the client mentions topic {i % 40}, answer with the fee, "
+        f"processing time and document list for that case in at most two sentences."
+        for i in range(len(CHATBOT_PROMPT) * 3 // 140)
+    )
+    split_at = CHATBOT_PROMPT.find("CHAT HISTORY:")
+    return CHATBOT_PROMPT[:split_at] + "LEARNED RULES:\n" + rules + "\n\n" + CHATBOT_PROMPT[split_at:]
+
+
+def api_history(conversation: dict, limit: int) -> list:
+    """A conversation's messages as a /generate-reply chatHistory."""
+    return [
+        {"role": "client" if msg.get("direction") == "in" else "consultant", "message": msg.get("text", "")}
+        for msg in conversation.get("conversation", [])[:limit]
+    ]
+
+
+def build_stages():
+    conversations = list(iter_conversations(CONVERSATIONS_PATH))
+    pairs = parse_conversation_pairs(conversations)
+    replies = ["\n".join(pair["consultant_reply"]) for pair in pairs]
+    # Raw LLM-style output: greeting and a handholding line around real replies
+    raw_replies = [f"Hi there!\n{reply}\nWould you like me to check anything else?" for reply in replies]
+
+    index = BM25Index()
+    for pair in pairs:
+        index.add(format_client_sequence(pair["client_sequence"]), "\n".join(pair["consultant_reply"]))
+    retrieval = RetrievalService(path="")
+    retrieval.index = index
+
+    prompt = large_prompt()
+    editor = PromptEditorService(llm=FakeLLM(raw_replies), db=FakeDB(prompt), retrieval=retrieval)
+    editor.reply_cache.max_entries = 0
+    json_llm = FakeLLM(MESSY_EDITOR_OUTPUTS)
+
+    longest = max(conversations, key=lambda conv: len(conv.get("conversation", [])))
+    short_history = api_history(longest, 10)
+    long_history = (api_history(longest, 80) * 4)[:80]
+    compactor = HistoryCompactor(llm=FakeLLM(["Client is a US remote worker in Bali applying for the DTV."]))
+    compactor.compact(long_history, "bench-contact")  # create the summary once; steady state reuses it
+
+    messages = [format_client_sequence(pair["client_sequence"]) for pair in pairs]
+    histories = [format_chat_history(pair["chat_history"]) for pair in pairs]
+    exchanges = list(zip(messages, histories))
+    scaled = conversations * 100
+    counter = itertools.count()
+
+    def next_exchange():
+        i = next(counter)
+        message, history = exchanges[i % len(exchanges)]
+        # Unique message per call so the reply cache can never short-circuit the pipeline
+        return f"{message} ({i})", history
+
+    def render():
+        message, history = next_exchange()
+        editor._build_reply_prompt(prompt, message, history)
+
+    def postprocess():
+        for i, reply in enumerate(raw_replies[:20]):
+            editor._postprocess_reply(reply, histories[i] if i % 2 else "No previous messages.")
+
+    def generate_json():
+        for _ in MESSY_EDITOR_OUTPUTS:
+            json_llm.generate_json("editor input")
+
+    def generate_reply():
+        message, history = next_exchange()
+        editor.generate_reply(message, history)
+
+    return {
+        "history_short": lambda: compactor.compact(short_history, "bench-short"),
+        "history_long": lambda: compactor.compact(long_history, "bench-contact"),
+        "prompt_render": render,
+        "retrieval_search": lambda: retrieval.search(next_exchange()[0]),
+        "postprocess": postprocess,
+        "generate_json": generate_json,
+        "parse_pairs_100x": lambda: parse_conversation_pairs(scaled),
+        "generate_reply": generate_reply,
+    }
+
+
+def measure(func, repeat: int) -> float:
+    """Best seconds per call over `repeat` runs of an auto-sized loop."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:9.2f} ms"
+    return f"{seconds * 1e6:9.2f} µs"
+
+
+def load_baselines() -> dict:
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        return json.load(f).get("stages", {})
+
+
+def save_baselines(results: dict):
+    stages = load_baselines()
+    stages.update(results)
+    with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+        json.dump({
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "stages": stages
+        }, f, indent=2)
+        f.write("\n")
+    print(f"\n✅ Saved {len(results)} baselines to {BASELINE_PATH}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the /generate-reply hot path")
+    parser.add_argument("--stage", action="append", help="Only run this stage (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repetitions per stage; best is kept (default: 5)")
+    parser.add_argument("--threshold", type=float, default=0.3,
+                        help="Fail when a stage is this much slower than its baseline (default: 0.3 = 30%%)")
+    parser.add_argument("--save", action="store_true", help="Store these results as the new baselines")
+    args = parser.parse_args()
+
+    stages = build_stages()
+    selected = args.stage or list(stages)
+    unknown = [name for name in selected if name not in stages]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}; choose from {', '.join(stages)}")
+
+    baselines = load_baselines()
+    results = {}
+    regressions = []
+    print(f"{'stage':<18} {'time/op':>12} {'baseline':>12} {'change':>8}")
+    for name in selected:
+        seconds = measure(stages[name], args.repeat)
+        baseline = baselines.get(name)
+        if baseline and seconds / baseline - 1 > args.threshold:
+            # Confirm before failing: one noisy run shouldn't break the build
+            seconds = min(seconds, measure(stages[name], args.repeat * 2))
+        results[name] = seconds
+        if baseline:
+            change = seconds / baseline - 1
+            flag = "  ❌" if change > args.threshold else ""
+            print(f"{name:<18} {format_seconds(seconds)} {format_seconds(baseline)} {change:+7.1%}{flag}")
+            if change > args.threshold:
+                regressions.append(name)
+        else:
+            print(f"{name:<18} {format_seconds(seconds)} {'—':>12}")
+
+    if args.save:
+        save_baselines(results)
+        return 0
+    if regressions:
+        print(f"\n❌ Regressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print("\n✅ No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
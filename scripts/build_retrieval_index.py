@@ -0,0 +1,91 @@
+"""
+Build the BM25 few-shot retrieval index from a conversation export.
+
+Every (client sequence -> consultant reply) pair becomes one example that
+generate_reply can inject into the prompt, except the pairs held out for
+prompt evaluation (PROMPT_EVAL_*), whose replies must not be shown to the
+model. The index is written to RETRIEVAL_INDEX_PATH (default:
+data/retrieval_index.json.gz).
+
+Usage:
+    python scripts/build_retrieval_index.py
+    python scripts/build_retrieval_index.py --conversations export.jsonl.gz
+    python scripts/build_retrieval_index.py --append new_conversations.jsonl
+
+--append adds to the existing index (including examples journaled at
+runtime by /improve-ai) instead of rebuilding from scratch. Either way the
+journal is folded into the saved index and cleared.
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from app.utils.conversation_parser import (
+    iter_conversations,
+    iter_conversation_pairs,
+    format_client_sequence,
+    peak_memory_mb
+)
+from app.services.prompt_evaluator import PromptEvaluator
+from app.services.retrieval import BM25Index, RetrievalService
+from app.utils.paths import data_path
+
+
+def parse_args():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Build the BM25 retrieval index for few-shot prompting")
+    parser.add_argument("--conversations", default=os.path.join(root, "conversations.json"),
+                        help="Conversation export: JSON array or JSONL, optionally gzipped")
+    parser.add_argument("--output", default=os.getenv("RETRIEVAL_INDEX_PATH", "retrieval_index.json.gz"),
+                        help="Index file to write (default: RETRIEVAL_INDEX_PATH; relative paths go under DATA_DIR)")
+    parser.add_argument("--append", action="store_true", help="Add to the existing index instead of rebuilding")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    args.output = data_path(args.output)
+    started = time.time()
+
+    journal_path = f"{args.output}.journal.jsonl"
+    if args.append and os.path.exists(args.output):
+        index = RetrievalService.load_index(args.output)
+        print(f"📂 Loaded existing index: {len(index)} examples")
+    else:
+        index = BM25Index()
+        journaled = RetrievalService.replay_journal(index, journal_path)
+        if journaled:
+            print(f"📂 Kept {journaled} examples journaled at runtime")
+
+    # Only the held-out split is used, so no LLM or prompt builder is needed
+    evaluator = PromptEvaluator(llm=None, build_prompt=None)
+
+    print(f"📂 Streaming conversations from: {args.conversations}")
+    added = held_out = 0
+    for pair in iter_conversation_pairs(iter_conversations(args.conversations)):
+        if evaluator.is_held_out(pair):
+            held_out += 1
+            continue
+        index.add(format_client_sequence(pair['client_sequence']), "\n".join(pair['consultant_reply']))
+        added += 1
+
+    index.save(args.output)
+    if os.path.exists(journal_path):
+        os.remove(journal_path)
+
+    print(f"✅ Indexed {added} new examples ({len(index)} total, {len(index.postings)} terms; {held_out} held out for evaluation)")
+    print(f"✅ Saved to {args.output} in {time.time() - started:.1f}s")
+    peak = peak_memory_mb()
+    if peak is not None:
+        print(f"💾 Peak memory: {peak} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Check for the durable /improve-ai queue (app.services.improvement_queue):
+claims, lease renewal and recovery, and partial batch failures.
+
+Two ImprovementQueue instances share one temporary SQLite file, standing
+in for two gunicorn workers, with a fake editor instead of the LLM:
+
+    claims          both queues claim at once; every job is claimed
+                    exactly once, by the queue recorded as its owner
+    leases          one queue keeps renewing its lease, the other stops
+                    (its process "died"); after the lease runs out only the
+                    dead queue's jobs are requeued and claimed again
+    partial batch   a claimed batch where some predictions fail: those
+                    jobs fail, the rest are learned from in one editor call
+    editor error    an editor exception fails every job still unfinished
+    all failed      no editor call when every prediction failed
+
+Usage:
+    python scripts/check_improvement_queue.py
+
+Exits non-zero on any failed check.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.improvement_queue import DONE, FAILED, PENDING, RUNNING, ImprovementQueue
+
+LEASE = 1.0
+
+
+class FakeEditor:
+    """Prompt editor stand-in: predictions fail for messages containing "fail"; improvements are recorded."""
+
+    def __init__(self):
+        self.improvements = []
+        self.raise_on_improve = False
+        self._lock = threading.Lock()
+
+    async def agenerate_replies(self, items: list, concurrency: int = None) -> list:
+        return [{"error": "fake prediction failure"} if "fail" in message else {"aiReply": f"reply to {message}"}
+                for message, _ in items]
+
+    def _improve(self, examples: list) -> dict:
+        if self.raise_on_improve:
+            raise RuntimeError("fake editor crash")
+        with self._lock:
+            self.improvements.append([example["client_message"] for example in examples])
+        return {"success": True, "updated_prompt": f"prompt after {len(self.improvements)} improvements",
+                "changes_made": f"learned from {len(examples)} examples"}
+
+    def improve_from_example(self, **example) -> dict:
+        return self._improve([example])
+
+    def improve_from_batch(self, examples: list) -> dict:
+        return self._improve(examples)
+
+
+class Checker:
+    def __init__(self):
+        self.failures = 0
+
+    def check(self, ok: bool, label: str, detail: str = ""):
+        if not ok:
+            self.failures += 1
+        print(f"{'✅' if ok else '❌'} {label}{f': {detail}' if detail and not ok else ''}")
+
+
+def statuses(queue: ImprovementQueue, job_ids: list) -> dict:
+    return {job_id: queue.get(job_id)["status"] for job_id in job_ids}
+
+
+def owners(queue: ImprovementQueue) -> dict:
+    return dict(queue._connect().execute("SELECT id, claimed_by FROM improvement_jobs WHERE status = ?", (RUNNING,)))
+
+
+def claim_together(queues: list) -> list:
+    """Run _claim() on every queue at the same moment; returns each one's claimed job ids."""
+    barrier = threading.Barrier(len(queues))
+    claimed = [None] * len(queues)
+
+    def run(index, queue):
+        barrier.wait(timeout=10)
+        claimed[index] = [job_id for job_id, _ in queue._claim()]
+
+    threads = [threading.Thread(target=run, args=(index, queue)) for index, queue in enumerate(queues)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return claimed
+
+
+def main():
+    checker = Checker()
+    editor = FakeEditor()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "improvement_queue.db")
+        alive = ImprovementQueue(path=path, workers=1, max_batch=4, lease=LEASE, editor=editor)
+        dying = ImprovementQueue(path=path, workers=1, max_batch=4, lease=LEASE, editor=editor)
+
+        # claims: 8 jobs, two queues of batch 4 claiming at once
+        job_ids = [alive.enqueue(f"message {index}", "No previous messages.", f"answer {index}") for index in range(8)]
+        claimed_alive, claimed_dying = claim_together([alive, dying])
+        claimed = claimed_alive + claimed_dying
+        checker.check(sorted(claimed) == sorted(job_ids), "claims: every job claimed exactly once",
+                      f"{len(claimed)} claims, {len(set(claimed))} distinct, {len(job_ids)} jobs")
+        running = owners(alive)
+        checker.check(all(running[job_id] == alive.owner for job_id in claimed_alive)
+                      and all(running[job_id] == dying.owner for job_id in claimed_dying),
+                      "claims: each job is owned by the queue that claimed it")
+
+        # leases: only `alive` renews; after the lease, `dying`'s jobs (and only those) come back
+        renewer = threading.Thread(target=alive._renew_leases, daemon=True)
+        renewer.start()
+        time.sleep(LEASE * 1.5)
+        reclaimed = [job_id for job_id, _ in alive._claim()]
+        checker.check(sorted(reclaimed) == sorted(claimed_dying),
+                      "leases: the dead queue's expired jobs are requeued and claimed once",
+                      f"reclaimed {len(set(reclaimed) & set(claimed_dying))}/{len(claimed_dying)} of the dead queue's "
+                      f"jobs and {len(set(reclaimed) & set(claimed_alive))} of the live queue's")
+        running = owners(alive)
+        checker.check(all(running[job_id] == alive.owner for job_id in claimed),
+                      "leases: the live queue's own jobs were never requeued")
+        alive.stop()
+        renewer.join(timeout=LEASE)
+        checker.check(not renewer.is_alive(), "leases: renewal stops with the queue")
+
+        # partial batch: the claimed jobs are processed; some predictions fail
+        for job_id in claimed:
+            alive._finish(job_id, DONE, "setup", 0)
+        batch = [alive.enqueue(message, "No previous messages.", "answer")
+                 for message in ("ok one", "fail one", "ok two", "fail two")]
+        jobs = alive._claim()
+        alive._process(jobs)
+        result = statuses(alive, batch)
+        checker.check(result == {batch[0]: DONE, batch[1]: FAILED, batch[2]: DONE, batch[3]: FAILED},
+                      "partial batch: failed predictions fail, the rest are done", str(result))
+        checker.check(editor.improvements == [["ok one", "ok two"]],
+                      "partial batch: one editor call with only the predicted examples", str(editor.improvements))
+        failed = alive.get(batch[1])
+        done = alive.get(batch[0])
+        checker.check(failed.get("error", "").startswith("Prediction failed")
+                      and done["result"]["predictedReply"] == "reply to ok one"
+                      and done["batchSize"] == 4 and done["batchId"] == failed["batchId"],
+                      "partial batch: errors, predictions and batch ids recorded", f"{failed} / {done}")
+
+        # editor error: every job not already failed by its prediction fails with the error
+        editor.raise_on_improve = True
+        batch = [alive.enqueue(message, "No previous messages.", "answer") for message in ("ok three", "fail three")]
+        alive._process(alive._claim())
+        crashed = alive.get(batch[0])
+        checker.check(crashed["status"] == FAILED and "fake editor crash" in crashed.get("error", "")
+                      and alive.get(batch[1]).get("error", "").startswith("Prediction failed"),
+                      "editor error: unfinished jobs fail with the error", f"{crashed}")
+        editor.raise_on_improve = False
+
+        # all failed: no editor call
+        calls = len(editor.improvements)
+        batch = [alive.enqueue(f"fail {index}", "No previous messages.", "answer") for index in range(3)]
+        alive._process(alive._claim())
+        checker.check(set(statuses(alive, batch).values()) == {FAILED} and len(editor.improvements) == calls,
+                      "all failed: every job fails without an editor call")
+
+        stats = alive.stats()
+        checker.check(stats["pending"] == 0 and stats["running"] == 0, "nothing left pending or running", str(stats))
+        checker.check(PENDING not in statuses(alive, job_ids).values(), "no job was lost")
+
+    sys.exit(1 if checker.failures else 0)
+
+
+if __name__ == "__main__":
+    main()
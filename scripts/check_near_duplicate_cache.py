@@ -0,0 +1,172 @@
+"""
+Precision check for the near-duplicate reply cache
+(app.services.near_duplicate_cache) on real client messages.
+
+Every distinct client message in conversations.json is cached with its own
+reply, then looked up again in four forms:
+
+    near-duplicates   the message with case, punctuation, spacing, greetings,
+                      apostrophes or emoji changed; must hit its own reply
+    changed numbers   the message with one number altered; must miss
+    non-paraphrases   every ordered pair of different corpus messages, one
+                      cached on its own and the other looked up; must never
+                      hit (shared boilerplate like "Perfect. Downloading the
+                      app now." included)
+    paraphrases       corpus pairs that ask the same question in other words,
+                      plus hand-written rewordings, looked up among all other
+                      messages; the cache is not semantic, so hits are only
+                      reported, but a paraphrase must never get another
+                      message's reply
+
+Usage:
+    python scripts/check_near_duplicate_cache.py
+    python scripts/check_near_duplicate_cache.py --threshold 0.85   # try another threshold
+
+Exits non-zero on any wrong hit or missed near-duplicate.
+"""
+import argparse
+import os
+import re
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.near_duplicate_cache import NearDuplicateCache
+from app.utils.conversation_parser import format_client_sequence, iter_conversation_pairs, iter_conversations
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONVERSATIONS_PATH = os.path.join(ROOT, "conversations.json")
+VERSION = "check"
+
+# Same question, different words, both taken from conversations.json
+CORPUS_PARAPHRASES = [
+    ("How long would I need to stay in Laos?", "Perfect. How long do I need to stay in Laos?"),
+    ("What documents do I need to prepare?", "Makes sense. What documents do I need to prepare before leaving?"),
+]
+
+# Hand-written rewordings of corpus messages
+PARAPHRASES = [
+    ("Hi, I'm a freelance graphic designer. Can I apply for DTV?",
+     "I do freelance graphic design work. Am I eligible for the DTV visa?"),
+    ("Hi, can you explain your pricing? I've seen different prices mentioned.",
+     "How much do you charge? I keep seeing different prices."),
+    ("Quick question - does crypto count towards the 500,000 THB requirement?",
+     "Can I use crypto holdings for the 500,000 THB proof of funds?"),
+    ("Hi, I'm currently in Thailand on tourist visa. Can I switch to DTV without leaving?",
+     "I'm in Thailand on a tourist visa right now. Is it possible to change to a DTV from inside the country?"),
+    ("I just got scheduled for an interview at the embassy next week. What should I prepare?",
+     "The embassy booked me for an interview next week, how do I get ready for it?"),
+]
+
+
+def near_duplicates(message: str) -> list:
+    """Variants of a message that only differ in what the cache normalizes away."""
+    variants = [
+        message.lower(),
+        message.upper(),
+        re.sub(r"[^\w\s]", "", message),
+        "  ".join(message.split()),
+        f"Hi! {message}",
+        f"Hello, {message} Thanks!",
+        message.replace("'", "").replace("’", ""),
+        f"{message} 🙏",
+    ]
+    return [variant for variant in variants if variant != message]
+
+
+def changed_numbers(message: str) -> list:
+    """The message with each of its numbers altered in turn."""
+    variants = []
+    for match in re.finditer(r"\d+", message):
+        changed = str(int(match.group()) + 1)
+        variants.append(message[:match.start()] + changed + message[match.end():])
+    return variants
+
+
+def load_messages(path: str) -> list:
+    messages = {format_client_sequence(pair["client_sequence"]) for pair in iter_conversation_pairs(iter_conversations(path))}
+    return sorted(message for message in messages if message.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check near-duplicate cache precision on real client messages")
+    parser.add_argument("--conversations", default=CONVERSATIONS_PATH, help="Conversation export to take messages from")
+    parser.add_argument("--threshold", type=float, help="Cosine threshold (default: NEAR_DUPLICATE_CACHE_THRESHOLD or 0.9)")
+    args = parser.parse_args()
+
+    messages = load_messages(args.conversations)
+    paraphrase_pairs = {frozenset(pair) for pair in CORPUS_PARAPHRASES}
+    cache = NearDuplicateCache(enabled=True, threshold=args.threshold)
+    if not cache.enabled:
+        sys.exit(1)
+    for message in messages:
+        cache.set(VERSION, message, message)  # each message's "reply" is itself
+    print(f"📚 {len(messages)} distinct client messages cached (threshold {cache.threshold})")
+    failures = 0
+
+    missed = wrong = total = 0
+    for message in messages:
+        for variant in near_duplicates(message):
+            total += 1
+            reply = cache.get(VERSION, variant)
+            if reply is None:
+                missed += 1
+                print(f"❌ Near-duplicate missed:\n   cached:  {message!r}\n   lookup:  {variant!r}")
+            elif reply != message:
+                wrong += 1
+                print(f"❌ Near-duplicate served another reply:\n   lookup:  {variant!r}\n   got:     {reply!r}")
+    failures += missed + wrong
+    print(f"{'✅' if not missed + wrong else '❌'} Near-duplicates: {total - missed - wrong}/{total} hit their own reply")
+
+    hits = total = 0
+    for message in messages:
+        for variant in changed_numbers(message):
+            total += 1
+            reply = cache.get(VERSION, variant)
+            if reply is not None:
+                hits += 1
+                print(f"❌ Changed number still hit:\n   lookup:  {variant!r}\n   got:     {reply!r}")
+    failures += hits
+    print(f"{'✅' if not hits else '❌'} Changed numbers: {total - hits}/{total} missed")
+
+    # One message cached at a time, so every other message is a lookup against exactly one entry
+    hits = total = 0
+    for cached in messages:
+        single = NearDuplicateCache(enabled=True, threshold=cache.threshold)
+        single.set(VERSION, cached, cached)
+        for lookup in messages:
+            if lookup == cached or frozenset((cached, lookup)) in paraphrase_pairs:
+                continue
+            total += 1
+            if single.get(VERSION, lookup) is None:
+                continue
+            hits += 1
+            print(f"❌ Different question hit:\n   cached:  {cached!r}\n   lookup:  {lookup!r}")
+    failures += hits
+    print(f"{'✅' if not hits else '❌'} Non-paraphrases: {total - hits}/{total} missed")
+
+    hits = wrong = 0
+    pairs = CORPUS_PARAPHRASES + PARAPHRASES
+    for original, paraphrase in pairs:
+        others = NearDuplicateCache(enabled=True, threshold=cache.threshold)
+        for message in [original] + messages:
+            if message != paraphrase:
+                others.set(VERSION, message, message)
+        reply = others.get(VERSION, paraphrase)
+        if reply is not None and reply != original:
+            wrong += 1
+            print(f"❌ Paraphrase served another reply:\n   lookup:  {paraphrase!r}\n   got:     {reply!r}")
+        elif reply is not None:
+            hits += 1
+        vectors = cache.vectorizer.transform([cache.normalize(original), cache.normalize(paraphrase)])
+        print(f"   cosine {float(vectors[0] @ vectors[1]):.3f}  {'hit ' if reply is not None else 'miss'}  {paraphrase!r}")
+    failures += wrong
+    print(f"{'✅' if not wrong else '❌'} Paraphrases: {hits}/{len(pairs)} hit, {wrong} served another reply "
+          f"(not a semantic cache; misses are expected)")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
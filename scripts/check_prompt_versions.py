@@ -0,0 +1,183 @@
+"""
+Concurrency check for versioned prompt writes
+(DatabaseService.commit_prompt_version / update_prompt and
+PromptEditorService._improve) against the fake Supabase from
+scripts/fake_services.py.
+
+Three races, each started from the same head by a barrier:
+
+    commit          two commit_prompt_version calls on the same expected
+                    version; exactly one must win, the other must raise
+                    PromptVersionConflict
+    update          several update_prompt calls; every one must land
+    improve         two editor improvements whose editor calls both read
+                    the same head; the loser must rebase, so the final
+                    prompt carries both edits
+
+After each race the head's parent links are walked back to the first
+version: every successful write must be on that chain, each version's
+parent must be the one before it, and the head must hold the newest
+content.
+
+Usage:
+    python scripts/check_prompt_versions.py
+
+Exits non-zero on any lost write or broken parent link.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_services import FakePostgRESTServer
+
+NAME = "chatbot_prompt"
+
+
+class FakeEditorLLM:
+    """Editor stand-in: appends the requested rule to the prompt it was given.
+
+    The first `hold` calls wait for each other, so concurrent improvements
+    all start from the same head.
+    """
+
+    def __init__(self, hold: int):
+        self.barrier = threading.Barrier(hold)
+        self.hold = hold
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_json(self, editor_input: str) -> dict:
+        with self._lock:
+            self.calls += 1
+            wait = self.calls <= self.hold
+        if wait:
+            self.barrier.wait(timeout=10)
+        request = json.loads(editor_input)
+        return {"prompt": f"{request['prompt']}\n- {request['rule']}", "changes_made": request["rule"]}
+
+
+def run_together(targets: list) -> list:
+    """Run callables in threads released at once; returns their results or exceptions."""
+    barrier = threading.Barrier(len(targets))
+    results = [None] * len(targets)
+
+    def run(index, target):
+        barrier.wait(timeout=10)
+        try:
+            results[index] = target()
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=run, args=(index, target)) for index, target in enumerate(targets)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def head_chain(server: FakePostgRESTServer) -> list:
+    """Versions from the head back to the root, following parent_id."""
+    versions = {row["id"]: row for row in server.tables["prompt_versions"]}
+    head = next(row for row in server.tables["prompts"] if row["name"] == NAME)
+    chain, version_id = [], head["version_id"]
+    while version_id is not None:
+        chain.append(versions[version_id])
+        version_id = versions[version_id]["parent_id"]
+    return chain
+
+
+def check_chain(server: FakePostgRESTServer, label: str, written: list) -> int:
+    """Failures if a written content is missing from the head chain or the head is out of date."""
+    chain = head_chain(server)
+    head = next(row for row in server.tables["prompts"] if row["name"] == NAME)
+    failures = 0
+    contents = [version["content"] for version in chain]
+    for content in written:
+        if content not in contents:
+            failures += 1
+            print(f"❌ {label}: write lost from the head chain: {content[-60:]!r}")
+    if chain and (head["content"] != chain[0]["content"]):
+        failures += 1
+        print(f"❌ {label}: head content is not its version's content")
+    if chain and chain[-1]["parent_id"] is not None:
+        failures += 1
+        print(f"❌ {label}: chain does not end at a root version")
+    unmerged = len(server.tables["prompt_versions"]) - len(chain)
+    print(f"{'✅' if not failures else '❌'} {label}: {len(chain)} versions on the head chain, "
+          f"{unmerged} unmerged (lost compare-and-swap attempts)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check concurrent prompt version writes against a fake Supabase")
+    parser.add_argument("--writers", type=int, default=8, help="Concurrent update_prompt calls (default: 8)")
+    args = parser.parse_args()
+
+    server = FakePostgRESTServer().start()
+    os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["SUPABASE_KEY"] = "fake"
+    os.environ["PROMPT_CAS_RETRIES"] = str(args.writers)  # each writer can lose to every other one
+
+    from app.services.db_service import DatabaseService, PromptVersionConflict
+    from app.services.prompt_editor import PromptEditorService
+
+    db = DatabaseService()
+    failures = 0
+
+    # commit: both writers expect the current head; only one may move it
+    _, head = db.get_prompt_head(NAME)
+    results = run_together([
+        lambda: db.commit_prompt_version(NAME, "commit A", head, "A"),
+        lambda: db.commit_prompt_version(NAME, "commit B", head, "B"),
+    ])
+    won = [result for result in results if result is True]
+    lost = [result for result in results if isinstance(result, PromptVersionConflict)]
+    if len(won) != 1 or len(lost) != 1:
+        failures += 1
+        print(f"❌ commit: expected one success and one PromptVersionConflict, got {results!r}")
+    winner = "commit A" if results[0] is True else "commit B"
+    failures += check_chain(server, "commit", [winner])
+
+    # update: every writer retries on conflict, so every write lands on the chain
+    contents = [f"update {index}" for index in range(args.writers)]
+    results = run_together([lambda content=content: db.update_prompt(NAME, content, content) for content in contents])
+    if not all(result is True for result in results):
+        failures += 1
+        print(f"❌ update: not every update_prompt succeeded: {results!r}")
+    failures += check_chain(server, "update", contents)
+
+    # improve: both editor calls read the same head; the second commit must rebase and keep the first edit
+    llm = FakeEditorLLM(hold=2)
+    editor = PromptEditorService(llm=llm, db=db, retrieval=object())
+    editor.evaluator.enabled = False
+    rules = ["rule from improvement A", "rule from improvement B"]
+    results = run_together([
+        lambda rule=rule: editor._improve(lambda current_prompt, rule=rule: json.dumps({"prompt": current_prompt, "rule": rule}))
+        for rule in rules
+    ])
+    if not all(isinstance(result, dict) and result.get("success") for result in results):
+        failures += 1
+        print(f"❌ improve: not every improvement succeeded: {results!r}")
+    final_prompt, _ = db.get_prompt_head(NAME)
+    for rule in rules:
+        if rule not in final_prompt:
+            failures += 1
+            print(f"❌ improve: final prompt lost {rule!r}")
+    if llm.calls != 3:
+        failures += 1
+        print(f"❌ improve: expected 3 editor calls (one rebase), got {llm.calls}")
+    failures += check_chain(server, "improve", [result["updated_prompt"] for result in results if isinstance(result, dict)])
+
+    server.shutdown()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
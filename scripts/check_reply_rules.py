@@ -0,0 +1,202 @@
+"""
+Golden and differential checks for the compiled reply post-processing
+rules (app.services.reply_rules), plus a microbenchmark against the
+original implementation.
+
+The golden file holds (raw reply, follow-up?, expected output) cases: every
+consultant reply in conversations.json plus hand-written edge cases, with
+expected outputs produced by the original _postprocess_reply. Regenerate it
+only when the intended behaviour changes.
+
+Usage:
+    python scripts/check_reply_rules.py               # golden + fuzz check
+    python scripts/check_reply_rules.py --bench       # also time old vs new
+    python scripts/check_reply_rules.py --update      # rewrite the golden file
+
+Exits non-zero on any mismatch.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import timeit
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.reply_rules import DEFAULT_RULES, ReplyRules
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GOLDEN_PATH = os.path.join(ROOT, "scripts", "reply_rules_golden.json")
+
+EDGE_CASES = [
+    "",
+    "   \n\n  ",
+    "Sawasdee ka! The DTV costs 10,000 THB.",
+    "Hello!!! Great news. You qualify. Apply in Jakarta. Bring your passport.",
+    "Hi\nHey there, welcome!\nThe fee is 10,000 THB. Processing takes 5 days.",
+    "History matters. His visa was approved. Highlights below.",
+    "hey. ok. fine. sure.",
+    "Would you like me to check?\nThe embassy in KL accepts walk-ins.",
+    "Let me explain: first, gather documents. Second, book.\nCan I help with anything else?",
+    "I can walk you through and guide you. Actually the fee is fixed.",
+    "We can also guide you.\nShall I send the list?\nDocuments: passport, bank statement.",
+    "1. Passport\n2. Bank statement (500,000 THB)\n3. Employment letter",
+    "- Passport\n- Photos\nThat's all you need. Good luck!",
+    "No punctuation here\ncontinues on the next line\nand ends here.",
+    "Question? Answer! Statement. Another one.",
+    "Multiple   spaces.   Tabs\there.\tAnd more.\n\n\nDone.",
+    "Trailing dots...  Ellipsis... End",
+    "What about e.g. abbreviations? They split too.",
+    "Sawasdee krub 🙏 The DTV is valid 5 years. Each entry 180 days.",
+    "LET ME be clear. WOULD YOU LIKE options? CAN I ask? Final answer.",
+    "hello\nhello again.\nHi. Real content. More.",
+    "Hi, yes.\r\nWindows line endings.\r\nThird line.",
+    "Sentence one.\u2028Unicode line separator.\x85Third.",
+    "ends with question?\nnext line starts lower.",
+]
+
+FUZZ_TOKENS = [
+    "Hi", "hi", "Hello", "hey", "Sawasdee", "his", "history", "the", "fee", "is", "10,000", "THB",
+    "would you like", "let me", "Let me", "can i", "shall i", "i can", "guide", "we can", "help",
+    ".", "!", "?", "...", ",", ":", "-", " ", "  ", "\t", "\n", "\n\n", "\r\n", "🙏", "ok", "e.g.",
+]
+
+
+def legacy_postprocess(reply: str, chat_history: str) -> str:
+    """The original PromptEditorService._postprocess_reply, kept as the reference."""
+    is_follow_up = chat_history.strip() != "No previous messages."
+
+    if is_follow_up:
+        reply = re.sub(r"^\s*(sawasdee[^\w]*|hello[^\w]*|hi[^\w]*|hey[^\w]*)", "", reply, flags=re.IGNORECASE)
+
+    lines = [line.strip() for line in reply.splitlines() if line.strip()]
+
+    if is_follow_up:
+        lines = [line for line in lines if not re.match(r'^(sawasdee|hello|hi|hey)\b', line, flags=re.IGNORECASE)]
+
+    invite_patterns = [r"would you like", r"let me ", r"can i ", r"shall i", r"i can .*guide", r"we can .*guide"]
+    filtered_lines = []
+    for line in lines:
+        lower = line.lower()
+        if any(re.search(pat, lower) for pat in invite_patterns):
+            continue
+        filtered_lines.append(line)
+    lines = filtered_lines
+
+    text = " ".join(lines)
+    sentences = re.split(r"(?<=[.!?])\s+", text)
+    sentences = [s.strip() for s in sentences if s.strip()]
+
+    if is_follow_up:
+        sentences = sentences[:2]
+    else:
+        sentences = sentences[:3]
+
+    return " ".join(sentences).strip()
+
+
+def history_for(follow_up: bool) -> str:
+    return "Client: Hello" if follow_up else "No previous messages."
+
+
+def load_corpus_replies():
+    from app.utils.conversation_parser import iter_conversations, iter_conversation_pairs
+    path = os.path.join(ROOT, "conversations.json")
+    return ["\n".join(pair["consultant_reply"]) for pair in iter_conversation_pairs(iter_conversations(path))]
+
+
+def update_golden():
+    cases = []
+    for reply in EDGE_CASES + load_corpus_replies():
+        for follow_up in (False, True):
+            cases.append({
+                "reply": reply,
+                "followUp": follow_up,
+                "expected": legacy_postprocess(reply, history_for(follow_up))
+            })
+    with open(GOLDEN_PATH, "w", encoding="utf-8") as f:
+        json.dump(cases, f, ensure_ascii=False, indent=1)
+    print(f"✅ Wrote {len(cases)} golden cases to {GOLDEN_PATH}")
+
+
+def load_golden():
+    with open(GOLDEN_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def check_golden(cases) -> int:
+    failures = 0
+    for case in cases:
+        actual = DEFAULT_RULES.apply(case["reply"], case["followUp"])
+        if actual != case["expected"]:
+            failures += 1
+            if failures <= 5:
+                print(f"❌ Golden mismatch (followUp={case['followUp']}):\n   input:    {case['reply']!r}\n"
+                      f"   expected: {case['expected']!r}\n   actual:   {actual!r}")
+    print(f"{'✅' if not failures else '❌'} Golden: {len(cases) - failures}/{len(cases)} match")
+    return failures
+
+
+def check_fuzz(count: int, seed: int) -> int:
+    rng = random.Random(seed)
+    failures = 0
+    for _ in range(count):
+        reply = "".join(rng.choice(FUZZ_TOKENS) + rng.choice(["", " "]) for _ in range(rng.randint(0, 40)))
+        for follow_up in (False, True):
+            expected = legacy_postprocess(reply, history_for(follow_up))
+            actual = DEFAULT_RULES.apply(reply, follow_up)
+            if actual != expected:
+                failures += 1
+                if failures <= 5:
+                    print(f"❌ Fuzz mismatch (followUp={follow_up}):\n   input:    {reply!r}\n"
+                          f"   expected: {expected!r}\n   actual:   {actual!r}")
+    print(f"{'✅' if not failures else '❌'} Fuzz: {2 * count - failures}/{2 * count} match legacy")
+    return failures
+
+
+def check_banned_phrases() -> int:
+    rules = ReplyRules(["Feel free to reach out", "no worries"])
+    reply = "The fee is 10,000 THB.\nFeel free to reach out anytime!\nNo worries, it takes 5 days."
+    actual = rules.apply(reply, False)
+    ok = actual == "The fee is 10,000 THB."
+    print(f"{'✅' if ok else '❌'} Extra banned phrases: {actual!r}")
+    return 0 if ok else 1
+
+
+def bench(cases, repeat: int):
+    inputs = [(case["reply"], case["followUp"], history_for(case["followUp"])) for case in cases]
+
+    def run_legacy():
+        for reply, _, history in inputs:
+            legacy_postprocess(reply, history)
+
+    def run_rules():
+        for reply, follow_up, _ in inputs:
+            DEFAULT_RULES.apply(reply, follow_up)
+
+    legacy = min(timeit.repeat(run_legacy, number=1, repeat=repeat)) / len(inputs)
+    rules = min(timeit.repeat(run_rules, number=1, repeat=repeat)) / len(inputs)
+    print(f"\n⏱️  Per reply: legacy {legacy * 1e6:.1f}µs, compiled {rules * 1e6:.1f}µs ({legacy / rules:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check compiled reply rules against the original post-processing")
+    parser.add_argument("--update", action="store_true", help="Regenerate the golden file from the legacy implementation")
+    parser.add_argument("--fuzz", type=int, default=2000, help="Random replies to compare against legacy (default: 2000)")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--bench", action="store_true", help="Time legacy vs compiled post-processing")
+    parser.add_argument("--repeat", type=int, default=20, help="Benchmark repetitions (best is reported)")
+    args = parser.parse_args()
+
+    if args.update:
+        update_golden()
+        sys.exit(0)
+
+    golden = load_golden()
+    failed = check_golden(golden) + check_fuzz(args.fuzz, args.seed) + check_banned_phrases()
+    if args.bench:
+        bench(golden, args.repeat)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,117 @@
+"""
+Score chatbot prompts on the held-out conversation pairs: the same check
+that gates /improve-ai and training updates (app/services/prompt_evaluator.py).
+
+Usage:
+    python scripts/evaluate_prompt.py                                   # live prompt from the database
+    python scripts/evaluate_prompt.py --candidate new_prompt.txt        # live prompt vs a candidate
+    python scripts/evaluate_prompt.py --baseline a.txt --candidate b.txt --size 64 --concurrency 32
+    python scripts/evaluate_prompt.py --fake --candidate b.txt          # fake LLM + DB, no API keys (timing only)
+
+Predictions run concurrently (--concurrency at a time, within the
+provider's rate limit) and are scored locally, so a prompt is evaluated
+in roughly (pairs / concurrency) LLM round trips.
+
+Exits non-zero when the candidate would not be promoted.
+"""
+import argparse
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+from fake_services import add_fake_service_args, start_fake_services
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Score prompts on held-out conversation pairs")
+    parser.add_argument("--baseline", help="Prompt file to score (default: the live prompt from the database)")
+    parser.add_argument("--candidate", help="Prompt file to compare against the baseline")
+    parser.add_argument("--conversations",
+                        help="Conversation export to take the held-out pairs from (default: PROMPT_EVAL_PATH or conversations.json)")
+    parser.add_argument("--size", type=int, help="Held-out pairs (default: PROMPT_EVAL_SET_SIZE or 32)")
+    parser.add_argument("--concurrency", type=int, help="Concurrent predictions (default: PROMPT_EVAL_CONCURRENCY or 16)")
+    parser.add_argument("--tolerance", type=float, help="Allowed score drop beyond noise (default: PROMPT_EVAL_TOLERANCE or 0.01)")
+    parser.add_argument("--noise-z", type=float, help="Standard errors of the paired deltas allowed as noise (default: PROMPT_EVAL_NOISE_Z or 2)")
+    parser.add_argument("--fake", action="store_true", help="Run against the fake LLM and database")
+    add_fake_service_args(parser)
+    return parser.parse_args()
+
+
+def use_fake_services(args):
+    """Point the app at in-process fakes; their replies ignore the prompt, so only timings are meaningful."""
+    llm, db = start_fake_services(args, seed=1)
+    for key in ("GROQ_API_KEY", "GOOGLE_API_KEY", "ANTHROPIC_API_KEY"):
+        os.environ[key] = ""
+    os.environ.update({
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": f"{llm.url}/v1",
+        "LLM_PROVIDERS": "openai",
+        "LLM_RPM": "",  # the fake LLM has no rate limit
+        "LLM_BULK_RPM": "",
+        "SUPABASE_URL": db.url,
+        "SUPABASE_KEY": "fake"
+    })
+
+
+def read_prompt(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def print_summary(label: str, summary: dict):
+    print(f"   {label:<10} score {summary['score']:.4f}  similarity {summary['similarity']:.4f}  "
+          f"length {summary['length']:.4f}  greeting {summary['greeting']:.4f}  "
+          f"({summary['pairs']} pairs, {summary['failed']} failed, {summary['seconds']}s, version {summary['version']})")
+
+
+def main():
+    args = parse_args()
+    if args.fake:
+        use_fake_services(args)
+    load_dotenv()
+
+    from app.services.prompt_editor import get_prompt_editor
+    from app.services.prompt_evaluator import PromptEvaluator
+    from app.services.usage import get_usage_tracker
+
+    editor = get_prompt_editor()
+    evaluator = PromptEvaluator(
+        editor.llm,
+        editor._build_eval_prompt,
+        enabled=True,
+        path=args.conversations,
+        size=args.size,
+        concurrency=args.concurrency,
+        tolerance=args.tolerance,
+        noise_z=args.noise_z
+    )
+    if not evaluator.enabled:
+        sys.exit(1)
+
+    baseline = read_prompt(args.baseline) if args.baseline else editor.get_current_prompt()
+    print(f"📏 Evaluating on {len(evaluator.held_out())} held-out pairs (concurrency {evaluator.concurrency})\n")
+
+    if not args.candidate:
+        print_summary("prompt", evaluator.evaluate(baseline))
+        promote = True
+    else:
+        result = evaluator.compare(baseline, read_prompt(args.candidate))
+        print_summary("baseline", result["baseline"])
+        print_summary("candidate", result["candidate"])
+        print(f"\n   delta {result['delta']:+.4f} ± {result['stderr']:.4f} (rejects below {-result['threshold']:+.4f}) "
+              f"-> {result['outcome']}")
+        promote = result["promote"]
+
+    usage = get_usage_tracker().stats()["byOperation"].get("eval")
+    if usage:
+        print(f"   🪙 {usage['calls']} LLM calls, {usage['inputTokens']:,} in / {usage['outputTokens']:,} out tokens, "
+              f"${usage['costUsd']:.4f}")
+    sys.exit(0 if promote else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Local stand-ins for the app's external services, for load tests and demos
+without API keys or network access.
+
+    FakeLLMServer        OpenAI-compatible /v1/chat/completions with a
+                         configurable latency distribution and error rates
+    FakePostgRESTServer  the subset of the Supabase REST API that
+                         DatabaseService uses (prompts + prompt_versions)
+
+Point the app at them with:
+
+    OPENAI_API_KEY=fake OPENAI_BASE_URL=http://127.0.0.1:<llm-port>/v1 LLM_PROVIDERS=openai
+    SUPABASE_URL=http://127.0.0.1:<db-port> SUPABASE_KEY=fake
+
+Usage (standalone):
+    python scripts/fake_services.py --llm-port 8001 --db-port 8002 --llm-median 0.8
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.prompts.base_prompts import CHATBOT_PROMPT
+from app.utils.conversation_parser import iter_conversations, iter_conversation_pairs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONVERSATIONS_PATH = os.path.join(ROOT, "conversations.json")
+
+
+class LatencyModel:
+    """
+    LLM response time: lognormal around `median` with shape `sigma`, plus a
+    `tail_rate` chance of a slow outlier `tail` times longer (queueing on the
+    provider side). A latency of 0 answers immediately.
+    """
+
+    def __init__(self, median: float = 0.8, sigma: float = 0.4, tail_rate: float = 0.02, tail: float = 8.0):
+        self.median = median
+        self.sigma = sigma
+        self.tail_rate = tail_rate
+        self.tail = tail
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median <= 0:
+            return 0.0
+        seconds = self.median * math.exp(rng.gauss(0, self.sigma))
+        if rng.random() < self.tail_rate:
+            seconds *= self.tail
+        return seconds
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        return json.loads(body) if body else None
+
+    def _send_json(self, status: int, payload, headers: dict = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Clients going away (e.g. the app shutting down mid-request) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def start(self) -> "_Server":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class FakeLLMServer(_Server):
+    """
+    OpenAI-compatible chat completions endpoint.
+
+    Answers by looking at the prompt: editor prompts get a JSON edit that
+    keeps the base chatbot prompt, summary prompts a one-line summary, and
+    everything else a real consultant reply from conversations.json.
+    `error_rate` answers 503 and `throttle_rate` answers 429 with a
+    Retry-After, both after the sampled latency.
+    """
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency: LatencyModel = None,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        seed: int = None
+    ):
+        super().__init__(("127.0.0.1", port), _FakeLLMHandler)
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.replies = [
+            "\n".join(pair["consultant_reply"])
+            for pair in iter_conversation_pairs(iter_conversations(CONVERSATIONS_PATH))
+        ] or ["The DTV fee is 10,000 THB."]
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.throttles = 0
+
+    def next_outcome(self):
+        """(latency, status) for the next request."""
+        with self._lock:
+            self.requests += 1
+            latency = self.latency.sample(self._rng)
+            roll = self._rng.random()
+            if roll < self.throttle_rate:
+                self.throttles += 1
+                return latency, 429
+            if roll < self.throttle_rate + self.error_rate:
+                self.errors += 1
+                return latency, 503
+            return latency, 200
+
+    def answer(self, prompt: str) -> str:
+        if '"changes_made"' in prompt:
+            return json.dumps({"prompt": CHATBOT_PROMPT, "changes_made": "Load test edit: no changes."})
+        if "running summary" in prompt:
+            return "Client is a remote worker asking about the DTV; documents and savings already discussed."
+        with self._lock:
+            return self._rng.choice(self.replies)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors, "throttles": self.throttles}
+
+
+class _FakeLLMHandler(_QuietHandler):
+    server: FakeLLMServer
+
+    def do_POST(self):
+        data = self._read_json() or {}
+        if not urlsplit(self.path).path.endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        latency, status = self.server.next_outcome()
+        if latency:
+            time.sleep(latency)
+        if status == 429:
+            return self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit"}},
+                                   headers={"retry-after": "1"})
+        if status != 200:
+            return self._send_json(status, {"error": {"message": "Service unavailable", "type": "server_error"}})
+
+        prompt = "\n".join(str(message.get("content", "")) for message in data.get("messages", []))
+        content = self.server.answer(prompt)
+        self._send_json(200, {
+            "id": f"chatcmpl-fake-{time.monotonic_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": data.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (len(prompt) + len(content)) // 4
+            }
+        })
+
+
+class FakePostgRESTServer(_Server):
+    """
+    In-memory PostgREST stand-in for the prompts and prompt_versions tables.
+
+    Supports what DatabaseService sends: eq./is.null filters, select,
+    order=<col>.desc|asc and limit on GET; insert on POST; filtered update on
+    PATCH (returning the updated rows, so the prompt CAS works); prompt
+    names are unique, as in the real schema (409 on a duplicate). Seeded with
+    the base chatbot prompt as version 1.
+    """
+
+    TABLES = ("prompts", "prompt_versions")
+    UNIQUE = {"prompts": "name"}
+
+    def __init__(self, port: int = 0, latency: float = 0.0):
+        super().__init__(("127.0.0.1", port), _FakePostgRESTHandler)
+        self.latency = latency
+        self.tables = {name: [] for name in self.TABLES}
+        self._next_id = {name: 1 for name in self.TABLES}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.insert("prompt_versions", {"name": "chatbot_prompt", "content": CHATBOT_PROMPT,
+                                        "parent_id": None, "change_note": "initial version"})
+        self.insert("prompts", {"name": "chatbot_prompt", "content": CHATBOT_PROMPT, "version_id": 1})
+
+    def insert(self, table: str, row: dict) -> dict:
+        """Append a row; raises KeyError if it duplicates a unique column."""
+        with self._lock:
+            row = dict(row)
+            unique = self.UNIQUE.get(table)
+            if unique and any(existing.get(unique) == row.get(unique) for existing in self.tables[table]):
+                raise KeyError(f"duplicate key value violates unique constraint on {table}.{unique}")
+            row.setdefault("id", self._next_id[table])
+            row.setdefault("created_at", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+            self._next_id[table] = max(self._next_id[table], row["id"]) + 1
+            self.tables[table].append(row)
+            return dict(row)
+
+    @staticmethod
+    def _matches(row: dict, filters: list) -> bool:
+        for column, condition in filters:
+            op, _, value = condition.partition(".")
+            if op == "is" and value == "null":
+                if row.get(column) is not None:
+                    return False
+            elif op == "eq":
+                if row.get(column) is None or str(row.get(column)) != value:
+                    return False
+            else:
+                raise ValueError(f"unsupported filter {column}={condition}")
+        return True
+
+    def select(self, table: str, query: dict, filters: list) -> list:
+        with self._lock:
+            rows = [dict(row) for row in self.tables[table] if self._matches(row, filters)]
+        if "order" in query:
+            column, _, direction = query["order"].partition(".")
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=direction == "desc")
+        if "limit" in query:
+            rows = rows[:int(query["limit"])]
+        if "select" in query and query["select"] != "*":
+            columns = query["select"].split(",")
+            rows = [{column: row.get(column) for column in columns} for row in rows]
+        return rows
+
+    def update(self, table: str, filters: list, changes: dict) -> list:
+        with self._lock:
+            updated = []
+            for row in self.tables[table]:
+                if self._matches(row, filters):
+                    row.update(changes)
+                    updated.append(dict(row))
+            return updated
+
+
+class _FakePostgRESTHandler(_QuietHandler):
+    server: FakePostgRESTServer
+
+    def _parse(self):
+        """(table, query params, column filters) or None after sending an error."""
+        self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        parts = urlsplit(self.path)
+        table = parts.path.rsplit("/", 1)[-1]
+        if not parts.path.startswith("/rest/v1/") or table not in self.server.tables:
+            self._send_json(404, {"code": "42P01", "message": f"relation {table} does not exist"})
+            return None
+        query, filters = {}, []
+        for key, value in parse_qsl(parts.query, keep_blank_values=True):
+            if key in ("select", "order", "limit"):
+                query[key] = value
+            else:
+                filters.append((key, value))
+        return table, query, filters
+
+    def do_GET(self):
+        parsed = self._parse()
+        if parsed:
+            table, query, filters = parsed
+            self._send_json(200, self.server.select(table, query, filters))
+
+    def do_POST(self):
+        parsed = self._parse()
+        if parsed:
+            table, _, _ = parsed
+            payload = self._read_json()
+            rows = payload if isinstance(payload, list) else [payload]
+            try:
+                self._send_json(201, [self.server.insert(table, row) for row in rows])
+            except KeyError as e:
+                self._send_json(409, {"code": "23505", "message": e.args[0]})
+
+    def do_PATCH(self):
+        parsed = self._parse()
+        if parsed:
+            table, _, filters = parsed
+            self._send_json(200, self.server.update(table, filters, self._read_json() or {}))
+
+
+def add_fake_service_args(parser: argparse.ArgumentParser):
+    """Command-line options for the fake LLM and database (shared with load_test.py)."""
+    parser.add_argument("--llm-median", type=float, default=0.8, help="Median LLM latency in seconds (default: 0.8)")
+    parser.add_argument("--llm-sigma", type=float, default=0.4, help="Lognormal shape of LLM latency (default: 0.4)")
+    parser.add_argument("--llm-tail-rate", type=float, default=0.02, help="Share of slow outliers (default: 0.02)")
+    parser.add_argument("--llm-tail", type=float, default=8.0, help="Outlier slowdown factor (default: 8)")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Share of 503 answers (default: 0)")
+    parser.add_argument("--llm-throttle-rate", type=float, default=0.0, help="Share of 429 answers (default: 0)")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="Seconds added to every DB request (default: 0)")
+
+
+def start_fake_services(args, llm_port: int = 0, db_port: int = 0, seed: int = None):
+    """Start both fakes in background threads; returns (llm, db)."""
+    llm = FakeLLMServer(
+        llm_port,
+        LatencyModel(args.llm_median, args.llm_sigma, args.llm_tail_rate, args.llm_tail),
+        error_rate=args.llm_error_rate,
+        throttle_rate=args.llm_throttle_rate,
+        seed=seed
+    ).start()
+    db = FakePostgRESTServer(db_port, latency=args.db_latency).start()
+    return llm, db
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the fake LLM and Supabase servers")
+    parser.add_argument("--llm-port", type=int, default=8001)
+    parser.add_argument("--db-port", type=int, default=8002)
+    add_fake_service_args(parser)
+    args = parser.parse_args()
+
+    llm, db = start_fake_services(args, args.llm_port, args.db_port)
+    print(f"🤖 Fake LLM:       OPENAI_BASE_URL={llm.url}/v1")
+    print(f"🗄️  Fake Supabase: SUPABASE_URL={db.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
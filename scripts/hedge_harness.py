@@ -0,0 +1,164 @@
+"""
+Exercise hedged LLM requests against fake providers (no API keys needed).
+
+Each fake provider answers after a random latency with a slow tail and
+fails some fraction of calls. The harness replays the same workload
+against the primary alone and against HedgedLLMService, then prints
+latency percentiles, hedge rate and errors for both.
+
+Usage:
+    python scripts/hedge_harness.py
+    python scripts/hedge_harness.py --requests 500 --tail-rate 0.1 --fail-rate 0.05
+    python scripts/hedge_harness.py --primary-down
+
+Exits non-zero if hedging loses requests the primary alone would not
+have lost, does not cut the p99 latency, or hedges at a delay that is not
+the primary's real --percentile latency (which happens when the slow calls
+hedging cancels are left out of the primary's latency histogram).
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.llm_hedging import HedgedLLMService
+
+
+class FakeProvider:
+    """Stands in for an LLMService: same call surface, simulated latency and failures."""
+
+    def __init__(self, provider: str, median: float, tail_rate: float, tail_latency: float, fail_rate: float):
+        self.provider = provider
+        self.model_name = f"fake-{provider}"
+        self.median = median
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.fail_rate = fail_rate
+        self.calls = 0
+        self.cancelled = 0
+
+    def _latency(self) -> float:
+        if random.random() < self.tail_rate:
+            return self.tail_latency * random.uniform(0.8, 1.2)
+        return random.lognormvariate(0, 0.25) * self.median
+
+    async def agenerate(self, prompt: str, max_tokens: int = 1024) -> str:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self._latency())
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if random.random() < self.fail_rate:
+            raise RuntimeError(f"{self.provider}: simulated 503")
+        return f"{self.provider} reply"
+
+    def stream(self, prompt: str, max_tokens: int = 1024):
+        time.sleep(self._latency())
+        if random.random() < self.fail_rate:
+            raise RuntimeError(f"{self.provider}: simulated 503")
+        yield f"{self.provider} reply"
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] if ordered else 0.0
+
+
+async def replay(llm, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                await llm.agenerate(f"prompt {i}", max_tokens=220)
+                latencies.append(time.monotonic() - started)
+            except Exception:
+                errors += 1
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return {
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "errors": errors,
+        "latencies": latencies
+    }
+
+
+def make_providers(args):
+    primary = FakeProvider("primary", args.median, args.tail_rate, args.tail_latency,
+                           1.0 if args.primary_down else args.fail_rate)
+    backup = FakeProvider("backup", args.median * 1.3, args.tail_rate, args.tail_latency, args.fail_rate)
+    return primary, backup
+
+
+def report(name: str, result: dict, providers):
+    calls = sum(p.calls for p in providers)
+    print(f"{name:<14} p50={result['p50']:.3f}s  p95={result['p95']:.3f}s  p99={result['p99']:.3f}s  "
+          f"errors={result['errors']}  upstream calls={calls}  cancelled={sum(p.cancelled for p in providers)}")
+
+
+async def main(args):
+    random.seed(args.seed)
+    primary, _ = make_providers(args)
+    alone = await replay(primary, args.requests, args.concurrency)
+    report("primary only", alone, [primary])
+
+    random.seed(args.seed)
+    primary, backup = make_providers(args)
+    hedged_llm = HedgedLLMService(
+        [primary, backup],
+        hedge_percentile=args.percentile,
+        hedge_min_samples=20,
+        default_delay=args.median * 3
+    )
+    hedged = await replay(hedged_llm, args.requests, args.concurrency)
+    report("hedged", hedged, [primary, backup])
+
+    stats = hedged_llm.stats()
+    print(f"\nhedges={stats['hedges']} ({stats['hedges'] / args.requests:.1%} of requests)  "
+          f"hedgeWins={stats['hedgeWins']}  failovers={stats['failovers']}")
+    for key, latency in stats["latency"].items():
+        print(f"  {key}: samples={latency['samples']} p50={latency['p50']} p95={latency['p95']} hedgeDelay={latency['hedgeDelay']}")
+
+    failed = []
+    if hedged["errors"] > alone["errors"]:
+        failed.append("hedging lost more requests than the primary alone")
+    if not args.primary_down and hedged["p99"] >= alone["p99"]:
+        failed.append("hedging did not reduce p99 latency")
+    if not args.primary_down:
+        # Where the learned delay falls among the latencies the primary really had on its own
+        delay = hedged_llm.hedge_delay(primary.provider, 220)
+        real = percentile(alone["latencies"], args.percentile)
+        print(f"  primary hedge delay {delay:.3f}s vs primary-only p{args.percentile:g} {real:.3f}s")
+        if not delay / 1.44 <= real <= delay * 1.2:
+            failed.append(f"hedge delay {delay:.3f}s is not the primary's real p{args.percentile:g} ({real:.3f}s)")
+    for reason in failed:
+        print(f"❌ {reason}")
+    if not failed:
+        print("\n✅ Hedging behaved as expected")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hedged request harness with fake LLM providers")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--median", type=float, default=0.05, help="Median provider latency in seconds")
+    # Above 5%, so the p95 lies inside the slow tail rather than on its edge and is stable from run to run
+    parser.add_argument("--tail-rate", type=float, default=0.08, help="Fraction of calls hitting the slow tail")
+    parser.add_argument("--tail-latency", type=float, default=1.0, help="Slow-tail latency in seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.02)
+    parser.add_argument("--percentile", type=float, default=95, help="Hedge after this percentile of primary latency")
+    parser.add_argument("--primary-down", action="store_true", help="Primary fails every call (failover test)")
+    parser.add_argument("--seed", type=int, default=7)
+    sys.exit(asyncio.run(main(parser.parse_args())))
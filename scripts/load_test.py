@@ -0,0 +1,353 @@
+"""
+End-to-end load test: replays every exchange in conversations.json as live
+/generate-reply and /improve-ai traffic against the app running under
+gunicorn, with the fake LLM and Supabase from scripts/fake_services.py.
+
+For each gunicorn configuration (workers x threads, gthread as in the
+Procfile) the app is started fresh and driven at each target rate in turn
+with open-loop (Poisson) arrivals, so a slow server faces a growing queue
+just like in production. Per endpoint it reports throughput, p50/p95/p99
+latency and error rate, and marks the first rate where the service
+saturates: error rate above --max-error-rate or p99 above --slo (an
+overloaded server queues requests, so p99 climbs first). Higher rates are
+skipped once a configuration has saturated.
+
+Usage:
+    python scripts/load_test.py
+    python scripts/load_test.py --rates 5,10,20,40 --duration 30 --configs 1x64,2x32,4x16
+    python scripts/load_test.py --llm-median 2 --llm-error-rate 0.02 --improve-share 0.2
+    python scripts/load_test.py --target http://localhost:5000 --rates 10   # existing server
+
+Needs gunicorn and httpx (both in requirements.txt). Exits non-zero if any
+configuration saturates below the lowest rate tried.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_services import add_fake_service_args, start_fake_services
+from app.utils.conversation_parser import (
+    iter_conversations,
+    iter_conversation_pairs,
+    format_client_sequence,
+    format_chat_history_for_api
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONVERSATIONS_PATH = os.path.join(ROOT, "conversations.json")
+ENDPOINTS = ("/generate-reply", "/improve-ai")
+
+
+def build_traffic(path: str):
+    """(generate payload, improve payload) for every exchange in the conversations file."""
+    traffic = []
+    for pair in iter_conversation_pairs(iter_conversations(path)):
+        message = format_client_sequence(pair["client_sequence"])
+        history = format_chat_history_for_api(pair["chat_history"])
+        traffic.append((
+            {"message": message, "chatHistory": history},
+            {
+                "clientSequence": message,
+                "chatHistory": history,
+                "consultantReply": "\n".join(pair["consultant_reply"])
+            }
+        ))
+    return traffic
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def error_detail(response: httpx.Response) -> str:
+    """The app's JSON "error" message, shortened, so failures group by cause."""
+    try:
+        message = response.json().get("error")
+    except (ValueError, AttributeError):
+        return ""
+    return f" ({message[:60]})" if message else ""
+
+
+def percentile(values: list, p: float) -> float:
+    """Nearest-rank percentile of an unsorted list (0.0 when empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class AppServer:
+    """The app under gunicorn with a given worker configuration, wired to the fakes."""
+
+    def __init__(self, workers: int, threads: int, env: dict, log_path: str):
+        self.workers = workers
+        self.threads = threads
+        self.env = env
+        self.log_path = log_path
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.process = None
+
+    def start(self, timeout: float = 60):
+        self._log = open(self.log_path, "w")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "app.main:app",
+             "--worker-class", "gthread", "--workers", str(self.workers), "--threads", str(self.threads),
+             "--bind", f"127.0.0.1:{self.port}", "--timeout", "120", "--graceful-timeout", "5"],
+            cwd=ROOT, env=self.env, stdout=self._log, stderr=subprocess.STDOUT
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                if httpx.get(f"{self.url}/health", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"gunicorn did not become healthy; see {self.log_path}")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self._log.close()
+
+
+def app_env(args, llm_url: str, db_url: str, workdir: str) -> dict:
+    """Environment for the app: fakes only, real provider keys removed, local state in `workdir`."""
+    env = dict(os.environ)
+    for key in ("GROQ_API_KEY", "GOOGLE_API_KEY", "ANTHROPIC_API_KEY"):
+        env[key] = ""  # set-but-empty also stops load_dotenv() from filling them in
+    env.update({
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": f"{llm_url}/v1",
+        "LLM_PROVIDERS": "openai",
+        "LLM_RPM": str(args.llm_rpm) if args.llm_rpm else "",  # empty: the app's default (no client-side limit)
+        # The fake LLM never throttles, so bulk pacing would only measure the limiter
+        "LLM_BULK_RPM": str(args.llm_bulk_rpm) if args.llm_bulk_rpm else "",
+        "SUPABASE_URL": db_url,
+        "SUPABASE_KEY": "fake",
+        "SESSION_DB_PATH": os.path.join(workdir, "sessions.db"),
+        "IMPROVE_QUEUE_PATH": os.path.join(workdir, "improve_queue.db"),
+        "RETRIEVAL_INDEX_PATH": os.path.join(workdir, "retrieval_index.json.gz"),
+        "PYTHONUNBUFFERED": "1",
+    })
+    if not args.with_caches:
+        # Exchanges repeat during a run; without this most replies would be cache hits
+        env["REPLY_CACHE_MAX_ENTRIES"] = "0"
+        env["NEAR_DUPLICATE_CACHE_ENABLED"] = "false"
+    return env
+
+
+async def run_load(url: str, traffic: list, rate: float, duration: float, args, rng: random.Random) -> dict:
+    """Send Poisson arrivals at `rate`/s for `duration` seconds; returns per-endpoint samples."""
+    samples = {endpoint: [] for endpoint in ENDPOINTS}  # (ok, latency, error)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+
+        async def send(endpoint: str, payload: dict):
+            start = time.perf_counter()
+            try:
+                response = await client.post(endpoint, json=payload)
+                ok = response.status_code in (200, 202)
+                error = None if ok else f"HTTP {response.status_code}{error_detail(response)}"
+            except httpx.TimeoutException:
+                ok, error = False, "timeout"
+            except httpx.HTTPError as e:
+                ok, error = False, type(e).__name__
+            samples[endpoint].append((ok, time.perf_counter() - start, error))
+
+        tasks = []
+        start = time.perf_counter()
+        next_at = 0.0
+        i = 0
+        while next_at < duration:
+            delay = start + next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            generate, improve = traffic[i % len(traffic)]
+            i += 1
+            if rng.random() < args.improve_share:
+                payload = dict(improve, **({"async": True} if args.improve_async else {}))
+                tasks.append(asyncio.create_task(send("/improve-ai", payload)))
+            else:
+                tasks.append(asyncio.create_task(send("/generate-reply", generate)))
+            next_at += rng.expovariate(rate)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    return {"elapsed": elapsed, "samples": samples}
+
+
+def summarize(result: dict, rate: float, args) -> dict:
+    """Throughput, latency percentiles and error rate per endpoint, plus a saturation verdict."""
+    summary = {"rate": rate, "endpoints": {}}
+    all_samples = []
+    for endpoint, samples in result["samples"].items():
+        if not samples:
+            continue
+        all_samples.extend(samples)
+        latencies = [latency for ok, latency, _ in samples if ok]
+        errors = {}
+        for ok, _, error in samples:
+            if not ok:
+                errors[error] = errors.get(error, 0) + 1
+        summary["endpoints"][endpoint] = {
+            "requests": len(samples),
+            "throughput": round(len(latencies) / result["elapsed"], 2),
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "errorRate": round(1 - len(latencies) / len(samples), 4),
+            "errors": errors
+        }
+
+    ok_latencies = [latency for ok, latency, _ in all_samples if ok]
+    error_rate = 1 - len(ok_latencies) / len(all_samples) if all_samples else 0.0
+    throughput = len(ok_latencies) / result["elapsed"]
+    p99 = percentile(ok_latencies, 99)
+    reasons = []
+    if error_rate > args.max_error_rate:
+        reasons.append(f"error rate {error_rate:.1%}")
+    if p99 > args.slo:
+        reasons.append(f"p99 {p99:.1f}s > {args.slo:g}s")
+    summary.update({"throughput": round(throughput, 2), "errorRate": round(error_rate, 4),
+                    "p99": round(p99, 3), "saturated": reasons})
+    return summary
+
+
+def print_summary(config: str, summary: dict):
+    for endpoint, stats in summary["endpoints"].items():
+        errors = ", ".join(f"{name}: {count}" for name, count in stats["errors"].items())
+        print(f"{config:>7} {summary['rate']:>7g} {endpoint:<16} {stats['requests']:>6} {stats['throughput']:>8.2f} "
+              f"{stats['p50']:>7.2f} {stats['p95']:>7.2f} {stats['p99']:>7.2f} {stats['errorRate']:>7.1%}"
+              f"{'  ' + errors if errors else ''}")
+    if summary["saturated"]:
+        print(f"{'':>7} 🔥 saturated at {summary['rate']:g}/s: {'; '.join(summary['saturated'])}")
+
+
+def parse_configs(text: str) -> list:
+    configs = []
+    for item in text.split(","):
+        workers, _, threads = item.strip().lower().partition("x")
+        configs.append((int(workers), int(threads or 1)))
+    return configs
+
+
+async def warm_up(url: str, traffic: list, count: int):
+    """A few requests so first-call setup (clients, prompt fetch) isn't measured."""
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        await asyncio.gather(*(client.post("/generate-reply", json=traffic[i % len(traffic)][0])
+                               for i in range(count)), return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay conversations.json as live traffic and find the saturation point")
+    parser.add_argument("--rates", default="2,5,10,20", help="Comma-separated target request rates per second (default: 2,5,10,20)")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of traffic per rate (default: 20)")
+    parser.add_argument("--configs", default="1x64,2x32,4x16",
+                        help="Comma-separated gunicorn workers x threads (default: 1x64,2x32,4x16)")
+    parser.add_argument("--target", help="Load an already running app at this URL instead of starting gunicorn")
+    parser.add_argument("--improve-share", type=float, default=0.1, help="Share of /improve-ai requests (default: 0.1)")
+    parser.add_argument("--improve-async", action="store_true", help='Send /improve-ai with "async": true (queued)')
+    parser.add_argument("--with-caches", action="store_true", help="Leave the reply caches on (default: off)")
+    parser.add_argument("--timeout", type=float, default=60, help="Client timeout per request in seconds (default: 60)")
+    parser.add_argument("--slo", type=float, default=10, help="p99 latency in seconds that counts as saturated (default: 10)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Error rate that counts as saturated (default: 0.01)")
+    parser.add_argument("--llm-rpm", type=float, help="LLM_RPM for the app (default: unset, as in production)")
+    parser.add_argument("--llm-bulk-rpm", type=float,
+                        help="LLM_BULK_RPM for evaluation and batch calls (default: off; production defaults to 60)")
+    parser.add_argument("--conversations", default=CONVERSATIONS_PATH, help="Conversations file to replay")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Also write the results to this file")
+    add_fake_service_args(parser)
+    args = parser.parse_args()
+
+    rates = [float(rate) for rate in args.rates.split(",")]
+    traffic = build_traffic(args.conversations)
+    random.Random(args.seed).shuffle(traffic)
+    print(f"📚 {len(traffic)} exchanges from {args.conversations}")
+
+    if args.target:
+        configs = [("target", None)]
+    else:
+        llm, db = start_fake_services(args, seed=args.seed)
+        print(f"🤖 Fake LLM at {llm.url} (median {args.llm_median}s), fake Supabase at {db.url}")
+        configs = [(f"{workers}x{threads}", (workers, threads)) for workers, threads in parse_configs(args.configs)]
+
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    results = []
+    print(f"\n{'config':>7} {'rate':>7} {'endpoint':<16} {'sent':>6} {'ok/s':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'errors':>7}")
+    try:
+        for name, config in configs:
+            server = None
+            url = args.target
+            if config:
+                workers, threads = config
+                state = os.path.join(workdir, name)
+                os.makedirs(state, exist_ok=True)
+                server = AppServer(workers, threads, app_env(args, llm.url, db.url, state), os.path.join(state, "gunicorn.log"))
+                server.start()
+                url = server.url
+            try:
+                asyncio.run(warm_up(url, traffic, 2 * (config[0] if config else 1)))
+                for rate in rates:
+                    result = asyncio.run(run_load(url, traffic, rate, args.duration, args, random.Random(args.seed)))
+                    summary = summarize(result, rate, args)
+                    summary["config"] = name
+                    results.append(summary)
+                    print_summary(name, summary)
+                    if summary["saturated"]:
+                        break
+            finally:
+                if server:
+                    server.stop()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    failed = False
+    for name, _ in configs:
+        runs = [summary for summary in results if summary["config"] == name]
+        saturated = next((summary for summary in runs if summary["saturated"]), None)
+        best = max((summary["throughput"] for summary in runs if not summary["saturated"]), default=0.0)
+        if saturated is None:
+            print(f"✅ {name}: no saturation up to {runs[-1]['rate']:g}/s ({best:.1f} ok/s)")
+        elif saturated is runs[0]:
+            failed = True
+            print(f"❌ {name}: saturated at the lowest rate ({saturated['rate']:g}/s)")
+        else:
+            print(f"🔥 {name}: saturates between {runs[-2]['rate']:g}/s and {saturated['rate']:g}/s "
+                  f"(sustained {best:.1f} ok/s)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items()}, "results": results}, f, indent=2)
+        print(f"\n✅ Results written to {args.json}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,42 +1,67 @@
 """
 Script to parse conversations.json and display sample training pairs.
 Run this to verify the conversation parser is working correctly.
+
+Usage:
+    python scripts/parse_conversations.py [path/to/export.json|.jsonl|.gz]
+
+The export is streamed, so peak memory stays flat regardless of file size.
 """
 import os
 import sys
+from collections import Counter
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.utils.conversation_parser import (
-    load_conversations,
-    parse_conversation_pairs,
+    iter_conversations,
+    iter_conversation_pairs,
     format_client_sequence,
-    format_chat_history
+    format_chat_history,
+    peak_memory_mb
 )
 
+NUM_SAMPLES = 3
+
 
 def main():
     # Path to conversations file
-    conversations_path = os.path.join(
+    conversations_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
         os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
         'conversations.json'
     )
     
     print(f"Loading conversations from: {conversations_path}\n")
     
-    conversations = load_conversations(conversations_path)
-    pairs = parse_conversation_pairs(conversations)
+    conversation_count = 0
+    
+    def counted(conversations):
+        nonlocal conversation_count
+        for conv in conversations:
+            conversation_count += 1
+            yield conv
     
-    print(f"✅ Total conversations loaded: {len(conversations)}")
-    print(f"✅ Total training pairs extracted: {len(pairs)}\n")
+    pairs = iter_conversation_pairs(counted(iter_conversations(conversations_path)))
+    
+    # Single pass: keep only the first few samples and per-scenario counts
+    samples = []
+    scenario_counts = Counter()
+    pair_count = 0
+    for pair in pairs:
+        pair_count += 1
+        scenario_counts[pair['scenario']] += 1
+        if len(samples) < NUM_SAMPLES:
+            samples.append(pair)
+    
+    print(f"✅ Total conversations loaded: {conversation_count}")
+    print(f"✅ Total training pairs extracted: {pair_count}\n")
     
     # Print first 3 samples
-    num_samples = min(3, len(pairs))
-    print(f"Showing {num_samples} sample training pairs:\n")
+    print(f"Showing {len(samples)} sample training pairs:\n")
     print("=" * 60)
     
-    for i, pair in enumerate(pairs[:num_samples]):
+    for i, pair in enumerate(samples):
         print(f"\n=== Sample {i+1} ===")
         print(f"Scenario: {pair['scenario']}")
         print(f"Contact ID: {pair.get('contact_id', 'N/A')}")
@@ -59,15 +84,17 @@ def main():
     print("\n📊 SUMMARY STATISTICS:")
     print("-" * 40)
     
-    scenarios = set(pair['scenario'] for pair in pairs)
-    print(f"Unique scenarios: {len(scenarios)}")
+    print(f"Unique scenarios: {len(scenario_counts)}")
     
-    for scenario in list(scenarios)[:5]:
-        count = sum(1 for p in pairs if p['scenario'] == scenario)
+    for scenario, count in list(scenario_counts.items())[:5]:
         print(f"  - {scenario[:50]}... : {count} pairs")
     
-    if len(scenarios) > 5:
-        print(f"  ... and {len(scenarios) - 5} more scenarios")
+    if len(scenario_counts) > 5:
+        print(f"  ... and {len(scenario_counts) - 5} more scenarios")
+    
+    peak = peak_memory_mb()
+    if peak is not None:
+        print(f"\n💾 Peak memory: {peak} MB")
 
 
 if __name__ == "__main__":
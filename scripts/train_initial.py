@@ -7,15 +7,34 @@ AI predictions with real consultant replies.
 
 Usage:
     python scripts/train_initial.py
+    python scripts/train_initial.py --limit 20 --batch-size 5 --concurrency 5
+    python scripts/train_initial.py --all --conversations export.jsonl.gz
+
+With --batch-size N > 1, predictions for N pairs are generated concurrently
+and a single editor call learns from all N (predicted, actual) diffs at once.
+
+When prompt evaluation is enabled (PROMPT_EVAL_ENABLED), the held-out pairs
+are skipped and every update must not score worse on them than the prompt
+it replaces (see scripts/evaluate_prompt.py).
+
+Conversations are streamed (JSON array, JSONL or gzip), so exports larger
+than memory can be trained on.
+
+LLM calls are paced by the provider's adaptive bulk rate limiter
+(LLM_BULK_RPM, 60/min by default, or <PROVIDER>_BULK_RPM), which backs off
+on 429s and speeds up again while there is headroom; --delay only adds an
+extra pause.
 
 Make sure your .env file has:
     - GOOGLE_API_KEY (or other LLM provider key)
     - SUPABASE_URL
     - SUPABASE_KEY
 """
+import argparse
 import os
 import sys
 import time
+from itertools import islice
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -24,13 +43,16 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from app.utils.conversation_parser import (
-    load_conversations,
-    parse_conversation_pairs,
+    iter_conversations,
+    iter_conversation_pairs,
     format_client_sequence,
-    format_chat_history
+    format_chat_history,
+    peak_memory_mb
 )
 from app.services.db_service import get_db_service
 from app.services.prompt_editor import get_prompt_editor
+from app.services.async_runtime import run_sync
+from app.services.usage import get_usage_tracker, set_usage_tags
 from app.prompts.base_prompts import CHATBOT_PROMPT
 
 
@@ -49,38 +71,56 @@ def initialize_prompt():
         return False
 
 
-def train_on_conversations(limit: int = None, delay: float = 1.0):
+DEFAULT_CONVERSATIONS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'conversations.json'
+)
+
+
+def train_on_conversations(limit: int = None, delay: float = 0.0, batch_size: int = 1, concurrency: int = 4,
+                           conversations_path: str = DEFAULT_CONVERSATIONS_PATH):
     """
     Train the AI on conversation samples.
     
     Args:
         limit: Maximum number of training pairs to process (None = all)
-        delay: Seconds to wait between API calls (to avoid rate limits)
+        delay: Extra seconds to wait between updates (pacing is done by the rate limiter)
+        batch_size: Pairs per prompt update (1 = one editor call per pair)
+        concurrency: Concurrent prediction calls within a batch
+        conversations_path: Conversation export (JSON array, JSONL, optionally gzipped)
     """
-    # Load conversations
-    conversations_path = os.path.join(
-        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
-        'conversations.json'
-    )
+    # Stream conversations -> pairs; nothing is loaded up front
+    print(f"📂 Streaming conversations from: {conversations_path}")
+    pairs = iter_conversation_pairs(iter_conversations(conversations_path))
     
-    print(f"📂 Loading conversations from: {conversations_path}")
-    conversations = load_conversations(conversations_path)
-    pairs = parse_conversation_pairs(conversations)
+    # Get services
+    editor = get_prompt_editor()
+    # Pairs held out for evaluating prompt updates are never trained on
+    pairs = (pair for pair in pairs if not editor.evaluator.is_held_out(pair))
     
     if limit:
-        pairs = pairs[:limit]
+        pairs = islice(pairs, limit)
     
-    print(f"📊 Training on {len(pairs)} conversation pairs...\n")
+    print(f"📊 Training on {limit or 'all'} conversation pairs...\n")
     print("=" * 60)
     
-    # Get services
-    editor = get_prompt_editor()
+    # Bill every LLM call in this run to "training" in the usage report, paced as bulk work
+    set_usage_tags(endpoint="training", bulk=True)
+    
+    if batch_size > 1:
+        success_count, fail_count = train_in_batches(editor, pairs, batch_size, concurrency, delay, limit)
+        print_summary(success_count, fail_count)
+        return
     
     success_count = 0
     fail_count = 0
     
     for i, pair in enumerate(pairs):
-        print(f"\n[{i+1}/{len(pairs)}] 🎯 Training on: {pair['scenario'][:50]}...")
+        # Optional extra pause; LLM calls are already rate limited
+        if delay > 0 and i > 0:
+            time.sleep(delay)
+        
+        print(f"\n[{i+1}/{limit or '?'}] 🎯 Training on: {pair['scenario'][:50]}...")
         
         # Format the data
         client_msg = format_client_sequence(pair['client_sequence'])
@@ -116,19 +156,124 @@ def train_on_conversations(limit: int = None, delay: float = 1.0):
         except Exception as e:
             print(f"   ❌ Error: {str(e)[:100]}")
             fail_count += 1
-        
-        # Rate limiting delay
-        if delay > 0 and i < len(pairs) - 1:
+    
+    print_summary(success_count, fail_count)
+
+
+def iter_batches(pairs, batch_size: int):
+    """Group an iterable of pairs into lists of up to batch_size."""
+    pairs = iter(pairs)
+    while True:
+        batch = list(islice(pairs, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def train_in_batches(editor, pairs, batch_size: int, concurrency: int, delay: float, limit: int = None) -> tuple:
+    """
+    Mini-batch training: predict a batch of pairs concurrently, then make one
+    editor call that sees every (predicted, actual) diff in the batch.
+    
+    Returns:
+        (successful prompt updates, failed/skipped batches)
+    """
+    success_count = 0
+    fail_count = 0
+    total_batches = -(-limit // batch_size) if limit else '?'
+    
+    for b, batch in enumerate(iter_batches(pairs, batch_size)):
+        # Optional extra pause; LLM calls are already rate limited
+        if delay > 0 and b > 0:
             time.sleep(delay)
+        
+        print(f"\n[Batch {b+1}/{total_batches}] 🎯 Predicting {len(batch)} pairs (concurrency {concurrency})...")
+        
+        items = [
+            (format_client_sequence(pair['client_sequence']), format_chat_history(pair['chat_history']))
+            for pair in batch
+        ]
+        predictions = run_sync(editor.agenerate_replies(items, concurrency=concurrency))
+        
+        examples = []
+        for pair, (client_msg, history), prediction in zip(batch, items, predictions):
+            if "error" in prediction:
+                print(f"   ❌ Prediction failed ({pair['scenario'][:30]}): {prediction['error'][:80]}")
+                continue
+            examples.append({
+                "client_message": client_msg,
+                "chat_history": history,
+                "consultant_reply": "\n".join(pair['consultant_reply']),
+                "predicted_reply": prediction["aiReply"]
+            })
+        
+        try:
+            result = editor.improve_from_batch(examples)
+            if result.get("success"):
+                changes = result.get('changes_made', 'No description')
+                print(f"   ✅ Prompt improved from {len(examples)} examples: {changes[:100]}")
+                success_count += 1
+            else:
+                print(f"   ⚠️ No changes made: {result.get('error', 'Unknown')[:50]}")
+                fail_count += 1
+        except Exception as e:
+            print(f"   ❌ Error: {str(e)[:100]}")
+            fail_count += 1
     
+    return success_count, fail_count
+
+
+def print_summary(success_count: int, fail_count: int):
     print("\n" + "=" * 60)
     print("\n🎉 TRAINING COMPLETE!")
     print(f"   ✅ Successful improvements: {success_count}")
     print(f"   ❌ Failed/skipped: {fail_count}")
     print(f"   📝 Final prompt saved to database")
+    peak = peak_memory_mb()
+    if peak is not None:
+        print(f"   💾 Peak memory: {peak} MB")
+    print_usage()
+
+
+def print_usage():
+    """Tokens and estimated cost of the run, split into predictions (reply) and prompt edits (editor)."""
+    usage = get_usage_tracker().stats()
+    totals = usage["totals"]
+    if not totals["calls"]:
+        return
+    print(f"   🪙 LLM usage: {totals['calls']} calls, {totals['inputTokens']:,} in / "
+          f"{totals['outputTokens']:,} out tokens, ${totals['costUsd']:.4f}")
+    for operation, op_totals in usage["byOperation"].items():
+        print(f"      {operation}: {op_totals['calls']} calls, {op_totals['inputTokens']:,} in / "
+              f"{op_totals['outputTokens']:,} out tokens, ${op_totals['costUsd']:.4f}")
+    if totals["estimatedCalls"]:
+        print(f"      ({totals['estimatedCalls']} calls without provider token counts were estimated)")
+    if usage["unpricedModels"]:
+        print(f"      ⚠️ No pricing for {', '.join(usage['unpricedModels'])} (set LLM_PRICING); cost excludes them")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the chatbot prompt on conversations.json")
+    parser.add_argument("--conversations", default=DEFAULT_CONVERSATIONS_PATH,
+                        help="Conversation export: JSON array or JSONL, optionally gzipped (default: conversations.json)")
+    parser.add_argument("--limit", type=int, help="Train on the first N pairs (skips the interactive menu)")
+    parser.add_argument("--all", action="store_true", help="Train on all pairs (skips the interactive menu)")
+    parser.add_argument("--batch-size", type=int, default=1, help="Pairs per prompt update (default: 1)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent predictions per batch (default: 4)")
+    parser.add_argument("--delay", type=float, default=0.0,
+                        help="Extra seconds to wait between updates; the rate limiter already paces calls (default: 0)")
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
+    options = {
+        "delay": args.delay,
+        "batch_size": args.batch_size,
+        "concurrency": args.concurrency,
+        "conversations_path": args.conversations
+    }
+    
     print("=" * 60)
     print("🤖 SELF-LEARNING AI ASSISTANT - INITIAL TRAINING")
     print("=" * 60 + "\n")
@@ -154,6 +299,10 @@ def main():
     # Initialize prompt
     initialize_prompt()
     
+    if args.all or args.limit:
+        train_on_conversations(limit=None if args.all else args.limit, **options)
+        return
+    
     # Ask user for training options
     print("Training options:")
     print("  1. Train on ALL conversation pairs (may take a while)")
@@ -164,11 +313,11 @@ def main():
     choice = input("\nEnter choice (1-4): ").strip()
     
     if choice == "1":
-        train_on_conversations(limit=None, delay=1.0)
+        train_on_conversations(limit=None, **options)
     elif choice == "2":
-        train_on_conversations(limit=5, delay=1.0)
+        train_on_conversations(limit=5, **options)
     elif choice == "3":
-        train_on_conversations(limit=10, delay=1.0)
+        train_on_conversations(limit=10, **options)
     else:
         print("Training cancelled.")
         sys.exit(0)